@@ -0,0 +1,53 @@
+#class to run the lateral hoof video mode (zone scan on the first frame, tracked crops afterwards) on a clip
+
+import json
+import sys
+import argparse
+
+sys.path.append('mmpose')
+from apis.logic import HPAPredictor
+from apis.video_tracking import analyze_video, VideoAggregate
+
+CONFIG = 'mmpose/custom_configs/rtmpose_hoof_4kp_copy.py'
+CHECKPOINT = 'mmpose/work_dirs/rtmpose_hoof_manual_30_april/epoch_130.pth'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-frame and clip-level HPA angles for a lateral hoof video.")
+    parser.add_argument('video')
+    parser.add_argument('--config', default=CONFIG)
+    parser.add_argument('--checkpoint', default=CHECKPOINT)
+    parser.add_argument('--frame-step', type=int, default=2, help="Analyse every Nth frame")
+    parser.add_argument('--max-dim', type=int, default=None, help="Downsize frames to this long side")
+    parser.add_argument('--rescan-score', type=float, default=0.5, help="Mean keypoint score that triggers a full rescan")
+    parser.add_argument('--smoothing', type=float, default=0.4, help="Weight of the newest frame in the angle EMA")
+    parser.add_argument('--out', default=None, help="Write per-frame results as JSON lines")
+    args = parser.parse_args()
+
+    print("🚀 Initializing HPAPredictor for video analysis...")
+    predictor = HPAPredictor(args.config, args.checkpoint, device='cpu')
+
+    aggregate = VideoAggregate()
+    out = open(args.out, 'w') if args.out else None
+    try:
+        for frame in analyze_video(predictor, args.video, frame_step=args.frame_step, max_dim=args.max_dim,
+                                   rescan_score=args.rescan_score, smoothing=args.smoothing):
+            aggregate.add(frame)
+            if out:
+                out.write(json.dumps(frame) + "\n")
+            print(f"  frame {frame['frame_index']:5d} [{frame['mode']:6s}] "
+                  f"dev={frame['hpa_dev_smoothed']} conf={frame['model_confidence']} ({frame['inference_ms']:.0f} ms)")
+    finally:
+        if out:
+            out.close()
+
+    summary = aggregate.summary()
+    print("\n" + "="*40)
+    print("🎞️ VIDEO SUMMARY")
+    print("="*40)
+    print(json.dumps(summary, indent=2))
+    sys.exit(0 if summary["success"] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Admission control for the analyze endpoints.
+
+Without it every request is accepted: sync scans pile up behind the inference executor
+until clients time out, and /api/v5/analyze-async enqueues without limit. The
+controller refuses work it cannot finish in time, with a Retry-After hint:
+
+- sync scans (v2 / v4 / v5 /analyze): 429 when the legs in flight across all sync
+  requests would exceed max_inflight_legs; 503 when the estimated inference backlog plus
+  this scan exceeds max_backlog_s. The backlog is the larger of the executor's pending
+  work (pending calls x per-stage moving average, see executors.backlog_seconds) and the
+  admitted sync legs x average leg time (scans admitted but still downloading)
+- async jobs: 429 when the queued jobs x recent job service time / consumers exceeds
+  max_async_backlog_s
+
+Priority lanes: async consumers run in the "async" lane (executors.current_lane), which
+may hold only part of the inference threads, so bulk jobs cannot starve interactive scans.
+"""
+
+import logging
+import math
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+from apis.executors import inference_executor
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(HTTPException):
+    """429 / 503 with a Retry-After header (seconds)."""
+
+    def __init__(self, status_code, detail, retry_after):
+        retry_after = max(1, math.ceil(retry_after))
+        super().__init__(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    max_inflight_legs:   legs of admitted sync scans running at once
+    max_backlog_s:       estimated inference backlog a new sync scan may join
+    max_async_backlog_s: estimated async queue drain time before new jobs are refused
+    """
+
+    def __init__(self, max_inflight_legs=64, max_backlog_s=30.0, max_async_backlog_s=1800.0):
+        self.max_inflight_legs = max_inflight_legs
+        self.max_backlog_s = max_backlog_s
+        self.max_async_backlog_s = max_async_backlog_s
+        self.inflight_legs = 0
+        self.admitted = 0
+        self.rejected = {"inflight": 0, "backlog": 0, "async_backlog": 0}
+
+    def _leg_seconds(self, legs):
+        pool = inference_executor()
+        return legs * (pool.service_time() or 0.0) / pool.max_workers
+
+    def backlog_seconds(self):
+        return max(inference_executor().backlog_seconds(), self._leg_seconds(self.inflight_legs))
+
+    @asynccontextmanager
+    async def sync_scan(self, legs):
+        """Admits a sync scan of `legs` legs for the duration of the block, or raises Overloaded."""
+        if self.inflight_legs and self.inflight_legs + legs > self.max_inflight_legs:
+            self.rejected["inflight"] += 1
+            retry = self.backlog_seconds() or 1
+            logger.warning(f"🚦 Sync scan refused: {self.inflight_legs} legs in flight (limit {self.max_inflight_legs})")
+            raise Overloaded(429, "Too many scans in progress, retry later", retry)
+        backlog = self.backlog_seconds()
+        if backlog and backlog + self._leg_seconds(legs) > self.max_backlog_s:
+            self.rejected["backlog"] += 1
+            logger.warning(f"🚦 Sync scan refused: inference backlog {backlog:.1f}s (budget {self.max_backlog_s}s)")
+            raise Overloaded(503, "Server busy, retry later", backlog - self.max_backlog_s + self._leg_seconds(legs))
+
+        self.inflight_legs += legs
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.inflight_legs -= legs
+
+    def check_async(self, queue):
+        """
+        Raises Overloaded when the async queue is over its backlog budget.
+        queue: the job store stats() plus "consumers" (queue_worker.queue_stats()).
+        """
+        if not queue or not queue.get("avg_service_s"):
+            return
+        backlog = (queue["queued"] + queue["running"]) * queue["avg_service_s"] / max(1, queue["consumers"])
+        if backlog > self.max_async_backlog_s:
+            self.rejected["async_backlog"] += 1
+            logger.warning(f"🚦 Async job refused: queue backlog {backlog:.0f}s (budget {self.max_async_backlog_s}s)")
+            raise Overloaded(429, "Job queue full, retry later", backlog - self.max_async_backlog_s)
+
+    def stats(self):
+        return {
+            "inflight_legs": self.inflight_legs,
+            "inference_backlog_s": round(self.backlog_seconds(), 2),
+            "max_inflight_legs": self.max_inflight_legs,
+            "max_backlog_s": self.max_backlog_s,
+            "max_async_backlog_s": self.max_async_backlog_s,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+# Process-wide controller (configured in main.py lifespan); None = admission control off
+_controller = None
+
+
+def configure_admission(**kwargs):
+    global _controller
+    _controller = AdmissionController(**kwargs)
+    return _controller
+
+
+def get_admission():
+    return _controller
+
+
+def scan_legs(request):
+    """Legs a scan request runs inference for (a slot and its *Processed twin count once)."""
+    return len({name.removesuffix("Processed") for name, value in request if value and name != "scanId"})
+
+
+@asynccontextmanager
+async def admit_sync_scan(legs):
+    """Admission for one sync scan (no-op while admission control is off)."""
+    if _controller is None:
+        yield
+        return
+    async with _controller.sync_scan(legs):
+        yield
@@ -0,0 +1,216 @@
+"""
+Application-wide thread pools for blocking work called from the async routes.
+
+Every scan used to build (and tear down) its own ThreadPoolExecutor, so N concurrent
+scans meant N pools and no bound on the total number of threads hammering the model
+replicas. Two long-lived pools replace them:
+
+- inference: CPU-bound leg inference (v2-v5). Sized to the predictor's replica / worker
+  process count by default, since more threads than replicas only queue on replica locks
+- io:        blocking uploads (S3) so they never hold an inference thread
+
+Both are created in the main.py lifespan; stats() (queued, active, wait time) is exposed
+under "executors" in /api/status.
+
+For admission control (apis/admission.py) every pool keeps a moving average of the run
+time per stage (the submitted function's name: predict, analyze_frontal, ...) and the
+calls pending per stage, which give backlog_seconds(). Calls made in the "async" lane
+(current_lane, set by the async job consumers) may hold at most async_share of the
+threads and never the last one, so interactive sync scans always find a free thread.
+A single-thread pool has no thread to spare: there async calls start only while no sync
+call is pending, so a sync scan waits for at most the one async call already running.
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+LANES = ("sync", "async")
+# Priority lane of the current request / job; asyncio tasks inherit it.
+current_lane = contextvars.ContextVar("hpa_lane", default="sync")
+
+
+class ManagedExecutor:
+    """
+    name:         pool name (thread name prefix, stats key)
+    max_workers:  global concurrency limit for this kind of work
+    async_share:  fraction of the threads async-lane calls may hold, at most all but one
+                  (1.0 = no reservation; 0 slots = async calls only run while no sync call is pending)
+    ema_alpha:    weight of the newest run in the per-stage service time average
+    """
+
+    def __init__(self, name, max_workers, async_share=1.0, ema_alpha=0.2):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"hpa-{name}")
+        self._lock = threading.Lock()
+        self.async_slots = None
+        self._async_sem = None
+        if async_share < 1.0:
+            self.async_slots = min(math.floor(self.max_workers * async_share), self.max_workers - 1)
+            self._async_sem = asyncio.Semaphore(max(1, self.async_slots))
+        self._sync_running = 0
+        self._sync_idle = asyncio.Event()
+        self._sync_idle.set()
+        self.ema_alpha = ema_alpha
+        self.submitted = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.peak_queued = 0
+        self._wait_s = 0.0
+        self._pending = defaultdict(int)  # stage -> submitted, not finished
+        self._service_s = {}              # stage -> moving average run time
+        self._lane_waiting = 0
+
+    def _call(self, submitted_at, stage, fn, args, kwargs):
+        with self._lock:
+            self.active += 1
+            self._wait_s += time.perf_counter() - submitted_at
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+                self._pending[stage] -= 1
+                prev = self._service_s.get(stage)
+                self._service_s[stage] = elapsed if prev is None else prev + self.ema_alpha * (elapsed - prev)
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on the pool and awaits its result (async lane: within its share)."""
+        if self._async_sem is not None and current_lane.get() == "async":
+            self._lane_waiting += 1
+            acquired = False
+            try:
+                await self._async_sem.acquire()
+                acquired = True
+                # No thread to reserve: wait for the sync lane to go idle.
+                while self.async_slots == 0 and self._sync_running:
+                    await self._sync_idle.wait()
+            except BaseException:
+                if acquired:
+                    self._async_sem.release()
+                raise
+            finally:
+                self._lane_waiting -= 1
+            try:
+                return await self._submit(fn, args, kwargs)
+            finally:
+                self._async_sem.release()
+        self._sync_running += 1
+        self._sync_idle.clear()
+        try:
+            return await self._submit(fn, args, kwargs)
+        finally:
+            self._sync_running -= 1
+            if not self._sync_running:
+                self._sync_idle.set()
+
+    async def _submit(self, fn, args, kwargs):
+        stage = getattr(fn, "__name__", "task")
+        with self._lock:
+            self.submitted += 1
+            self._pending[stage] += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+        call = functools.partial(self._call, time.perf_counter(), stage, fn, args, kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self._pool, call)
+
+    def service_time(self, stage=None):
+        """Moving average run time of a stage (or the mean over stages), None before the first run."""
+        with self._lock:
+            if stage is not None:
+                return self._service_s.get(stage)
+            return sum(self._service_s.values()) / len(self._service_s) if self._service_s else None
+
+    def backlog_seconds(self):
+        """Estimated seconds until the pool drains what it has been given (pending calls x stage average / threads)."""
+        with self._lock:
+            known = list(self._service_s.values())
+            default = sum(known) / len(known) if known else 0.0
+            work = sum(n * self._service_s.get(stage, default) for stage, n in self._pending.items())
+        return work / self.max_workers
+
+    @property
+    def queued(self):
+        """Submitted calls not yet picked up by a thread."""
+        return self.submitted - self.completed - self.active
+
+    def stats(self):
+        with self._lock:
+            started = self.completed + self.active
+            return {
+                "max_workers": self.max_workers,
+                "active": self.active,
+                "queued": self.queued,
+                "peak_queued": self.peak_queued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(self._wait_s / started * 1000, 1) if started else None,
+                "async_slots": self.async_slots,
+                "async_waiting": self._lane_waiting,
+                "service_ms": {stage: round(s * 1000, 1) for stage, s in self._service_s.items()},
+            }
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
+
+
+# Process-wide pools (configured in main.py lifespan)
+_inference = None
+_io = None
+
+
+def configure_executors(inference_workers, io_workers=8, async_share=1.0):
+    global _inference, _io
+    shutdown_executors(wait=False)
+    _inference = ManagedExecutor("inference", inference_workers, async_share=async_share)
+    _io = ManagedExecutor("io", io_workers)
+    logger.info(f"🧵 Executors: inference={_inference.max_workers} threads, io={_io.max_workers} threads")
+
+
+def _pools():
+    # Created with defaults on first use outside the app lifespan (scripts).
+    if _inference is None:
+        configure_executors(inference_workers=1)
+    return _inference, _io
+
+
+def inference_executor():
+    return _pools()[0]
+
+
+async def run_inference(fn, *args, **kwargs):
+    return await _pools()[0].run(fn, *args, **kwargs)
+
+
+async def run_io(fn, *args, **kwargs):
+    return await _pools()[1].run(fn, *args, **kwargs)
+
+
+def executor_stats():
+    if _inference is None:
+        return None
+    return {"inference": _inference.stats(), "io": _io.stats()}
+
+
+def shutdown_executors(wait=True):
+    global _inference, _io
+    for pool in (_inference, _io):
+        if pool is not None:
+            pool.shutdown(wait=wait)
+    _inference = _io = None
@@ -0,0 +1,331 @@
+"""
+Hoof keypoint model backends used by HPAPredictor (logic.py).
+
+Every backend exposes the same call:
+
+    infer(img_bgr, bboxes_xyxy[N, 4]) -> (keypoints[N, K, 2], scores[N, K])
+    infer_many([(img_bgr, bboxes_xyxy), ...]) -> [(keypoints, scores), ...]   (one forward pass)
+
+- MMPoseBackend:  full mmpose/mmengine/torch stack (init_model + inference_topdown),
+                  or with fast_path the numpy pipeline below feeding the torch network.
+- ORTBackend:     ONNX Runtime session on a model exported by export_hoof_onnx.py
+                  (or its INT8 variant promoted by quantize_hoof_onnx.py).
+                  Pre/post-processing is the numpy/OpenCV pipeline, which mirrors the mmpose
+                  test pipeline (GetBBoxCenterScale -> TopdownAffine -> PackPoseInputs,
+                  PoseDataPreprocessor normalisation, RTMCCHead flip test, SimCC decode).
+
+The numpy helpers are ported from mmpose/projects/rtmpose/examples/onnxruntime/main.py.
+"""
+
+import json
+import os
+import logging
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# ─────────────────────────────────────────────
+# RTMPose numpy pre/post-processing
+# ─────────────────────────────────────────────
+
+def bbox_xyxy2cs(bbox: np.ndarray, padding: float = 1.) -> Tuple[np.ndarray, np.ndarray]:
+    """(N, 4) xyxy boxes -> (N, 2) centers and (N, 2) scales (w, h) * padding."""
+    x1, y1, x2, y2 = np.hsplit(bbox, [1, 2, 3])
+    center = np.hstack([x1 + x2, y1 + y2]) * 0.5
+    scale = np.hstack([x2 - x1, y2 - y1]) * padding
+    return center, scale
+
+
+def fix_aspect_ratio(bbox_scale: np.ndarray, aspect_ratio: float) -> np.ndarray:
+    """Extends (N, 2) scales to the model's w/h aspect ratio."""
+    w, h = np.hsplit(bbox_scale, [1])
+    return np.where(w > h * aspect_ratio,
+                    np.hstack([w, w / aspect_ratio]),
+                    np.hstack([h * aspect_ratio, h]))
+
+
+def get_simcc_maximum(simcc_x: np.ndarray, simcc_y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(N, K, Wx), (N, K, Wy) SimCC -> (N, K, 2) argmax locations and (N, K) min(max_x, max_y) scores."""
+    N, K, _ = simcc_x.shape
+    simcc_x = simcc_x.reshape(N * K, -1)
+    simcc_y = simcc_y.reshape(N * K, -1)
+
+    x_locs = np.argmax(simcc_x, axis=1)
+    y_locs = np.argmax(simcc_y, axis=1)
+    locs = np.stack((x_locs, y_locs), axis=-1).astype(np.float32)
+    vals = np.minimum(np.amax(simcc_x, axis=1), np.amax(simcc_y, axis=1))
+    locs[vals <= 0.] = -1
+
+    return locs.reshape(N, K, 2), vals.reshape(N, K)
+
+
+def get_warp_matrices(centers: np.ndarray, scales: np.ndarray, output_size: Tuple[int, int]) -> np.ndarray:
+    """
+    (N, 2) centers / aspect-fixed scales -> (N, 2, 3) affine matrices for all crops at once.
+    Closed form of the rtmpose get_warp_matrix without rotation: a uniform scale plus a translation.
+    """
+    dst_w, dst_h = output_size
+    s = dst_w / scales[:, 0]
+    mats = np.zeros((len(centers), 2, 3), dtype=np.float64)
+    mats[:, 0, 0] = s
+    mats[:, 1, 1] = s
+    mats[:, 0, 2] = dst_w * 0.5 - s * centers[:, 0]
+    mats[:, 1, 2] = dst_h * 0.5 - s * centers[:, 1]
+    return mats
+
+
+def pipeline_meta(cfg, flip_indices) -> dict:
+    """Pre/post-processing parameters of the config's test pipeline (what inference_topdown applies)."""
+    pipeline = {t['type']: t for t in cfg.test_dataloader.dataset.pipeline}
+    w, h = pipeline['TopdownAffine']['input_size']
+    return {
+        "input_size": [int(w), int(h)],
+        "bbox_padding": float(pipeline['GetBBoxCenterScale'].get('padding', 1.25)),
+        "mean": list(cfg.model.data_preprocessor.mean),
+        "std": list(cfg.model.data_preprocessor.std),
+        "bgr_to_rgb": bool(cfg.model.data_preprocessor.get('bgr_to_rgb', False)),
+        "simcc_split_ratio": float(cfg.model.head.simcc_split_ratio),
+        "flip_indices": list(flip_indices),
+    }
+
+
+class TopdownPreprocessor:
+    """
+    numpy replacement for GetBBoxCenterScale -> TopdownAffine -> PackPoseInputs -> PoseDataPreprocessor.
+    All warp matrices are computed in one shot and every crop is warped straight into a
+    preallocated buffer, then normalised into one float32 NCHW batch.
+    """
+
+    def __init__(self, meta):
+        self.input_size = tuple(meta["input_size"])  # (w, h)
+        self.padding = meta["bbox_padding"]
+        self.mean = np.array(meta["mean"], dtype=np.float32).reshape(1, 3, 1, 1)
+        self.std = np.array(meta["std"], dtype=np.float32).reshape(1, 3, 1, 1)
+        self.bgr_to_rgb = meta["bgr_to_rgb"]
+
+    def __call__(self, img, bboxes):
+        """Returns (batch[N, 3, h, w], centers[N, 2], scales[N, 2])."""
+        w, h = self.input_size
+        centers, scales = bbox_xyxy2cs(np.asarray(bboxes, dtype=np.float32).reshape(-1, 4), padding=self.padding)
+        scales = fix_aspect_ratio(scales, aspect_ratio=w / h)
+        mats = get_warp_matrices(centers, scales, (w, h))
+
+        crops = np.empty((len(centers), h, w, 3), dtype=np.uint8)
+        for i in range(len(centers)):
+            cv2.warpAffine(img, mats[i], (int(w), int(h)), dst=crops[i], flags=cv2.INTER_LINEAR)
+        if self.bgr_to_rgb:
+            crops = crops[..., ::-1]
+
+        batch = np.empty((len(centers), 3, h, w), dtype=np.float32)
+        np.subtract(crops.transpose(0, 3, 1, 2), self.mean, out=batch)
+        batch /= self.std
+        return batch, centers, scales
+
+
+def decode_simcc(simcc_x, simcc_y, centers, scales, input_size, simcc_split_ratio, flip_indices=None):
+    """
+    Batched RTMCCHead decode. With flip_indices, the second half of the batch holds the
+    horizontally flipped crops and is merged like RTMCCHead's flip test (flip the x-vectors
+    back, swap symmetric keypoints, average logits). Returns image-space (kpts, scores).
+    """
+    if flip_indices is not None:
+        n = len(simcc_x) // 2
+        simcc_x = (simcc_x[:n] + simcc_x[n:, flip_indices, ::-1]) * 0.5
+        simcc_y = (simcc_y[:n] + simcc_y[n:, flip_indices]) * 0.5
+
+    kpts, scores = get_simcc_maximum(simcc_x, simcc_y)
+    kpts /= simcc_split_ratio
+
+    # Model input space -> image space
+    kpts = kpts / np.array(input_size, dtype=np.float32) * scales[:, None] + centers[:, None] - 0.5 * scales[:, None]
+    return kpts, scores
+
+
+# ─────────────────────────────────────────────
+# Backends
+# ─────────────────────────────────────────────
+
+class MMPoseBackend:
+    """
+    PyTorch backend: the stock mmpose inference_topdown pipeline.
+    fast_path=True swaps the per-crop data pipeline for TopdownPreprocessor + a direct
+    backbone/head forward + decode_simcc (verify with check_hoof_fast_path.py).
+    """
+
+    name = "mmpose"
+
+    def __init__(self, config_path, checkpoint_path, device='cpu', flip_test=True, fast_path=False):
+        from mmpose.apis import init_model
+        from mmpose.utils import register_all_modules
+        from mmengine.config import Config
+        from mmcv.transforms import Compose
+
+        register_all_modules()
+        cfg = Config.fromfile(config_path)
+        cfg.model.test_cfg.flip_test = flip_test
+        self.model = init_model(cfg, checkpoint_path, device=device)
+        self.pipeline = Compose(self.model.cfg.test_dataloader.dataset.pipeline)
+
+        self.fast_path = fast_path
+        self.flip_test = flip_test
+        self.device = device
+        self.meta = pipeline_meta(self.model.cfg, self.model.dataset_meta['flip_indices'])
+        self.preprocessor = TopdownPreprocessor(self.meta)
+
+    def _fast_forward(self, batch, centers, scales):
+        import torch
+
+        if self.flip_test:
+            batch = np.concatenate([batch, batch[:, :, :, ::-1]])
+        with torch.no_grad():
+            inputs = torch.from_numpy(np.ascontiguousarray(batch)).to(self.device)
+            simcc_x, simcc_y = self.model.head(self.model.extract_feat(inputs))
+        return decode_simcc(
+            simcc_x.cpu().numpy(), simcc_y.cpu().numpy(), centers, scales,
+            self.meta["input_size"], self.meta["simcc_split_ratio"],
+            self.meta["flip_indices"] if self.flip_test else None,
+        )
+
+    def infer(self, img, bboxes):
+        from mmpose.apis import inference_topdown
+
+        if self.fast_path:
+            return self._fast_forward(*self.preprocessor(img, bboxes))
+
+        results = inference_topdown(self.model, img, bboxes=bboxes)
+        kpts = np.stack([res.pred_instances.keypoints[0] for res in results])
+        scores = np.stack([res.pred_instances.keypoint_scores[0] for res in results])
+        return kpts, scores
+
+    def infer_many(self, items):
+        """
+        [(img, bboxes), ...] from different images -> [(kpts, scores), ...] in one test_step.
+        Same data path as inference_topdown, just collated across images.
+        """
+        import torch
+        from mmengine.dataset import pseudo_collate
+
+        if self.fast_path:
+            parts = [self.preprocessor(img, bboxes) for img, bboxes in items]
+            kpts, scores = self._fast_forward(*(np.concatenate(p) for p in zip(*parts)))
+            bounds = np.cumsum([len(p[0]) for p in parts])[:-1]
+            return list(zip(np.split(kpts, bounds), np.split(scores, bounds)))
+
+        data_list = []
+        for img, bboxes in items:
+            for bbox in np.asarray(bboxes, dtype=np.float32):
+                data_info = dict(img=img, bbox=bbox[None], bbox_score=np.ones(1, dtype=np.float32))
+                data_info.update(self.model.dataset_meta)
+                data_list.append(self.pipeline(data_info))
+
+        with torch.no_grad():
+            results = self.model.test_step(pseudo_collate(data_list))
+
+        out, start = [], 0
+        for _, bboxes in items:
+            chunk = results[start:start + len(bboxes)]
+            start += len(bboxes)
+            out.append((
+                np.stack([res.pred_instances.keypoints[0] for res in chunk]),
+                np.stack([res.pred_instances.keypoint_scores[0] for res in chunk]),
+            ))
+        return out
+
+
+class ORTBackend:
+    """
+    ONNX Runtime backend for the hoof RTMPose model.
+    Expects `<model>.onnx` plus the `<model>.json` sidecar written by export_hoof_onnx.py.
+    Flip test runs as one doubled batch instead of a second session call.
+    """
+
+    name = "onnxruntime"
+
+    def __init__(self, onnx_path, intra_op_threads=None, flip_test=True, require_promoted=False):
+        import onnxruntime as ort
+
+        meta_path = os.path.splitext(onnx_path)[0] + ".json"
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if require_promoted and not meta.get("quantization", {}).get("promoted"):
+            raise RuntimeError(f"{onnx_path} has not passed the INT8 accuracy gate (run quantize_hoof_onnx.py)")
+        self.meta = meta
+        self.input_size = tuple(meta["input_size"])  # (w, h)
+        self.simcc_split_ratio = meta["simcc_split_ratio"]
+        self.flip_indices = meta["flip_indices"]
+        self.flip_test = flip_test
+        self.preprocessor = TopdownPreprocessor(meta)
+
+        sess_opts = ort.SessionOptions()
+        sess_opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        sess_opts.intra_op_num_threads = intra_op_threads or os.cpu_count() or 1
+        sess_opts.inter_op_num_threads = 1
+        # Don't busy-spin idle threads between requests; keeps CPU free for rembg / frontal work.
+        sess_opts.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        self.session = ort.InferenceSession(onnx_path, sess_options=sess_opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [o.name for o in self.session.get_outputs()]
+        logger.info(f"✅ ORT hoof backend loaded: {onnx_path} (threads={sess_opts.intra_op_num_threads})")
+
+    def preprocess(self, img, bboxes):
+        """Warps every bbox into one normalised float32 NCHW batch. Returns (batch, centers, scales)."""
+        return self.preprocessor(img, bboxes)
+
+    def _forward(self, batch, centers, scales):
+        if self.flip_test:
+            batch = np.concatenate([batch, batch[:, :, :, ::-1]])
+
+        simcc_x, simcc_y = self.session.run(self.output_names, {self.input_name: np.ascontiguousarray(batch)})
+        return decode_simcc(
+            simcc_x, simcc_y, centers, scales, self.input_size, self.simcc_split_ratio,
+            self.flip_indices if self.flip_test else None,
+        )
+
+    def infer(self, img, bboxes):
+        return self._forward(*self.preprocess(img, bboxes))
+
+    def infer_many(self, items):
+        """[(img, bboxes), ...] from different images -> [(kpts, scores), ...] in one session call."""
+        parts = [self.preprocess(img, bboxes) for img, bboxes in items]
+        kpts, scores = self._forward(*(np.concatenate(p) for p in zip(*parts)))
+        bounds = np.cumsum([len(p[0]) for p in parts])[:-1]
+        return list(zip(np.split(kpts, bounds), np.split(scores, bounds)))
+
+
+def set_torch_threads(threads):
+    """
+    torch's intra-op thread count. It is process-wide, so it is set once per process
+    (main.py lifespan, each worker process), not per replica; every thread running a
+    forward pass gets an OpenMP team of this size, so N replicas in parallel use N x threads cores.
+    """
+    try:
+        import torch
+    except ImportError:
+        return  # ORT-only deployment
+    torch.set_num_threads(max(1, int(threads)))
+
+
+def build_backend(kind, config_path=None, checkpoint_path=None, onnx_path=None, device='cpu', intra_op_threads=None,
+                  fast_path=False):
+    """
+    Creates the hoof model backend named by `kind` ("mmpose" | "onnxruntime" | "onnxruntime_int8").
+    fast_path only applies to mmpose; the ORT backends always use the numpy pipeline.
+    intra_op_threads sizes each ORT session; torch threads are process-wide (set_torch_threads).
+    """
+    if kind == "mmpose":
+        return MMPoseBackend(config_path, checkpoint_path, device=device, fast_path=fast_path)
+    if kind in ("onnxruntime", "onnxruntime_int8"):
+        if not onnx_path:
+            raise ValueError(f"onnx_path is required for the {kind} backend")
+        if kind == "onnxruntime_int8":
+            # Serve the promoted INT8 sibling of the FP32 export; refuse it if it never passed the gate.
+            if not onnx_path.endswith("_int8.onnx"):
+                onnx_path = os.path.splitext(onnx_path)[0] + "_int8.onnx"
+            return ORTBackend(onnx_path, intra_op_threads=intra_op_threads, require_promoted=True)
+        return ORTBackend(onnx_path, intra_op_threads=intra_op_threads)
+    raise ValueError(f"Unknown hoof model backend: {kind}")
@@ -0,0 +1,241 @@
+"""
+Application-lifetime HTTP client for image downloads.
+
+Every scan fetches up to 16 images from the same S3 / CDN host. One shared
+httpx.AsyncClient (created in the main.py lifespan) keeps those connections alive
+between images and between requests, so a scan pays for at most a handful of TLS
+handshakes instead of one per image.
+
+- Connection pool with keep-alive; HTTP/2 when the h2 package is installed
+- Per-host concurrency limit (a semaphore per host), so one scan cannot monopolise
+  the pool or hammer a single origin; at most max_hosts idle hosts keep their slot
+- Configurable connect / read timeouts
+- Retries: connection failures are retried by the transport; timeouts and 5xx
+  responses are retried with exponential backoff
+
+fetch_image() streams the body instead of buffering it first:
+- Content-Length above max_image_bytes, or a non-image Content-Type, is rejected
+  before any body is read; the byte cap is enforced again while streaming
+- once sniff_bytes have arrived the magic bytes must be a known image format, and
+  the header's dimensions (read_image_size) must be within max_image_side /
+  max_image_pixels; an over-limit image is dropped without downloading the rest
+- chunks land in a single bytearray (preallocated from Content-Length), with no
+  chunk list or join copy; the bytearray is what callers get back. Buffers are not
+  pooled: the caller keeps the bytearray (inference, job store uploads, cache keys)
+  beyond the download, so a reused buffer would be overwritten while still in use
+"""
+
+import asyncio
+import importlib.util
+import logging
+from urllib.parse import urlsplit
+
+import httpx
+
+from apis.image_utils import read_image_size, sniff_image_format
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Content types that say nothing about the payload; the magic bytes decide.
+GENERIC_CONTENT_TYPES = {"application/octet-stream", "binary/octet-stream", "application/binary"}
+# JPEG frame headers can sit behind large EXIF blocks; stop looking for the size after this.
+MAX_HEADER_SCAN = 256 * 1024
+
+
+class ImageRejected(ValueError):
+    """A download that is not an image or exceeds the configured limits."""
+
+
+class _HostSlot(asyncio.Semaphore):
+    """Per-host semaphore; users counts downloads in progress (waiting or holding), so idle hosts can be dropped."""
+
+    def __init__(self, value):
+        super().__init__(value)
+        self.users = 0
+
+
+class SharedHTTPClient:
+    """
+    timeout:          read/write/pool timeout in seconds
+    connect_timeout:  TCP + TLS connect timeout in seconds
+    max_connections:  total pooled connections
+    per_host:         concurrent requests per host
+    max_hosts:        hosts whose slot is kept; idle ones beyond this are dropped, least recent first
+    retries:          extra attempts after a timeout or retryable status
+    max_image_bytes:  fetch_image() size cap
+    max_image_side / max_image_pixels: fetch_image() dimension limits from the image header
+    sniff_bytes:      bytes received before the format / dimension check runs
+    """
+
+    def __init__(self, timeout=10.0, connect_timeout=5.0, max_connections=64, max_keepalive=32,
+                 keepalive_expiry=30.0, per_host=8, retries=2, backoff=0.25, http2=True,
+                 max_image_bytes=25 * 1024 * 1024, max_image_side=16384, max_image_pixels=100_000_000,
+                 sniff_bytes=16 * 1024, max_hosts=256):
+        self.http2 = bool(http2) and importlib.util.find_spec("h2") is not None
+        if http2 and not self.http2:
+            logger.info("ℹ️ h2 not installed — shared HTTP client falls back to HTTP/1.1")
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                              keepalive_expiry=keepalive_expiry)
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            transport=httpx.AsyncHTTPTransport(http2=self.http2, limits=limits, retries=retries),
+            follow_redirects=True,
+        )
+        self.per_host = max(1, int(per_host))
+        self.max_hosts = max(1, int(max_hosts))
+        self.retries = max(0, int(retries))
+        self.backoff = backoff
+        self.max_image_bytes = max_image_bytes
+        self.max_image_side = max_image_side
+        self.max_image_pixels = max_image_pixels
+        self.sniff_bytes = sniff_bytes
+        self._host_slots = {}
+        self.requests = 0
+        self.retried = 0
+        self.rejected = 0
+        logger.info(f"🌐 Shared HTTP client: http2={self.http2}, {max_connections} connections, "
+                    f"{self.per_host}/host, timeout={timeout}s, retries={self.retries}")
+
+    def _slot(self, url):
+        host = urlsplit(url).netloc
+        slot = self._host_slots.pop(host, None)
+        if slot is None:
+            slot = _HostSlot(self.per_host)
+            excess = len(self._host_slots) + 1 - self.max_hosts
+            if excess > 0:
+                # dict order is recency order (every use re-inserts the host at the end)
+                for idle in [h for h, s in self._host_slots.items() if not s.users][:excess]:
+                    del self._host_slots[idle]
+        self._host_slots[host] = slot
+        return slot
+
+    async def _get(self, url, read):
+        """
+        Streams a GET through the retry loop; read(response) consumes the body.
+        The host slot is held per attempt, so a backoff sleep does not block the host.
+        """
+        slot = self._slot(url)
+        slot.users += 1
+        try:
+            for attempt in range(self.retries + 1):
+                self.requests += 1
+                async with slot:
+                    try:
+                        async with self.client.stream("GET", url) as resp:
+                            if resp.status_code not in RETRY_STATUS or attempt >= self.retries:
+                                resp.raise_for_status()
+                                return await read(resp)
+                            reason = f"HTTP {resp.status_code}"
+                    except httpx.TimeoutException as e:
+                        if attempt >= self.retries:
+                            raise
+                        reason = type(e).__name__
+                self.retried += 1
+                logger.warning(f"⚠️ Fetch attempt {attempt + 1} failed for {url}: {reason} — retrying")
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+        finally:
+            slot.users -= 1
+
+    async def fetch_bytes(self, url):
+        """GETs url and returns the body. Raises httpx errors after the last retry."""
+        return await self._get(url, lambda resp: resp.aread())
+
+    async def fetch_image(self, url):
+        """
+        Streams an image download with early rejection (see module docstring).
+        Returns the body as a bytearray; raises ImageRejected or httpx errors.
+        """
+        try:
+            return await self._get(url, self._read_image)
+        except ImageRejected as e:
+            self.rejected += 1
+            logger.warning(f"🚫 Rejected download {url}: {e}")
+            raise
+
+    async def _read_image(self, resp):
+        length = resp.headers.get("content-length")
+        length = int(length) if length and length.isdigit() else None
+        if length is not None and length > self.max_image_bytes:
+            raise ImageRejected(f"Image too large: {length} bytes (limit {self.max_image_bytes})")
+        ctype = resp.headers.get("content-type", "").split(";")[0].strip().lower()
+        if ctype and not ctype.startswith("image/") and ctype not in GENERIC_CONTENT_TYPES:
+            raise ImageRejected(f"Not an image (Content-Type {ctype})")
+
+        buf = bytearray(length) if length else bytearray()
+        n = 0
+        fmt, checked = None, False
+        async for chunk in resp.aiter_bytes():
+            end = n + len(chunk)
+            if end > self.max_image_bytes:
+                raise ImageRejected(f"Image too large: more than {self.max_image_bytes} bytes")
+            buf[n:end] = chunk  # in place while within the preallocation, grows otherwise
+            n = end
+            if not checked and n >= self.sniff_bytes:
+                fmt, checked = self._check_header(buf, n, fmt, final=False)
+        del buf[n:]
+        if not checked:
+            self._check_header(buf, n, fmt, final=True)
+        return buf
+
+    def check_image(self, data):
+        """fetch_image()'s size / format / dimension limits for bytes that did not come over HTTP (uploads)."""
+        if len(data) > self.max_image_bytes:
+            raise ImageRejected(f"Image too large: {len(data)} bytes (limit {self.max_image_bytes})")
+        self._check_header(data, len(data), None, final=True)
+        return data
+
+    def _check_header(self, buf, n, fmt, final):
+        """Raises ImageRejected on a bad header. Returns (format, done); not done while a JPEG frame header may still arrive."""
+        if fmt is None:
+            fmt = sniff_image_format(bytes(buf[:16]))
+            if fmt is None:
+                raise ImageRejected("Not an image (unknown file signature)")
+        size = read_image_size(bytes(buf[:min(n, MAX_HEADER_SCAN)]))
+        if size is None:
+            # BMP/TIFF sizes are not parsed; a JPEG frame header may sit behind a large EXIF block
+            return fmt, final or n >= MAX_HEADER_SCAN or fmt not in ("jpeg", "png", "webp")
+        w, h = size
+        if w <= 0 or h <= 0 or max(w, h) > self.max_image_side or w * h > self.max_image_pixels:
+            raise ImageRejected(f"Unsupported image dimensions {w}x{h}")
+        return fmt, True
+
+    def stats(self):
+        return {"http2": self.http2, "per_host": self.per_host, "requests": self.requests,
+                "retried": self.retried, "rejected": self.rejected}
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+# Process-wide client shared by every API version (configured in main.py lifespan)
+_http_client = None
+
+
+def configure_http_client(**kwargs):
+    global _http_client
+    _http_client = SharedHTTPClient(**kwargs)
+    return _http_client
+
+
+def get_http_client():
+    """The shared client; created with defaults on first use outside the app lifespan (scripts)."""
+    global _http_client
+    if _http_client is None:
+        _http_client = SharedHTTPClient()
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def fetch_bytes(url):
+    return await get_http_client().fetch_bytes(url)
+
+
+async def fetch_image(url):
+    return await get_http_client().fetch_image(url)
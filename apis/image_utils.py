@@ -67,3 +67,179 @@ def remove_background(image: np.ndarray) -> np.ndarray:
     except Exception as e:
         logging.error(f"Error during background removal: {e}")
         return image
+
+# --- Cutout ROI proposal (pre-cutout lateral images) ---
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+def decode_alpha(img_bytes: bytes, shape: tuple):
+    """
+    Returns the alpha channel of a PNG/WebP cutout, or None if there is none.
+    `shape` is the (h, w) of the colour-decoded image. A reduced decode (decode_reduced) gets the
+    alpha resized to match; an aspect mismatch (e.g. EXIF rotation) returns None.
+    """
+    if not (img_bytes[:8] == _PNG_SIGNATURE or (img_bytes[:4] == b"RIFF" and img_bytes[8:12] == b"WEBP")):
+        return None
+    raw = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_UNCHANGED)
+    if raw is None or raw.ndim != 3 or raw.shape[2] != 4:
+        return None
+    h, w = shape[:2]
+    if raw.shape[:2] == (h, w):
+        return raw[:, :, 3]
+    if abs(raw.shape[0] / h - raw.shape[1] / w) > 0.02 * raw.shape[0] / h:
+        return None
+    return cv2.resize(raw[:, :, 3], (w, h), interpolation=cv2.INTER_NEAREST)
+
+def foreground_mask(image: np.ndarray, alpha: np.ndarray = None, black_thresh: int = 10) -> np.ndarray:
+    """
+    Binary foreground mask of a cutout image: alpha > 0 when available,
+    otherwise any non-black pixel (rembg and mobile cutouts use a black background).
+    """
+    if alpha is not None:
+        mask = (alpha > 0).astype(np.uint8)
+    else:
+        mask = (image.max(axis=2) > black_thresh).astype(np.uint8)
+    # Drop edge specks left by the cutout before looking for leg blobs
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    return cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+def fit_aspect_ratio(x1, y1, x2, y2, img_w, img_h, target_ratio=0.50):
+    """Grows a box around its centre to W/H == target_ratio (same rule as fix_bbox_from_keypoints.py), then clamps."""
+    w, h = x2 - x1, y2 - y1
+    if w / h < target_ratio:
+        dw = (h * target_ratio) - w
+        x1 -= dw / 2
+        x2 += dw / 2
+    else:
+        dh = (w / target_ratio) - h
+        y1 -= dh / 2
+        y2 += dh / 2
+    return np.array([max(0, x1), max(0, y1), min(img_w, x2), min(img_h, y2)], dtype=np.float32)
+
+def propose_leg_bboxes(mask: np.ndarray, model_ratio: float = 0.50,
+                       min_area_frac: float = 0.01, max_area_frac: float = 0.95,
+                       lower_frac: float = 0.60) -> list:
+    """
+    Derives one or two tight leg bboxes from a cutout foreground mask.
+
+    - Two similar-sized blobs (both legs in frame): one box per blob.
+    - One blob: its full extent plus its lower `lower_frac` (where pastern + hoof sit).
+
+    Returns [(label, bbox_xyxy), ...], or [] when the mask does not look like a cutout
+    (nothing segmented, or the whole frame is foreground).
+    """
+    img_h, img_w = mask.shape[:2]
+    fg = int(mask.sum())
+    if fg < min_area_frac * img_w * img_h or fg > max_area_frac * img_w * img_h:
+        return []
+
+    n, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    blobs = sorted(stats[1:n], key=lambda s: s[cv2.CC_STAT_AREA], reverse=True)
+    blobs = [b for b in blobs if b[cv2.CC_STAT_AREA] >= min_area_frac * img_w * img_h]
+    if not blobs:
+        return []
+
+    def box(b):
+        x, y, w, h = (int(b[k]) for k in (cv2.CC_STAT_LEFT, cv2.CC_STAT_TOP, cv2.CC_STAT_WIDTH, cv2.CC_STAT_HEIGHT))
+        return x, y, x + w, y + h
+
+    if len(blobs) > 1 and blobs[1][cv2.CC_STAT_AREA] >= 0.3 * blobs[0][cv2.CC_STAT_AREA]:
+        return [
+            (f"ROI-Proposal (leg={i})", fit_aspect_ratio(*box(b), img_w, img_h, model_ratio))
+            for i, b in enumerate(blobs[:2])
+        ]
+
+    x1, y1, x2, y2 = box(blobs[0])
+    lower_y1 = y2 - (y2 - y1) * lower_frac
+    return [
+        ("ROI-Proposal (full)", fit_aspect_ratio(x1, y1, x2, y2, img_w, img_h, model_ratio)),
+        ("ROI-Proposal (lower)", fit_aspect_ratio(x1, lower_y1, x2, y2, img_w, img_h, model_ratio)),
+    ]
+
+# --- Reduced-resolution decode (oversized phone photos) ---
+
+_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+def read_image_size(img_bytes: bytes):
+    """
+    (w, h) from the JPEG / PNG / WebP header without decoding pixels, or None if unknown.
+    Sizes are as stored, i.e. before any EXIF rotation.
+    """
+    if img_bytes[:8] == _PNG_SIGNATURE and len(img_bytes) >= 24:
+        return int.from_bytes(img_bytes[16:20], "big"), int.from_bytes(img_bytes[20:24], "big")
+
+    if img_bytes[:4] == b"RIFF" and img_bytes[8:12] == b"WEBP" and len(img_bytes) >= 30:
+        chunk = img_bytes[12:16]
+        if chunk == b"VP8X":
+            return 1 + int.from_bytes(img_bytes[24:27], "little"), 1 + int.from_bytes(img_bytes[27:30], "little")
+        if chunk == b"VP8 ":
+            return int.from_bytes(img_bytes[26:28], "little") & 0x3FFF, int.from_bytes(img_bytes[28:30], "little") & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(img_bytes[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        return None
+
+    if img_bytes[:2] == b"\xff\xd8":
+        i, n = 2, len(img_bytes)
+        while i + 9 < n:
+            if img_bytes[i] != 0xFF:
+                i += 1
+                continue
+            marker = img_bytes[i + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+                i += 1 if marker == 0xFF else 2
+                continue
+            seg_len = int.from_bytes(img_bytes[i + 2:i + 4], "big")
+            # SOF0..SOF15 carry the frame size (C4 = DHT, C8 = JPG, CC = DAC are not frames)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                h = int.from_bytes(img_bytes[i + 5:i + 7], "big")
+                w = int.from_bytes(img_bytes[i + 7:i + 9], "big")
+                return w, h
+            i += 2 + seg_len
+    return None
+
+def sniff_image_format(header: bytes):
+    """Image format from the leading magic bytes ("jpeg", "png", "webp", "bmp", "tiff"), or None."""
+    if header[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if header[:8] == _PNG_SIGNATURE:
+        return "png"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    if header[:2] == b"BM":
+        return "bmp"
+    if header[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return None
+
+def decode_reduced(img_bytes: bytes, max_dim: int = None):
+    """
+    Decodes at the smallest 1/2, 1/4 or 1/8 scale whose long side is still >= max_dim
+    (JPEGs use libjpeg's scaled DCT decode, so a 12 MP photo never materialises).
+    Returns (img, full_size) where full_size is the (w, h) of a full decode in the same
+    orientation as img, or (None, None) if decoding fails. max_dim=None decodes at full size.
+    """
+    size = read_image_size(img_bytes) if max_dim else None
+    factor = 1
+    if size:
+        for f in (8, 4, 2):
+            if max(size) / f >= max_dim:
+                factor = f
+                break
+
+    flags = _REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR)
+    img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), flags)
+    if img is None:
+        return None, None
+    if factor == 1:
+        return img, (img.shape[1], img.shape[0])
+
+    # EXIF rotation may have swapped the axes relative to the header
+    w, h = size
+    if (img.shape[1] >= img.shape[0]) != (w >= h):
+        w, h = h, w
+    return img, (w, h)
@@ -8,6 +8,9 @@ import threading
 import gc
 import psutil
 import logging
+import time
+import json
+from dataclasses import dataclass, fields
 
 # Setup Logger
 logger = logging.getLogger(__name__)
@@ -17,15 +20,10 @@ def get_current_memory_usage():
     process = psutil.Process(os.getpid())
     return process.memory_info().rss / 1024 / 1024
 
-# Global lock to prevent multiple workers from performing heavy inference simultaneously.
-# This solves the "Out of Memory" (OOM) and "CPU Choking" issues on resource-constrained servers.
-INFERENCE_LOCK = threading.Lock()
 
 sys.path.append('mmpose')
-from mmpose.apis import init_model, inference_topdown
-from mmpose.utils import register_all_modules
-from mmengine.config import Config
-from .image_utils import remove_background
+from .hoof_backends import build_backend
+from .image_utils import remove_background, decode_alpha, decode_reduced, foreground_mask, propose_leg_bboxes, fit_aspect_ratio
 
 # --- ANGLE MATH ---
 def angle_from_vertical(v):
@@ -59,180 +57,534 @@ def draw_angle_line(img, p_start, p_end, color, scale=1.5, thickness=3):
     p_draw_end = p_start + v * line_len
     cv2.line(img, tuple(p_start.astype(int)), tuple(p_draw_end.astype(int)), color, thickness, cv2.LINE_AA)
 
+def hpa_angles(keypoints):
+    """(pastern_angle, hoof_angle, hpa_dev) in degrees for 4 keypoints, direction-normalised to face right."""
+    pts_math = {i: np.array(keypoints[i], copy=True) for i in range(4)}
+    # pts_math = apply_anatomical_offset(pts_math, img_w)
+
+    if pts_math[3][0] < pts_math[0][0]:
+        cx = (pts_math[0][0] + pts_math[3][0]) / 2
+        for i in pts_math:
+            pts_math[i][0] = 2*cx - pts_math[i][0]
+
+    v_p = (pts_math[0][0] - pts_math[1][0], pts_math[0][1] - pts_math[1][1])
+    v_h = (pts_math[2][0] - pts_math[3][0], pts_math[2][1] - pts_math[3][1])
+
+    p_angle = clinical_angle(angle_from_vertical(v_p))
+    h_angle = clinical_angle(angle_from_vertical(v_h))
+    return p_angle, h_angle, abs(p_angle - h_angle)
+
+def is_anatomically_valid(kpts, scale=None):
+    """
+    Sanity-checks a 4-point (pastern_top, pastern_bottom, hoof_wall_top, toe_tip) prediction.
+    The pixel thresholds refer to full-resolution pixels: scale (sx, sy) maps keypoints from a
+    reduced decode up to full resolution, so the verdict does not depend on decode_max_dim.
+    """
+    if scale is not None:
+        kpts = np.asarray(kpts, dtype=np.float32) * np.asarray(scale, dtype=np.float32)
+    p0, p1, p2, p3 = kpts
+    if p0[1] > p2[1] - 10: return False, "Fetlock below Coronary Band"
+    if p2[1] > p3[1] - 10: return False, "Coronary Band below Toe"
+
+    def dist(a, b): return np.linalg.norm(a - b)
+    pastern_len = dist(p0, p1)
+    hoof_wall_len = dist(p2, p3)
+
+    if pastern_len < 10 or hoof_wall_len < 10: return False, "Keypoints too Clustered"
+    ratio = pastern_len / hoof_wall_len
+    if ratio > 5.0: return False, "Pastern disproportionately long"
+    if ratio < 0.2: return False, "Hoof disproportionately long"
+
+    return True, "OK"
+
+# Per-keypoint confidence every point must exceed for a prediction to be reported.
+MIN_KEYPOINT_SCORE = 0.40
+
+def candidate_score(scores, is_sane):
+    """Aggregate score used to rank zone candidates (mean confidence x10, -8 if anatomically impossible)."""
+    agg = np.mean(scores) * 10
+    if not is_sane:
+        agg -= 8  # Heavy penalty for anatomically impossible poses
+    return agg
+
+# Scan zones as fractions of the image height. Order matters: on equal scores the
+# earlier crop wins, so keep Floor -> Anatomy -> Top -> Global.
+SCAN_ZONES = [
+    {'name': 'Floor-Scan',   'y1': 0.4, 'y2': 1.0, 'x_offsets': [0, -0.15, 0.15]},
+    {'name': 'Anatomy-Scan', 'y1': 0.2, 'y2': 0.8, 'x_offsets': [0, -0.15, 0.15]},
+    {'name': 'Top-Anatomy',  'y1': 0.0, 'y2': 0.6, 'x_offsets': [0]},
+    {'name': 'Global-Scan',  'y1': 0.0, 'y2': 1.0, 'x_offsets': [0]},
+]
+
+def build_zone_bboxes(img_w, img_h, model_ratio, zones=SCAN_ZONES):
+    """
+    Builds every zone/x-offset crop up front.
+    Returns a list of (label, bbox_xyxy) in scan order.
+    """
+    crops = []
+    for z in zones:
+        y1, y2 = int(img_h * z['y1']), int(img_h * z['y2'])
+        for x_off in z.get('x_offsets', [0]):
+            z_h = y2 - y1
+            z_w = z_h * model_ratio
+
+            # Center + Offset
+            base_x1 = (img_w - z_w) / 2
+            x1 = max(0, base_x1 + (x_off * img_w))
+            x2 = min(img_w, x1 + z_w)
+            bbox = np.array([x1, y1, x2, y2], dtype=np.float32)
+            crops.append((f"{z['name']} (off={x_off})", bbox))
+    return crops
+
+def decode_request(img_bytes, orig_img_bytes=None, remove_bg=True, decode_max_dim=None,
+                   render_max_dim=None, want_alpha=False, render=True):
+    """
+    Decodes one lateral request. The analysed image is decoded at decode_max_dim (reduced JPEG
+    decode for oversized phone photos), the rendering canvas at render_max_dim (None = full size).
+    Without render no separate canvas is decoded (orig_img_bytes is ignored).
+    Returns (img, img_full_size, orig_img, orig_full_size, alpha); img is None if decoding failed.
+    """
+    img, img_full = decode_reduced(img_bytes, decode_max_dim)
+    if img is None:
+        return None, None, None, None, None
+
+    # Pre-cutout PNG/WebP uploads carry the mobile segmentation in their alpha channel.
+    # rembg output (remove_bg=True) uses a black background, which foreground_mask handles.
+    alpha = decode_alpha(img_bytes, img.shape) if (want_alpha and not remove_bg) else None
+
+    orig_img, orig_full = None, None
+    if not render:
+        return img, img_full, orig_img, orig_full, alpha
+    if orig_img_bytes:
+        orig_img, orig_full = decode_reduced(orig_img_bytes, render_max_dim)
+        if orig_img is None:
+            logger.warning("⚠️ Original image decode failed — falling back to processed image canvas.")
+    elif decode_max_dim and render_max_dim != decode_max_dim and not remove_bg:
+        # Analysis runs on the reduced decode; the overlay is drawn on a render-resolution decode.
+        orig_img, orig_full = decode_reduced(img_bytes, render_max_dim)
+    return img, img_full, orig_img, orig_full, alpha
+
+# --- RESULT + RENDERING ---
+OVERLAY_FORMATS = ("jpg", "png", "webp")
+
+@dataclass(slots=True)
+class LegResult:
+    """
+    Compact lateral result returned by HPAPredictor.predict().
+    keypoints / scores are in full-resolution image pixels; image holds the encoded overlay
+    (image_format) only when the caller asked predict() to render.
+    """
+    success: bool
+    error: str | None = None
+    keypoints: np.ndarray | None = None   # (4, 2) float32
+    scores: np.ndarray | None = None      # (4,) float32
+    image_size: tuple | None = None       # (w, h) the keypoints refer to
+    best_zone: str | None = None
+    reason: str | None = None             # is_anatomically_valid() verdict or the low-confidence reason
+    strategy: str | None = None
+    inference_pass: str | None = None
+    inference_ms: float | None = None
+    pastern_angle: float | None = None
+    hoof_angle: float | None = None
+    hpa_dev: float | None = None
+    model_confidence: float | None = None
+    image: bytes | None = None
+    image_format: str | None = None
+
+    @classmethod
+    def failed(cls, error):
+        return cls(success=False, error=error)
+
+    def to_metrics(self, include_image=False):
+        """The API metrics dict (AnalysisMetrics shape). image_base64 only with include_image (legacy v1 responses)."""
+        if self.keypoints is None:
+            return {"success": False, "error": self.error}
+        metrics = {
+            "success": self.success,
+            "best_zone": self.best_zone,
+            "strategy": self.strategy,
+            "inference_pass": self.inference_pass,
+            "inference_ms": self.inference_ms,
+            "pastern_angle": self.pastern_angle,
+            "hoof_angle": self.hoof_angle,
+            "hpa_dev": self.hpa_dev,
+            "image_base64": base64.b64encode(self.image).decode('utf-8') if include_image and self.image else None,
+        }
+        if self.success:
+            metrics["model_confidence"] = self.model_confidence
+        else:
+            metrics["error"] = self.error
+        return metrics
+
+    def to_dict(self):
+        """JSON-serialisable form (result cache); the overlay is stored base64-encoded."""
+        d = {f.name: getattr(self, f.name) for f in fields(self)}
+        for key in ("keypoints", "scores"):
+            if d[key] is not None:
+                d[key] = d[key].tolist()
+        if d["image"] is not None:
+            d["image"] = base64.b64encode(d["image"]).decode('ascii')
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        d = dict(d)
+        for key in ("keypoints", "scores"):
+            if d.get(key) is not None:
+                d[key] = np.asarray(d[key], dtype=np.float32)
+        if d.get("image_size") is not None:
+            d["image_size"] = tuple(d["image_size"])
+        if d.get("image") is not None:
+            d["image"] = base64.b64decode(d["image"])
+        return cls(**d)
+
+def render_overlay(canvas, result):
+    """Draws the keypoints, angle lines and verdict of a LegResult onto canvas (in place)."""
+    kpts = result.keypoints * np.array([canvas.shape[1] / result.image_size[0],
+                                        canvas.shape[0] / result.image_size[1]], dtype=np.float32)
+    colors = [(0,0,255),(0,165,255),(0,255,0),(255,0,0)]
+    for i,(x,y) in enumerate(kpts):
+        cv2.circle(canvas,(int(x),int(y)),6,colors[i],-1)
+
+    if result.success:
+        p0, p1, p2, p3 = kpts[0], kpts[1], kpts[2], kpts[3]
+        draw_angle_line(canvas, p1, p0, (0, 165, 255), scale=1.0)
+        draw_angle_line(canvas, p3, p2, (255, 128, 0), scale=1.0)
+
+        color = (0, 255, 0) if result.hpa_dev < 3 else (0, 0, 255)
+        cv2.putText(canvas, f"HPA Dev: {result.hpa_dev:.1f}", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2)
+    else:
+        # Specific technical reason on the image for debugging (the API error stays generic)
+        cv2.putText(canvas, f"REJECTED: {result.reason}", (20,50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,0,255), 2)
+    return canvas
+
+def encode_image(img, image_format="jpg", quality=95):
+    """Encodes img to bytes. quality applies to jpg/webp (1-100); png is lossless."""
+    if image_format not in OVERLAY_FORMATS:
+        raise ValueError(f"Unsupported overlay format: {image_format}")
+    params = []
+    if image_format == "jpg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    elif image_format == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    ok, buffer = cv2.imencode(f".{image_format}", img, params)
+    if not ok:
+        raise RuntimeError(f"Could not encode overlay as {image_format}")
+    return buffer.tobytes()
+
 class HPAPredictor:
-    def __init__(self, config_path, checkpoint_path, device='cpu'):
-        register_all_modules()
-        cfg = Config.fromfile(config_path)
-        
+    def __init__(self, config_path, checkpoint_path, device='cpu', zone_batch_size=None,
+                 roi_proposal=False, proposal_min_score=6.0, strategy="zone_scan",
+                 zone_schedule_path=None, early_exit_score=None,
+                 backend="mmpose", onnx_path=None, intra_op_threads=None,
+                 decode_max_dim=None, render_max_dim=None, fast_path=False,
+                 render_format="jpg", render_quality=95):
+        # backend: Which runtime executes the hoof model (see hoof_backends.py).
+        # - "mmpose": full mmpose/torch stack (default)
+        # - "onnxruntime": ONNX export from export_hoof_onnx.py; no torch needed for lateral inference
+        # - "onnxruntime_int8": static INT8 model, only if quantize_hoof_onnx.py promoted it
+        #
         # flip_test: Runs inference twice (normal + flipped) and averages results
         # - Accuracy gain: Critical for unstable edge-case images (matches local demo script)
         # - Speed cost: Adds ~50-100ms latency per image
         # - Current setting: True (prioritizing accuracy for production)
-        cfg.model.test_cfg.flip_test = True
-        
-        self.model = init_model(cfg, checkpoint_path, device=device)
+        # fast_path: mmpose backend only — numpy crop preprocessing + direct SimCC decode instead of
+        # inference_topdown (check with check_hoof_fast_path.py before enabling)
+        #
+        # An already-built backend object (e.g. the shared MicroBatchScheduler) is used as is.
+        if isinstance(backend, str):
+            backend = build_backend(
+                backend, config_path=config_path, checkpoint_path=checkpoint_path,
+                onnx_path=onnx_path, device=device, intra_op_threads=intra_op_threads,
+                fast_path=fast_path,
+            )
+        self.backend = backend
         self.MODEL_RATIO = 0.50
-        
-    def predict(self, img_bytes, remove_bg=True, orig_img_bytes=None):
+
+        # Per-replica lock: one inference at a time on *this* model instance. Concurrency across
+        # requests comes from PredictorPool (replica_pool.py), which hands each request its own replica.
+        self._lock = threading.Lock()
+
+        # zone_batch_size: How many zone crops go through the model per forward pass.
+        # - None: all 9 crops in a single batch (fastest, shortest lock hold)
+        # - 1: legacy behaviour, one inference_topdown call per crop
+        # - N: bounded batches of N crops (caps peak memory on small boxes)
+        self.zone_batch_size = zone_batch_size
+
+        # roi_proposal: For cutout images, derive 1-2 leg bboxes from the alpha / non-black
+        # foreground and only fall back to the full zone sweep when the best proposal scores
+        # below proposal_min_score (candidate_score units: mean confidence x10) or fails anatomy.
+        self.roi_proposal = roi_proposal
+        self.proposal_min_score = proposal_min_score
+
+        # strategy: How keypoints are located.
+        # - "zone_scan": brute-force zone sweep (optionally preceded by the ROI proposal)
+        # - "coarse_to_fine": 512px full-image pass, then a tight crop around the detected points
+        #   (same engine as generate_pre_annotations_hq.py), zone sweep if both passes fail
+        if strategy not in ("zone_scan", "coarse_to_fine"):
+            raise ValueError(f"Unknown inference strategy: {strategy}")
+        self.strategy = strategy
+        self.COARSE_MAX_DIM = 512
+
+        # decode_max_dim: Long side the analysed image is decoded at (1/2, 1/4, 1/8 reduced decode,
+        # never below this). None = full decode. Zone crops are resized to 192x256 anyway, so ~1024
+        # keeps every crop above model resolution while skipping most of a 12 MP decode.
+        # render_max_dim: Same for the overlay canvas (None = full resolution).
+        self.decode_max_dim = decode_max_dim
+        self.render_max_dim = render_max_dim
+
+        # render_format / render_quality: Default encoding of the overlay when predict(render=True)
+        # ("jpg" | "png" | "webp"; quality 1-100 for jpg/webp). 95 matches cv2's JPEG default.
+        if render_format not in OVERLAY_FORMATS:
+            raise ValueError(f"Unsupported overlay format: {render_format}")
+        self.render_format = render_format
+        self.render_quality = render_quality
+
+        # zone_schedule_path: Ordered zone list learned by calibrate_zone_schedule.py. When set,
+        # zones run in that order and the scan stops at the first anatomically valid candidate
+        # whose mean keypoint score reaches early_exit_score (defaults to the calibrated value).
+        self.zone_schedule = None
+        self.early_exit_score = early_exit_score
+        if zone_schedule_path:
+            with open(zone_schedule_path, "r") as f:
+                schedule = json.load(f)
+            self.zone_schedule = [z["label"] for z in schedule["zones"]]
+            if self.early_exit_score is None:
+                self.early_exit_score = schedule.get("early_exit_score")
+            logger.info(f"🗺️ Zone schedule loaded ({len(self.zone_schedule)} zones, early exit at {self.early_exit_score})")
+
+    def _infer_crops(self, img, bboxes):
+        """Runs the hoof model on (N, 4) xyxy bboxes in bounded batches. Returns (kpts[N,4,2], scores[N,4])."""
+        batch = self.zone_batch_size or len(bboxes)
+        kpts, scores = [], []
+        for start in range(0, len(bboxes), batch):
+            k, s = self.backend.infer(img, bboxes[start:start + batch])
+            kpts.append(k)
+            scores.append(s)
+        return np.concatenate(kpts), np.concatenate(scores)
+
+    def _zone_scan(self, img, crops, full_scale=None):
+        """
+        Runs all zone crops through the model and returns the best candidate as
+        (agg_score, keypoints, scores, zone_label, reason). Ties go to the earlier crop.
+        full_scale: analysed image -> full resolution factors for the anatomy check.
+        """
+        bboxes = np.stack([bbox for _, bbox in crops])
+        all_kpts, all_scores = self._infer_crops(img, bboxes)
+
+        best = None
+        for (label, _), kpts, scores in zip(crops, all_kpts, all_scores):
+            is_sane, reason = is_anatomically_valid(kpts, full_scale)
+            agg = candidate_score(scores, is_sane)
+            if best is None or agg > best[0]:
+                best = (agg, kpts, scores, label, reason)
+        return best
+
+    def _scheduled_scan(self, img, crops, full_scale=None):
+        """
+        Runs crops in the calibrated schedule order, zone_batch_size (default 1) at a time, and
+        stops early once a candidate is anatomically valid with mean score >= early_exit_score.
+        Without an early exit the result equals _zone_scan (ties still go to the default-order crop).
+        """
+        default_idx = {label: i for i, (label, _) in enumerate(crops)}
+        rank = {label: i for i, label in enumerate(self.zone_schedule)}
+        ordered = sorted(crops, key=lambda c: rank.get(c[0], len(rank) + default_idx[c[0]]))
+        step = self.zone_batch_size or 1
+        exit_score = self.early_exit_score if self.early_exit_score is not None else float("inf")
+
+        best = None
+        best_idx = None
+        for start in range(0, len(ordered), step):
+            chunk = ordered[start:start + step]
+            all_kpts, all_scores = self._infer_crops(img, np.stack([bbox for _, bbox in chunk]))
+            for (label, _), kpts, scores in zip(chunk, all_kpts, all_scores):
+                is_sane, reason = is_anatomically_valid(kpts, full_scale)
+                agg = candidate_score(scores, is_sane)
+                idx = default_idx[label]
+                if best is None or agg > best[0] or (agg == best[0] and idx < best_idx):
+                    best, best_idx = (agg, kpts, scores, label, reason), idx
+            if best[4] == "OK" and np.mean(best[2]) >= exit_score:
+                logger.info(f"⚡ Early exit after {start + len(chunk)}/{len(ordered)} zone crops ({best[3]})")
+                break
+        return best
+
+    def _coarse_to_fine(self, img, full_scale=None):
+        """
+        Two-pass engine. Returns (candidate, pass_name) where pass_name is "fine" or "coarse",
+        or (None, None) when neither pass is confident and anatomically valid.
+        """
+        img_h, img_w = img.shape[:2]
+
+        # --- PASS 1: Low-Res Detection on the whole frame ---
+        scale = min(1.0, self.COARSE_MAX_DIM / max(img_h, img_w))
+        img_low = cv2.resize(img, (int(img_w * scale), int(img_h * scale)), interpolation=cv2.INTER_AREA) if scale < 1.0 else img
+        lh, lw = img_low.shape[:2]
+        kpts_low, scores_low = self.backend.infer(img_low, np.array([[0, 0, lw, lh]], dtype=np.float32))
+        kpts_coarse = kpts_low[0] / scale
+        scores_coarse = scores_low[0]
+
+        sane, reason = is_anatomically_valid(kpts_coarse, full_scale)
+        coarse = (candidate_score(scores_coarse, sane), kpts_coarse, scores_coarse, "Coarse-Pass", reason)
+        coarse_ok = sane and all(s > MIN_KEYPOINT_SCORE for s in scores_coarse)
+        if not coarse_ok:
+            logger.info(f"🔎 Coarse pass rejected ({reason}, min score={np.min(scores_coarse):.2f})")
+            return None, None
+
+        # --- PASS 2: High-Res Refinement around the detected points (+25% context each side) ---
+        x_min, y_min = np.min(kpts_coarse, axis=0)
+        x_max, y_max = np.max(kpts_coarse, axis=0)
+        cw, ch = (x_max - x_min), (y_max - y_min)
+        bbox = fit_aspect_ratio(x_min - cw * 0.25, y_min - ch * 0.25, x_max + cw * 0.25, y_max + ch * 0.25,
+                                img_w, img_h, self.MODEL_RATIO)
+        kpts_high, scores_high = self.backend.infer(img, bbox[None, :])
+        kpts_fine = kpts_high[0]
+        scores_fine = scores_high[0]
+
+        sane, reason = is_anatomically_valid(kpts_fine, full_scale)
+        if sane and all(s > MIN_KEYPOINT_SCORE for s in scores_fine):
+            return (candidate_score(scores_fine, sane), kpts_fine, scores_fine, "Fine-Pass", reason), "fine"
+
+        logger.info(f"🔎 Fine pass rejected ({reason}) — keeping coarse result")
+        return coarse, "coarse"
+
+    def _locate(self, img, alpha=None, full_scale=None):
+        """
+        Finds the best keypoint candidate with the configured strategy.
+        Returns (candidate, pass_name) with pass_name in
+        "roi_proposal" | "zone_scan" | "zone_schedule" | "coarse" | "fine".
+        full_scale: (sx, sy) from img to full-resolution pixels when img is a reduced decode.
+        """
+        img_h, img_w = img.shape[:2]
+
+        if self.strategy == "coarse_to_fine":
+            best, pass_name = self._coarse_to_fine(img, full_scale)
+            if best is not None:
+                return best, pass_name
+            logger.info("↩️ Coarse-to-fine failed — falling back to full zone scan")
+
+        proposal = None
+        if self.roi_proposal:
+            crops = propose_leg_bboxes(foreground_mask(img, alpha), self.MODEL_RATIO)
+            if crops:
+                proposal = self._zone_scan(img, crops, full_scale)
+                if proposal[0] >= self.proposal_min_score and proposal[4] == "OK":
+                    logger.info(f"🎯 ROI proposal accepted: {proposal[3]} (score={proposal[0]:.2f}, {len(crops)} crop(s))")
+                    return proposal, "roi_proposal"
+                logger.info(f"↩️ ROI proposal rejected (score={proposal[0]:.2f}, {proposal[4]}) — falling back to full zone scan")
+
+        crops = build_zone_bboxes(img_w, img_h, self.MODEL_RATIO)
+        if self.zone_schedule:
+            best, pass_name = self._scheduled_scan(img, crops, full_scale), "zone_schedule"
+        else:
+            best, pass_name = self._zone_scan(img, crops, full_scale), "zone_scan"
+        if proposal is not None and proposal[0] > best[0]:
+            return proposal, "roi_proposal"
+        return best, pass_name
+
+    def predict(self, img_bytes, remove_bg=True, orig_img_bytes=None, render=False, image_format=None, image_quality=None):
+        """
+        Lateral analysis of one encoded image. Returns a LegResult (keypoints, zone, angles).
+        render=True also draws the overlay (on orig_img_bytes when given) and encodes it to
+        result.image in image_format / image_quality (predictor defaults when None).
+        Callers that only need angles leave render off and skip the canvas decode, drawing and encode.
+        """
         # Prevent empty or None buffers
         if not img_bytes:
-            return {"success": False, "error": "Empty image buffer provided. Please try uploading the image again."}
+            return LegResult.failed("Empty image buffer provided. Please try uploading the image again.")
             
-        # Convert bytes to cv2 image
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Convert bytes to cv2 image (reduced decode when decode_max_dim is set)
+        img, img_full, orig_img, orig_full, alpha = decode_request(
+            img_bytes, orig_img_bytes, remove_bg=remove_bg, decode_max_dim=self.decode_max_dim,
+            render_max_dim=self.render_max_dim, want_alpha=self.roi_proposal, render=render,
+        )
         if img is None:
-            return {"success": False, "error": "Could not decode image. Please ensure the file is a valid image."}
+            return LegResult.failed("Could not decode image. Please ensure the file is a valid image.")
             
-        img_h, img_w = img.shape[:2]
-        
         mem_before = get_current_memory_usage()
         logger.info(f"📊 MEMORY [Before Inference]: {mem_before:.2f} MB")
+
+        result = self.analyze(img, remove_bg=remove_bg, orig_img=orig_img, alpha=alpha,
+                              img_full_size=img_full, orig_full_size=orig_full, render=render,
+                              image_format=image_format, image_quality=image_quality)
         
-        def is_anatomically_valid(kpts):
-            p0, p1, p2, p3 = kpts
-            if p0[1] > p2[1] - 10: return False, "Fetlock below Coronary Band"
-            if p2[1] > p3[1] - 10: return False, "Coronary Band below Toe"
-            
-            def dist(a, b): return np.linalg.norm(a - b)
-            pastern_len = dist(p0, p1)
-            hoof_wall_len = dist(p2, p3)
-            
-            if pastern_len < 10 or hoof_wall_len < 10: return False, "Keypoints too Clustered"
-            ratio = pastern_len / hoof_wall_len
-            if ratio > 5.0: return False, "Pastern disproportionately long"
-            if ratio < 0.2: return False, "Hoof disproportionately long"
-            
-            return True, "OK"
-
-        zones = [
-            {'name': 'Floor-Scan',   'y1': int(img_h * 0.4), 'y2': img_h,              'x_offsets': [0, -0.15, 0.15]},
-            {'name': 'Anatomy-Scan', 'y1': int(img_h * 0.2), 'y2': int(img_h * 0.8),  'x_offsets': [0, -0.15, 0.15]},
-            {'name': 'Top-Anatomy',  'y1': 0,               'y2': int(img_h * 0.6),  'x_offsets': [0]},
-            {'name': 'Global-Scan',  'y1': 0,               'y2': img_h,              'x_offsets': [0]},
-        ]
+        # --- MEMORY MANAGEMENT ---
+        # Explicitly delete large numpy arrays and call garbage collector
+        del img
+        del orig_img
+        gc.collect()
         
-        best_res = None
-        best_score = -1
-        best_zone = None
-        best_reason = "OK"
+        mem_after = get_current_memory_usage()
+        logger.info(f"📊 MEMORY [After Inference & GC]: {mem_after:.2f} MB (Reclaimed: {mem_before - mem_after:.2f} MB)")
         
-        # Use Global Lock: one inference at a time (rembg + MMPose when remove_bg=True).
-        with INFERENCE_LOCK:
+        return result
+
+    def analyze(self, img, remove_bg=True, orig_img=None, alpha=None, img_full_size=None, orig_full_size=None,
+                render=False, image_format=None, image_quality=None):
+        """
+        Decoded-image core of predict(). Returns a LegResult; with render, result.image holds the
+        encoded overlay. orig_img, when given and the same size as img, is drawn on in place.
+        Used directly by the inference worker processes (worker_pool.py), which receive
+        images as shared-memory arrays rather than encoded bytes.
+        """
+        img_h, img_w = img.shape[:2]
+        img_full_size = tuple(img_full_size or (img_w, img_h))
+        # Analysis coordinates -> full resolution (anatomy thresholds, angles, canvas scale)
+        full_scale = np.array([img_full_size[0] / img_w, img_full_size[1] / img_h], dtype=np.float32)
+
+        # Replica lock: one inference at a time per model instance (rembg + MMPose when remove_bg=True).
+        # All zone crops are batched, so the lock is held for 1 (or a few) forward passes instead of 9.
+        with self._lock:
             if remove_bg:
                 img = remove_background(img)
 
-            for z in zones:
-                for x_off in z.get('x_offsets', [0]):
-                    z_h = z['y2'] - z['y1']
-                    z_w = z_h * self.MODEL_RATIO
-                    
-                    # Center + Offset
-                    base_x1 = (img_w - z_w) / 2
-                    x1 = max(0, base_x1 + (x_off * img_w))
-                    x2 = min(img_w, x1 + z_w)
-                    bbox = np.array([x1, z['y1'], x2, z['y2']], dtype=np.float32)
-                    
-                    res = inference_topdown(self.model, img, bboxes=bbox[None, :])[0]
-                    kpts = res.pred_instances.keypoints[0]
-                    scores = res.pred_instances.keypoint_scores[0]
-                    
-                    is_sane, reason = is_anatomically_valid(kpts)
-                    
-                    agg = np.mean(scores) * 10
-                    if not is_sane:
-                        agg -= 8  # Heavy penalty for anatomically impossible poses
-                        
-                    if agg > best_score or best_res is None:
-                        best_score = agg
-                        best_res = res
-                        best_zone = f"{z['name']} (off={x_off})"
-                        best_reason = reason
-        
-        keypoints = best_res.pred_instances.keypoints[0]
-        scores = best_res.pred_instances.keypoint_scores[0]
-
-        # If an original image is provided, draw on it (stencil mode).
-        # Inference was done on the processed/background-removed image,
-        # but the annotated output will use the original as the canvas.
-        if orig_img_bytes:
-            orig_nparr = np.frombuffer(orig_img_bytes, np.uint8)
-            orig_img = cv2.imdecode(orig_nparr, cv2.IMREAD_COLOR)
-            if orig_img is not None and orig_img.shape[:2] == img.shape[:2]:
-                vis = orig_img
-            else:
-                logger.warning("⚠️ Original image size mismatch or decode failed — falling back to processed image canvas.")
-                vis = img.copy()
-        else:
-            vis = img.copy()
+            t0 = time.perf_counter()
+            (_, keypoints, scores, best_zone, best_reason), inference_pass = self._locate(img, alpha, full_scale)
+            inference_ms = (time.perf_counter() - t0) * 1000
+        logger.info(f"⏱️ Keypoints located in {inference_ms:.0f} ms (strategy={self.strategy}, pass={inference_pass}, zone={best_zone})")
 
-        colors = [(0,0,255),(0,165,255),(0,255,0),(255,0,0)]
-        for i,(x,y) in enumerate(keypoints):
-            cv2.circle(vis,(int(x),int(y)),6,colors[i],-1)
-            
-        metrics = {
-            "success": False,
-            "best_zone": best_zone,
-            "pastern_angle": None,
-            "hoof_angle": None,
-            "hpa_dev": None,
-            "image_base64": None
-        }
+        keypoints_full = keypoints * full_scale
+
+        result = LegResult(
+            success=False,
+            keypoints=keypoints_full,
+            scores=np.asarray(scores, dtype=np.float32),
+            image_size=img_full_size,
+            best_zone=best_zone,
+            reason=best_reason,
+            strategy=self.strategy,
+            inference_pass=inference_pass,
+            inference_ms=round(inference_ms, 1),
+        )
         
         valid_anatomy = (best_reason == "OK")
-        reason = best_reason
         
-        if all(s > 0.40 for s in scores) and valid_anatomy:
-            pts_math = {i: np.array(keypoints[i], copy=True) for i in range(4)}
-            # pts_math = apply_anatomical_offset(pts_math, img_w)
-            
-            if pts_math[3][0] < pts_math[0][0]:
-                cx = (pts_math[0][0] + pts_math[3][0]) / 2
-                for i in pts_math:
-                    pts_math[i][0] = 2*cx - pts_math[i][0]
-            
-            v_p = (pts_math[0][0] - pts_math[1][0], pts_math[0][1] - pts_math[1][1])
-            v_h = (pts_math[2][0] - pts_math[3][0], pts_math[2][1] - pts_math[3][1])
+        if all(s > MIN_KEYPOINT_SCORE for s in scores) and valid_anatomy:
+            p_angle, h_angle, diff = hpa_angles(keypoints_full)
             
-            p_angle = clinical_angle(angle_from_vertical(v_p))
-            h_angle = clinical_angle(angle_from_vertical(v_h))
-            diff = abs(p_angle - h_angle)
-            
-            p0, p1, p2, p3 = keypoints[0], keypoints[1], keypoints[2], keypoints[3]
-            draw_angle_line(vis, p1, p0, (0, 165, 255), scale=1.0)
-            draw_angle_line(vis, p3, p2, (255, 128, 0), scale=1.0)
-            
-            color = (0, 255, 0) if diff < 3 else (0, 0, 255)
-            cv2.putText(vis, f"HPA Dev: {diff:.1f}", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2)
-            
-            metrics.update({
-                "success": True,
-                "pastern_angle": round(p_angle, 2),
-                "hoof_angle": round(h_angle, 2),
-                "hpa_dev": round(diff, 2),
-                "model_confidence": round(float(np.mean(scores)), 2)
-            })
+            result.success = True
+            result.pastern_angle = round(p_angle, 2)
+            result.hoof_angle = round(h_angle, 2)
+            result.hpa_dev = round(diff, 2)
+            result.model_confidence = round(float(np.mean(scores)), 2)
         else:
-            fail_reason = reason if not valid_anatomy else "Low Confidence (<0.4)"
-            
-            # Draw specific technical reason on the image for debugging
-            cv2.putText(vis, f"REJECTED: {fail_reason}", (20,50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,0,255), 2)
-            
-            # Return generic user-friendly message for the API response
-            metrics["error"] = "Poor image quality or incorrect angle.Please retake the image."
+            if valid_anatomy:
+                result.reason = "Low Confidence (<0.4)"
+            # Generic user-friendly message for the API response; the technical reason stays in result.reason
+            result.error = "Poor image quality or incorrect angle.Please retake the image."
+
+        if render:
+            # If an original image is provided, draw on it (stencil mode).
+            # Inference was done on the processed/background-removed image,
+            # but the annotated output will use the original as the canvas.
+            if orig_img is not None and tuple(orig_full_size or orig_img.shape[1::-1]) == img_full_size:
+                vis = orig_img
+            else:
+                if orig_img is not None:
+                    logger.warning("⚠️ Original image size mismatch — falling back to processed image canvas.")
+                vis = img.copy()
+            render_overlay(vis, result)
+            result.image_format = image_format or self.render_format
+            result.image = encode_image(vis, result.image_format, image_quality or self.render_quality)
+            del vis
             
-        _, buffer = cv2.imencode('.jpg', vis)
-        metrics["image_base64"] = base64.b64encode(buffer).decode('utf-8')
-        
-        # --- MEMORY MANAGEMENT ---
-        # Explicitly delete large numpy arrays and call garbage collector
-        del img
-        del vis
-        del nparr
-        del buffer
-        gc.collect()
-        
-        mem_after = get_current_memory_usage()
-        logger.info(f"📊 MEMORY [After Inference & GC]: {mem_after:.2f} MB (Reclaimed: {mem_before - mem_after:.2f} MB)")
-        
-        return metrics
+        return result
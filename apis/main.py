@@ -1,17 +1,29 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import os
 import sys
 import logging
-import torch
+import threading
 from contextlib import asynccontextmanager
 
 # Ensure mmpose is in path for logic imports
 sys.path.append('mmpose')
 
 from apis.logic import HPAPredictor
+from apis.replica_pool import PredictorPool
+from apis.micro_batch import MicroBatchScheduler
+from apis.worker_pool import InferenceWorkerPool
+from apis.result_cache import CachedPredictor, configure_result_cache, get_result_cache, model_version
+from apis.hoof_backends import build_backend, set_torch_threads
+from apis.warmup import WarmupState
+from apis.http_client import configure_http_client, close_http_client, get_http_client
+from apis.executors import configure_executors, executor_stats, run_inference, shutdown_executors
+from apis.s3_uploader import configure_s3_uploader, get_s3_uploader, shutdown_s3_uploader
+from apis.admission import configure_admission, get_admission
+from apis.v5.services.queue_worker import queue_stats
+from apis.response_images import IMAGE_MODES, MEDIA_TYPES, ResponseImages, configure_image_store, get_image_store
 from apis.yolo_predictor import YOLOPredictor
 from apis.image_utils import get_rembg_session
 from apis.routes.v1.analyze import router as analyze_router
@@ -39,20 +51,217 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CONFIG_PATH = os.path.join(PROJECT_ROOT, 'mmpose/custom_configs/rtmpose_hoof_4kp_copy.py')
 CHECKPOINT_PATH = os.path.join(PROJECT_ROOT, 'mmpose/work_dirs/rtmpose_hoof_manual_30_april/epoch_130.pth')
 # YOLO_WEIGHTS = os.path.join(PROJECT_ROOT, 'runs/segment/hpa_v8m_full_v1/weights/best.pt')
-DEVICE = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+
+# Hoof model runtime: "mmpose" (torch), "onnxruntime" (export with export_hoof_onnx.py)
+# or "onnxruntime_int8" (promoted by quantize_hoof_onnx.py; loads <HPA_ONNX_PATH stem>_int8.onnx).
+HPA_BACKEND = os.getenv("HPA_BACKEND", "mmpose")
+ONNX_PATH = os.getenv("HPA_ONNX_PATH", os.path.join(PROJECT_ROOT, 'mmpose/work_dirs/rtmpose_hoof_manual_30_april/hoof_rtmpose.onnx'))
+
+# Replica pool: N independently loaded predictors, each owning cpu_budget / N threads.
+# N is capped by HPA_MAX_REPLICAS, the core budget and the memory budget (measured per replica).
+MAX_REPLICAS = int(os.getenv("HPA_MAX_REPLICAS", "4"))
+CPU_BUDGET = int(os.getenv("HPA_CPU_BUDGET", "0")) or None
+MEMORY_BUDGET_MB = float(os.getenv("HPA_MEMORY_BUDGET_MB", "0")) or None
+MIN_THREADS_PER_REPLICA = int(os.getenv("HPA_MIN_THREADS_PER_REPLICA", "2"))
+
+# Cross-request micro-batching: 0 = off (each replica owns a model). When on, the replicas share
+# one model behind a scheduler that flushes at HPA_MICRO_BATCH_MAX crops or after HPA_MICRO_BATCH_DELAY_MS.
+MICRO_BATCH_MAX = int(os.getenv("HPA_MICRO_BATCH_MAX", "0"))
+MICRO_BATCH_DELAY_MS = float(os.getenv("HPA_MICRO_BATCH_DELAY_MS", "5"))
+
+# Inference worker processes: 0 = off (in-process replicas). When on, lateral and frontal inference
+# run in HPA_INFERENCE_WORKERS processes (images handed over via shared memory); the replica pool
+# and micro-batching settings above are not used.
+INFERENCE_WORKERS = int(os.getenv("HPA_INFERENCE_WORKERS", "0"))
+WORKER_THREADS = int(os.getenv("HPA_WORKER_THREADS", "2"))
+
+# Content-addressed result cache for repeat images (0 = off). The optional disk store survives restarts.
+RESULT_CACHE_MB = float(os.getenv("HPA_RESULT_CACHE_MB", "128"))
+RESULT_CACHE_DIR = os.getenv("HPA_RESULT_CACHE_DIR") or None
+RESULT_CACHE_DISK_MB = float(os.getenv("HPA_RESULT_CACHE_DISK_MB", "1024"))
+
+# Startup warm-up: synthetic runs through every configured path before /api/ready reports ready.
+WARMUP = os.getenv("HPA_WARMUP", "true").lower() in ("1", "true", "yes")
+WARMUP_RUNS = int(os.getenv("HPA_WARMUP_RUNS", "2"))
+# Also load + warm the frontal depth model and animal inferencer (otherwise loaded by the first v5 frontal slot).
+WARMUP_FRONTAL = os.getenv("HPA_WARMUP_FRONTAL", "true").lower() in ("1", "true", "yes")
+
+# Shared image-download client (one keep-alive pool for every API version).
+HTTP_TIMEOUT = float(os.getenv("HPA_HTTP_TIMEOUT", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HPA_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HPA_HTTP_MAX_CONNECTIONS", "64"))
+HTTP_PER_HOST = int(os.getenv("HPA_HTTP_PER_HOST", "8"))
+HTTP_RETRIES = int(os.getenv("HPA_HTTP_RETRIES", "2"))
+HTTP2 = os.getenv("HPA_HTTP2", "true").lower() in ("1", "true", "yes")
+# Image download limits: checked on headers / the first bytes, before the full body is downloaded.
+MAX_IMAGE_MB = float(os.getenv("HPA_MAX_IMAGE_MB", "25"))
+MAX_IMAGE_SIDE = int(os.getenv("HPA_MAX_IMAGE_SIDE", "16384"))
+MAX_IMAGE_MP = float(os.getenv("HPA_MAX_IMAGE_MP", "100"))
+
+# App-wide executors: leg inference threads (0 = one per predictor replica / worker process) and upload threads.
+INFERENCE_THREADS = int(os.getenv("HPA_INFERENCE_THREADS", "0"))
+IO_THREADS = int(os.getenv("HPA_IO_THREADS", "8"))
+# Share of the inference threads async jobs may hold; the rest stays free for sync scans.
+ASYNC_SHARE = float(os.getenv("HPA_ASYNC_SHARE", "0.5"))
+
+# S3 uploads (one pooled client, run on the io threads): multipart from the threshold, part size / parts in parallel.
+S3_MULTIPART_THRESHOLD_MB = float(os.getenv("HPA_S3_MULTIPART_THRESHOLD_MB", "8"))
+S3_PART_SIZE_MB = float(os.getenv("HPA_S3_PART_SIZE_MB", "8"))
+S3_PART_CONCURRENCY = int(os.getenv("HPA_S3_PART_CONCURRENCY", "4"))
+S3_TIMEOUT = float(os.getenv("HPA_S3_TIMEOUT", "30"))
+S3_RETRIES = int(os.getenv("HPA_S3_RETRIES", "3"))
+
+# Admission control: refuse sync scans (429 / 503 + Retry-After) past these budgets, async jobs past the queue budget.
+ADMISSION = os.getenv("HPA_ADMISSION", "true").lower() in ("1", "true", "yes")
+MAX_INFLIGHT_LEGS = int(os.getenv("HPA_MAX_INFLIGHT_LEGS", "64"))
+MAX_BACKLOG_S = float(os.getenv("HPA_MAX_BACKLOG_S", "30"))
+MAX_ASYNC_BACKLOG_S = float(os.getenv("HPA_MAX_ASYNC_BACKLOG_S", "1800"))
+
+# Durable /api/v5/analyze-async queue: store URL (sqlite:///<relative> | sqlite:////<absolute>) and consumers per process.
+JOB_STORE = os.getenv("HPA_JOB_STORE") or f"sqlite:///{os.path.join(PROJECT_ROOT, 'data', 'jobs.db')}"
+QUEUE_WORKERS = int(os.getenv("HPA_QUEUE_WORKERS", "2"))
+JOB_RETENTION_DAYS = float(os.getenv("HPA_JOB_RETENTION_DAYS", "7"))
+# Webhook outbox (in the job store database): sender tasks, per-host limit; undeliverable payloads become dead letters.
+WEBHOOK_SENDERS = int(os.getenv("HPA_WEBHOOK_SENDERS", "4"))
+WEBHOOK_PER_HOST = int(os.getenv("HPA_WEBHOOK_PER_HOST", "2"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("HPA_WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_TIMEOUT = float(os.getenv("HPA_WEBHOOK_TIMEOUT", "30"))
+WEBHOOK_RETENTION_DAYS = float(os.getenv("HPA_WEBHOOK_RETENTION_DAYS", "7"))
+
+def _default_device():
+    # Only touch torch when it is actually needed, so the ORT backend starts without it.
+    if HPA_BACKEND.startswith("onnxruntime"):
+        return 'cpu'
+    import torch
+    return 'cuda:0' if torch.cuda.is_available() else 'cpu'
+
+DEVICE = os.getenv("DEVICE") or _default_device()
+
+# Zone-scan batching: unset = all zone crops in one forward pass, 1 = legacy sequential scan.
+ZONE_BATCH_SIZE = int(os.getenv("HPA_ZONE_BATCH_SIZE", "0")) or None
+# Cutout ROI proposal: 1-2 crops from the foreground mask, full zone scan only below the score threshold.
+ROI_PROPOSAL = os.getenv("HPA_ROI_PROPOSAL", "false").lower() in ("1", "true", "yes")
+ROI_PROPOSAL_MIN_SCORE = float(os.getenv("HPA_ROI_PROPOSAL_MIN_SCORE", "6.0"))
+# Keypoint strategy: "zone_scan" (default) or "coarse_to_fine" (512px pass + high-res crop refinement).
+INFERENCE_STRATEGY = os.getenv("HPA_INFERENCE_STRATEGY", "zone_scan")
+# Calibrated zone order + early exit (generate with calibrate_zone_schedule.py). Unset = full zone scan.
+ZONE_SCHEDULE_PATH = os.getenv("HPA_ZONE_SCHEDULE")
+EARLY_EXIT_SCORE = float(os.getenv("HPA_EARLY_EXIT_SCORE")) if os.getenv("HPA_EARLY_EXIT_SCORE") else None
+# Numpy crop preprocessing + direct SimCC decode for the mmpose backend (verify with check_hoof_fast_path.py).
+FAST_PREPROCESS = os.getenv("HPA_FAST_PREPROCESS", "false").lower() in ("1", "true", "yes")
+# Reduced-resolution decode: long side the lateral image is analysed / rendered at (0 = full resolution).
+DECODE_MAX_DIM = int(os.getenv("HPA_DECODE_MAX_DIM", "0")) or None
+RENDER_MAX_DIM = int(os.getenv("HPA_RENDER_MAX_DIM", "0")) or None
+# Overlay encoding for endpoints that render (legacy/v1 image_base64, v5 S3 uploads): jpg | png | webp.
+RENDER_FORMAT = os.getenv("HPA_RENDER_FORMAT", "jpg").lower()
+RENDER_QUALITY = int(os.getenv("HPA_RENDER_QUALITY", "95"))
+# Overlays served by URL (?images=url on /analyze and /api/v1/batch-analyze): local store directory and lifetime.
+IMAGE_STORE_DIR = os.getenv("HPA_IMAGE_STORE_DIR") or None
+IMAGE_STORE_TTL = int(os.getenv("HPA_IMAGE_STORE_TTL", "300"))
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # --- Startup Logic ---
+    # 0. Shared HTTP client for image downloads
+    configure_http_client(
+        timeout=HTTP_TIMEOUT, connect_timeout=HTTP_CONNECT_TIMEOUT, max_connections=HTTP_MAX_CONNECTIONS,
+        per_host=HTTP_PER_HOST, retries=HTTP_RETRIES, http2=HTTP2,
+        max_image_bytes=int(MAX_IMAGE_MB * 1024 * 1024), max_image_side=MAX_IMAGE_SIDE,
+        max_image_pixels=int(MAX_IMAGE_MP * 1_000_000),
+    )
+    configure_image_store(directory=IMAGE_STORE_DIR, ttl=IMAGE_STORE_TTL)
+
     # 1. MMPose
-    logger.info("🚀 Initializing HPAPredictor (MMPose)...")
+    logger.info("🚀 Initializing HPAPredictor (MMPose) replica pool...")
     try:
-        app.state.predictor = HPAPredictor(CONFIG_PATH, CHECKPOINT_PATH, device=DEVICE)
+        app.state.micro_batcher = None
+        app.state.worker_pool = None
+        predictor_kwargs = dict(
+            config_path=CONFIG_PATH,
+            checkpoint_path=CHECKPOINT_PATH,
+            device=DEVICE,
+            zone_batch_size=ZONE_BATCH_SIZE,
+            roi_proposal=ROI_PROPOSAL,
+            proposal_min_score=ROI_PROPOSAL_MIN_SCORE,
+            strategy=INFERENCE_STRATEGY,
+            zone_schedule_path=ZONE_SCHEDULE_PATH,
+            early_exit_score=EARLY_EXIT_SCORE,
+            backend=HPA_BACKEND,
+            onnx_path=ONNX_PATH,
+            decode_max_dim=DECODE_MAX_DIM,
+            render_max_dim=RENDER_MAX_DIM,
+            fast_path=FAST_PREPROCESS,
+            render_format=RENDER_FORMAT,
+            render_quality=RENDER_QUALITY,
+        )
+
+        if INFERENCE_WORKERS > 0:
+            app.state.worker_pool = InferenceWorkerPool(
+                predictor_kwargs, num_workers=INFERENCE_WORKERS, threads_per_worker=WORKER_THREADS,
+                warmup_runs=WARMUP_RUNS if WARMUP else 0, warmup_frontal=WARMUP_FRONTAL,
+            )
+            app.state.predictor = app.state.worker_pool
+        else:
+            if MICRO_BATCH_MAX > 0:
+                app.state.micro_batcher = MicroBatchScheduler(
+                    build_backend(
+                        HPA_BACKEND, config_path=CONFIG_PATH, checkpoint_path=CHECKPOINT_PATH,
+                        onnx_path=ONNX_PATH, device=DEVICE, intra_op_threads=CPU_BUDGET,
+                        fast_path=FAST_PREPROCESS,
+                    ),
+                    max_batch=MICRO_BATCH_MAX,
+                    max_delay_ms=MICRO_BATCH_DELAY_MS,
+                )
+                predictor_kwargs["backend"] = app.state.micro_batcher
+
+            app.state.predictor = PredictorPool(
+                lambda threads: HPAPredictor(**predictor_kwargs, intra_op_threads=threads),
+                cpu_budget=CPU_BUDGET,
+                memory_budget_mb=MEMORY_BUDGET_MB,
+                max_replicas=MAX_REPLICAS,
+                min_threads_per_replica=MIN_THREADS_PER_REPLICA,
+            )
+            if HPA_BACKEND == "mmpose":
+                # torch's thread count is process-wide: one setting for every replica, or the whole
+                # budget for the micro-batcher's single forward pass at a time.
+                set_torch_threads((CPU_BUDGET or os.cpu_count() or 1) if MICRO_BATCH_MAX > 0
+                                  else app.state.predictor.threads_per_replica)
+
+        # Anything that changes a result must be part of the version, so stale entries are never served.
+        cache = configure_result_cache(
+            RESULT_CACHE_MB, disk_dir=RESULT_CACHE_DIR, disk_max_mb=RESULT_CACHE_DISK_MB,
+            version=model_version(
+                files=(CONFIG_PATH, CHECKPOINT_PATH, ONNX_PATH if HPA_BACKEND.startswith("onnxruntime") else None,
+                       ZONE_SCHEDULE_PATH, os.path.join(PROJECT_ROOT, "leg_symmetry_v3.py")),
+                backend=HPA_BACKEND, strategy=INFERENCE_STRATEGY, roi_proposal=ROI_PROPOSAL,
+                proposal_min_score=ROI_PROPOSAL_MIN_SCORE, early_exit_score=EARLY_EXIT_SCORE,
+                decode_max_dim=DECODE_MAX_DIM, render_max_dim=RENDER_MAX_DIM, fast_path=FAST_PREPROCESS,
+                render_format=RENDER_FORMAT, render_quality=RENDER_QUALITY,
+            ),
+        )
+        if cache:
+            app.state.predictor = CachedPredictor(app.state.predictor, cache)
         logger.info("✅ HPAPredictor initialized successfully")
     except Exception as e:
         logger.error(f"❌ Failed to initialize HPAPredictor: {e}")
         app.state.predictor = None
 
+    # 1.2. App-wide executors, sized to the predictor unless overridden
+    configure_executors(
+        inference_workers=INFERENCE_THREADS or getattr(app.state.predictor, "size", 1),
+        io_workers=IO_THREADS,
+        async_share=ASYNC_SHARE,
+    )
+    configure_s3_uploader(
+        max_connections=IO_THREADS * S3_PART_CONCURRENCY,
+        multipart_threshold=int(S3_MULTIPART_THRESHOLD_MB * 1024 * 1024),
+        part_size=int(S3_PART_SIZE_MB * 1024 * 1024), part_concurrency=S3_PART_CONCURRENCY,
+        read_timeout=S3_TIMEOUT, retries=S3_RETRIES,
+    )
+    if ADMISSION:
+        configure_admission(max_inflight_legs=MAX_INFLIGHT_LEGS, max_backlog_s=MAX_BACKLOG_S,
+                            max_async_backlog_s=MAX_ASYNC_BACKLOG_S)
+
     # 1.5. Rembg Session (used by v3 / legacy only; disabled since v3 was hidden)
     # Commenting out to save memory — v4 images are pre-cutout, no rembg needed.
     # logger.info("🚀 Initializing Rembg Session...")
@@ -60,16 +269,42 @@ async def lifespan(app: FastAPI):
 
     # 2. YOLO Medium (Disabled for speed/stability)
     app.state.yolo_predictor = None
+
+    # 2.5. Warm-up in the background: the server answers probes meanwhile, /api/ready stays 503 until done
+    app.state.warmup = WarmupState()
+    if WARMUP and app.state.predictor:
+        threading.Thread(
+            target=app.state.warmup.run,
+            kwargs=dict(
+                predictor=app.state.predictor, worker_pool=app.state.worker_pool,
+                yolo_predictor=app.state.yolo_predictor, frontal=WARMUP_FRONTAL, runs=WARMUP_RUNS,
+            ),
+            name="warmup",
+            daemon=True,
+        ).start()
+    else:
+        app.state.warmup.status = "ready"
     
     # 3. Start Async Queue Worker for webhooks
     from apis.v5.services.queue_worker import start_queue_worker, stop_queue_worker
-    start_queue_worker()
+    start_queue_worker(
+        app.state.predictor, JOB_STORE, concurrency=QUEUE_WORKERS, job_retention=JOB_RETENTION_DAYS * 86400,
+        senders=WEBHOOK_SENDERS, per_host=WEBHOOK_PER_HOST,
+        max_attempts=WEBHOOK_MAX_ATTEMPTS, timeout=WEBHOOK_TIMEOUT, retention=WEBHOOK_RETENTION_DAYS * 86400,
+    )
     
     yield
     
     # --- Shutdown Logic ---
     logger.info("🛑 Shutting down API...")
     await stop_queue_worker()
+    await close_http_client()
+    shutdown_executors()
+    shutdown_s3_uploader()
+    if getattr(app.state, 'micro_batcher', None):
+        app.state.micro_batcher.close()
+    if getattr(app.state, 'worker_pool', None):
+        app.state.worker_pool.close()
     if hasattr(app.state, 'predictor'):
         del app.state.predictor
 
@@ -117,11 +352,37 @@ async def status():
     """Returns the initialization status of the models."""
     return {
         "mmpose": "loaded" if getattr(app.state, "predictor", None) else "failed",
+        "hoof_backend": HPA_BACKEND,
+        "inference_pool": app.state.predictor.stats() if getattr(app.state, "predictor", None) else None,
+        "result_cache": get_result_cache().stats() if get_result_cache() else None,
+        "micro_batch": app.state.micro_batcher.stats() if getattr(app.state, "micro_batcher", None) else None,
+        "http_client": get_http_client().stats(),
+        "executors": executor_stats(),
+        "s3_uploader": get_s3_uploader().stats(),
+        "admission": get_admission().stats() if get_admission() else None,
+        "job_queue": queue_stats(),
+        "image_store": get_image_store().stats(),
+        "warmup": app.state.warmup.report() if getattr(app.state, "warmup", None) else None,
         "paths": {
             "root": PROJECT_ROOT,
         }
     }
 
+@app.get("/api/ready", tags=["Health"])
+async def ready():
+    """Readiness probe: 503 until the hoof model is loaded and startup warm-up has finished."""
+    warmup = getattr(app.state, "warmup", None)
+    loaded = getattr(app.state, "predictor", None) is not None
+    is_ready = loaded and warmup is not None and warmup.ready
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={
+            "ready": is_ready,
+            "mmpose": "loaded" if loaded else "failed",
+            "warmup": warmup.report() if warmup else None,
+        },
+    )
+
 @app.get("/api/logs", tags=["Health"], response_class=PlainTextResponse)
 async def get_logs(lines: int = 100):
     """
@@ -159,9 +420,21 @@ app.include_router(analyze_v4_router, prefix="/api/v4", tags=["Analysis V4 (Mobi
 from apis.v5.routes import router as analyze_v5_router
 app.include_router(analyze_v5_router, prefix="/api/v5", tags=["Analysis V5 (Advanced Symmetry paired)"])
 
+@app.get("/api/images/{name}", tags=["Analysis V1"], name="get_response_image")
+async def get_response_image(name: str):
+    """Overlay stored for an ?images=url response; 404 once it has expired."""
+    path = get_image_store().path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found or expired")
+    return FileResponse(path, media_type=MEDIA_TYPES.get(name.rsplit(".", 1)[-1]),
+                        headers={"Cache-Control": f"private, max-age={get_image_store().ttl}"})
+
 # Keep the legacy endpoint for backward compatibility if needed, or remove it
 @app.post("/analyze", tags=["Legacy"])
-async def analyze_image(file: UploadFile = File(...)):
+async def analyze_image(request: Request, file: UploadFile = File(...), images: str = "inline"):
+    """images: inline (image_base64) | url | multipart | none — see apis/response_images.py."""
+    if images not in IMAGE_MODES:
+        raise HTTPException(status_code=422, detail=f"images must be one of {', '.join(IMAGE_MODES)}")
     predictor = getattr(app.state, 'predictor', None)
     if not predictor:
         raise HTTPException(status_code=503, detail="Model not initialized")
@@ -171,7 +444,8 @@ async def analyze_image(file: UploadFile = File(...)):
     
     try:
         contents = await file.read()
-        results = predictor.predict(contents)
+        out = ResponseImages(images, request)
+        results = await out.metrics(await run_inference(predictor.predict, contents, render=out.render))
         
         # Log Results for Validation
         logger.info(f"📊 Legacy API Result [{file.filename}]:")
@@ -180,7 +454,7 @@ async def analyze_image(file: UploadFile = File(...)):
         logger.info(f"   - hpa_dev: {results.get('hpa_dev')}")
         logger.info(f"   - model_confidence: {results.get('model_confidence')}")
         
-        return JSONResponse(content=results)
+        return out.response(results)
     except Exception as e:
         logger.error(f"❌ Error during analysis: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,167 @@
+"""
+MicroBatchScheduler — cross-request dynamic batching in front of the hoof model.
+
+Sits between HPAPredictor and a hoof backend (hoof_backends.py) and exposes the same
+infer(img, bboxes) call. Every caller (v2, v4, v5 sync and the v5 queue worker, via
+their predictor replicas) blocks on its own future while a single dispatcher thread
+collects pending zone crops and runs them through backend.infer_many() as one batch.
+
+A batch is flushed when either
+    - the next request would not fit into max_batch crops (it opens the next batch), or
+    - max_delay_ms has passed since the first crop of the batch arrived.
+A batch never holds more than max_batch crops: a call with more crops than that is
+split into max_batch-sized chunks whose results are concatenated again.
+
+close() fails every call still waiting, and infer() raises once the scheduler is closed.
+
+Each crop goes through exactly the same preprocessing and decode as an unbatched
+call, so per-request keypoints are unchanged; only the forward pass is shared.
+"""
+
+import queue
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatchScheduler:
+    """
+    backend:       a hoof backend with infer_many()
+    max_batch:     most crops in one batch (flushed as soon as it is full)
+    max_delay_ms:  longest a crop waits for company before its batch is flushed
+    """
+
+    def __init__(self, backend, max_batch=16, max_delay_ms=5.0):
+        self.backend = backend
+        self.name = getattr(backend, "name", "unknown")
+        self.max_batch = max(1, int(max_batch))
+        self.max_delay = max(0.0, float(max_delay_ms)) / 1000.0
+
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._crops = 0
+        self._requests = 0
+        self._max_seen = 0
+        self._flush_full = 0
+        self._flush_deadline = 0
+
+        self._thread = threading.Thread(target=self._run, name="hoof-micro-batch", daemon=True)
+        self._thread.start()
+        logger.info(f"🧺 MicroBatchScheduler: max_batch={self.max_batch}, max_delay={max_delay_ms}ms ({self.name})")
+
+    def infer(self, img, bboxes):
+        """Same contract as backend.infer(); blocks until the batch holding these crops has run."""
+        bboxes = np.asarray(bboxes, dtype=np.float32)
+        if len(bboxes) == 0:
+            return self.backend.infer(img, bboxes)
+        futures = []
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("MicroBatchScheduler is closed")
+            for start in range(0, len(bboxes), self.max_batch):
+                future = Future()
+                self._queue.put((img, bboxes[start:start + self.max_batch], future))
+                futures.append(future)
+        if len(futures) == 1:
+            return futures[0].result()
+        results = [future.result() for future in futures]
+        return np.concatenate([k for k, _ in results]), np.concatenate([s for _, s in results])
+
+    def close(self):
+        """Fails every queued call at once (the batch already in the backend still completes), then stops."""
+        with self._close_lock:
+            self._closed = True
+            self._fail_pending()
+            self._queue.put(_STOP)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        carry = None  # request held back because it would have overflowed the previous batch
+        while True:
+            first = carry if carry is not None else self._queue.get()
+            carry = None
+            if first is _STOP:
+                break
+            items = [first]
+            pending = len(first[1])
+            deadline = time.monotonic() + self.max_delay
+            stop = False
+
+            while pending < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                if pending + len(item[1]) > self.max_batch:
+                    carry = item
+                    break
+                items.append(item)
+                pending += len(item[1])
+
+            self._flush(items, full=pending >= self.max_batch or carry is not None)
+            if stop:
+                break
+        self._fail_pending()
+
+    def _fail_pending(self):
+        closed = RuntimeError("MicroBatchScheduler is closed")
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP:
+                item[2].set_exception(closed)
+
+    def _flush(self, items, full):
+        try:
+            results = self.backend.infer_many([(img, bboxes) for img, bboxes, _ in items])
+        except Exception as e:
+            logger.error(f"❌ Micro-batch of {len(items)} request(s) failed: {e}")
+            for _, _, future in items:
+                future.set_exception(e)
+            return
+
+        for (_, _, future), result in zip(items, results):
+            future.set_result(result)
+
+        crops = sum(len(bboxes) for _, bboxes, _ in items)
+        with self._stats_lock:
+            self._batches += 1
+            self._crops += crops
+            self._requests += len(items)
+            self._max_seen = max(self._max_seen, crops)
+            if full:
+                self._flush_full += 1
+            else:
+                self._flush_deadline += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_delay_ms": self.max_delay * 1000.0,
+                "batches": self._batches,
+                "crops": self._crops,
+                "avg_batch_crops": round(self._crops / self._batches, 2) if self._batches else 0.0,
+                "avg_batch_calls": round(self._requests / self._batches, 2) if self._batches else 0.0,
+                "max_batch_crops": self._max_seen,
+                "flushed_full": self._flush_full,
+                "flushed_deadline": self._flush_deadline,
+            }
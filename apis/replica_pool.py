@@ -0,0 +1,106 @@
+"""
+PredictorPool — a bounded pool of independently loaded HPAPredictor replicas.
+
+Replaces the old process-wide INFERENCE_LOCK: each request checks out one replica,
+so N scans can run at once on N slices of the CPU instead of queueing behind a
+single lock. The pool exposes the same predict() signature as HPAPredictor, so the
+API layer can use it interchangeably (app.state.predictor).
+
+Sizing (size_pool):
+    replicas          = min(max_replicas,
+                            cpu_budget // min_threads_per_replica,
+                            memory_budget_mb // replica_mem_mb)
+    threads/replica   = cpu_budget // replicas
+The per-replica memory cost is measured while loading the first replica.
+"""
+
+import os
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+
+def size_pool(cpu_budget, memory_budget_mb, replica_mem_mb, max_replicas=4, min_threads_per_replica=2):
+    """Returns (num_replicas, threads_per_replica) for the given core and memory budget."""
+    by_cpu = max(1, cpu_budget // max(1, min_threads_per_replica))
+    by_mem = max(1, int(memory_budget_mb // max(1.0, replica_mem_mb)))
+    replicas = max(1, min(max_replicas, by_cpu, by_mem))
+    return replicas, max(1, cpu_budget // replicas)
+
+
+def _rss_mb():
+    return psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024
+
+
+class PredictorPool:
+    """
+    factory(threads) -> predictor. Called once per replica with its thread share.
+
+    cpu_budget:        cores the hoof model may use in total (default: all cores)
+    memory_budget_mb:  RSS the replicas may use in total (default: half of available RAM)
+    """
+
+    def __init__(self, factory, cpu_budget=None, memory_budget_mb=None, max_replicas=4, min_threads_per_replica=2):
+        cpu_budget = cpu_budget or os.cpu_count() or 1
+        if not memory_budget_mb:
+            memory_budget_mb = psutil.virtual_memory().available / 1024 / 1024 * 0.5
+
+        # Load one replica first to learn what a replica costs, then size the rest.
+        first_threads = max(1, cpu_budget // max_replicas) if max_replicas > 1 else cpu_budget
+        rss_before = _rss_mb()
+        first = factory(first_threads)
+        replica_mem_mb = max(1.0, _rss_mb() - rss_before)
+
+        self.size, self.threads_per_replica = size_pool(
+            cpu_budget, memory_budget_mb, replica_mem_mb, max_replicas, min_threads_per_replica
+        )
+        logger.info(
+            f"🧩 PredictorPool: {self.size} replica(s) x {self.threads_per_replica} thread(s) "
+            f"(replica ≈ {replica_mem_mb:.0f} MB, budget {memory_budget_mb:.0f} MB / {cpu_budget} cores)"
+        )
+
+        if first_threads != self.threads_per_replica:
+            # Thread counts are fixed at load time (ORT session options); reload with the final share.
+            del first
+            first = factory(self.threads_per_replica)
+        replicas = [first] + [factory(self.threads_per_replica) for _ in range(self.size - 1)]
+
+        self.replicas = replicas
+        self._idle: queue.Queue = queue.Queue()
+        for r in replicas:
+            self._idle.put(r)
+        self._busy = 0
+        self._busy_lock = threading.Lock()
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """Borrows an idle replica (blocks until one is free)."""
+        replica = self._idle.get(timeout=timeout)
+        with self._busy_lock:
+            self._busy += 1
+        try:
+            yield replica
+        finally:
+            with self._busy_lock:
+                self._busy -= 1
+            self._idle.put(replica)
+
+    def predict(self, *args, **kwargs):
+        """Same contract as HPAPredictor.predict(), run on whichever replica is free."""
+        with self.checkout() as replica:
+            return replica.predict(*args, **kwargs)
+
+    def stats(self):
+        with self._busy_lock:
+            busy = self._busy
+        return {
+            "replicas": self.size,
+            "threads_per_replica": self.threads_per_replica,
+            "busy": busy,
+            "idle": self.size - busy,
+        }
@@ -0,0 +1,173 @@
+"""
+Opt-in delivery of annotated overlays for the legacy /analyze and v1 batch responses.
+
+By default every overlay is inlined as image_base64: a third larger than the image and
+serialised through the stdlib JSON encoder along with the rest of the response. The
+`images` query parameter selects another mode:
+
+- inline     (default) unchanged response
+- url        overlays are written to a short-lived local store and metrics.image_url
+             points at GET /api/images/<name>; the store is a directory, so every gunicorn
+             worker on the host can serve it, and files expire after ttl seconds
+- multipart  multipart/mixed response: the JSON document first, then one binary part
+             per overlay; metrics.image_url is "cid:<Content-ID>" of its part
+- none       no overlay is rendered at all
+
+Outside inline mode the JSON is encoded with orjson (ORJSONResponse).
+"""
+
+import logging
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from apis.executors import run_io
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MODES = ("inline", "url", "multipart", "none")
+MEDIA_TYPES = {"jpg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+\.(jpg|png|webp)$")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson (fastapi's own ORJSONResponse is deprecated in newer releases)."""
+
+    def render(self, content):
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+class ImageStore:
+    """
+    directory:  where overlays are written (shared by all workers on the host)
+    ttl:        seconds an overlay stays downloadable
+    """
+
+    def __init__(self, directory=None, ttl=300):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "hpa_response_images")
+        self.ttl = ttl
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.served = 0
+        self.expired = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def put(self, data, image_format):
+        """Writes one overlay; returns its file name (the /api/images/<name> path segment)."""
+        name = f"{secrets.token_urlsafe(18)}.{image_format}"
+        tmp = os.path.join(self.directory, f".{name}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, os.path.join(self.directory, name))
+        self.stored += 1
+        self._maybe_sweep()
+        return name
+
+    def path(self, name):
+        """Path of a live overlay, or None for an unknown / expired name."""
+        if not _NAME_RE.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+        except OSError:
+            return None
+        self.served += 1
+        return path
+
+    def _maybe_sweep(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < self.ttl / 4:
+                return
+            self._last_sweep = now
+        for entry in os.scandir(self.directory):
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+                    self.expired += 1
+            except OSError:
+                pass  # another worker swept it first
+
+    def stats(self):
+        return {"directory": self.directory, "ttl": self.ttl, "stored": self.stored,
+                "served": self.served, "expired": self.expired}
+
+
+# Process-wide store (configured in main.py lifespan)
+_image_store = None
+
+
+def configure_image_store(**kwargs):
+    global _image_store
+    _image_store = ImageStore(**kwargs)
+    return _image_store
+
+
+def get_image_store():
+    global _image_store
+    if _image_store is None:
+        _image_store = ImageStore()
+    return _image_store
+
+
+class ResponseImages:
+    """
+    Collects the overlays of one response in the requested mode.
+
+        out = ResponseImages(mode, request)
+        metrics = await out.metrics(predictor.predict(data, render=out.render))
+        return out.response(payload)
+    """
+
+    def __init__(self, mode, request):
+        if mode not in IMAGE_MODES:
+            raise ValueError(f"Unknown image mode {mode!r} (expected one of {', '.join(IMAGE_MODES)})")
+        self.mode = mode
+        self.request = request
+        self.render = mode != "none"
+        self._parts = []  # (content_id, image_format, bytes)
+
+    async def metrics(self, result):
+        """LegResult.to_metrics() with the overlay inlined, stored (file write on the io executor) or queued as a part."""
+        metrics = result.to_metrics(include_image=self.mode == "inline")
+        if result.image is None or self.mode in ("inline", "none"):
+            return metrics
+        if self.mode == "url":
+            name = await run_io(get_image_store().put, result.image, result.image_format)
+            metrics["image_url"] = str(self.request.url_for("get_response_image", name=name))
+        else:
+            content_id = f"image-{len(self._parts)}"
+            self._parts.append((content_id, result.image_format, result.image))
+            metrics["image_url"] = f"cid:{content_id}"
+        return metrics
+
+    def response(self, payload):
+        """payload: a response model or plain dict. Inline mode keeps the stdlib encoder."""
+        if self.mode == "inline":
+            return payload if isinstance(payload, BaseModel) else JSONResponse(content=payload)
+        if isinstance(payload, BaseModel):
+            payload = payload.model_dump()
+        if self.mode != "multipart":
+            return ORJSONResponse(content=payload)
+
+        boundary = secrets.token_hex(16)
+        chunks = [f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode(), orjson.dumps(payload)]
+        for content_id, image_format, data in self._parts:
+            chunks.append(
+                f"\r\n--{boundary}\r\nContent-Type: {MEDIA_TYPES.get(image_format, 'application/octet-stream')}\r\n"
+                f"Content-ID: <{content_id}>\r\n"
+                f"Content-Disposition: attachment; filename=\"{content_id}.{image_format}\"\r\n\r\n".encode()
+            )
+            chunks.append(data)
+        chunks.append(f"\r\n--{boundary}--\r\n".encode())
+        return Response(content=b"".join(chunks), media_type=f"multipart/mixed; boundary={boundary}")
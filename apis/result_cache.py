@@ -0,0 +1,285 @@
+"""
+Content-addressed cache for leg analysis results.
+
+Clients resubmit the same lateral/frontal images on retries and rescans. Results are
+keyed on sha256(model version + namespace + request flags + image bytes), so a repeat
+image skips decode, inference, rendering and S3 upload.
+
+- In-memory LRU bounded by total entry size (JSON-encoded bytes)
+- Optional on-disk store (one JSON file per key) that survives restarts and is
+  promoted into memory on first hit. Files live under disk_dir/<version>/; directories
+  of other model versions are removed at start-up, and the store is pruned oldest-first
+  (file mtime, refreshed on every hit) once it grows past disk_max_bytes
+- The model version (model_version()) covers the weights, configs and settings that
+  change results, so a redeploy with a new checkpoint never serves stale entries
+
+Values must be JSON-serialisable (metrics dicts, LegResult.to_dict(), URLs).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Entries of disk_dir the cache owns: version directories (model_version() hashes) and
+# the key-prefix directories of the older flat layout. Anything else is left alone.
+_CACHE_DIR_RE = re.compile(r"^([0-9a-f]{2}|[0-9a-f]{16}|default)$")
+
+
+def model_version(files=(), **settings):
+    """Short hash of the given files' (path, size, mtime) plus settings."""
+    h = hashlib.sha256()
+    for path in files:
+        if path and os.path.exists(path):
+            st = os.stat(path)
+            h.update(f"{os.path.abspath(path)}:{st.st_size}:{int(st.st_mtime)}".encode())
+        else:
+            h.update(f"{path}:missing".encode())
+    h.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return h.hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    max_bytes:       in-memory bound (sum of JSON-encoded entry sizes)
+    disk_dir:        optional persistent store
+    disk_max_bytes:  bound of the persistent store; pruned oldest-first to 90% when exceeded
+    version:         model/config version mixed into every key
+    """
+
+    def __init__(self, max_bytes=128 * 1024 * 1024, disk_dir=None, version="", disk_max_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.version = version
+        self._entries: OrderedDict = OrderedDict()  # key -> JSON-encoded value
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_dir = None
+        self._disk_root = disk_dir
+        self._disk_bytes = 0
+        self._disk_pruned = 0
+        self._pruning = False
+        if disk_dir:
+            self.disk_dir = os.path.join(disk_dir, version or "default")
+            self._drop_stale_versions()
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_files())
+
+    def key(self, namespace, *parts):
+        """sha256 over version, namespace and each part (bytes, or anything str()-able)."""
+        h = hashlib.sha256(f"{self.version}:{namespace}".encode())
+        for part in parts:
+            data = part if isinstance(part, (bytes, bytearray, memoryview)) else str(part).encode()
+            # Length-prefix every part so (b"ab", b"c") and (b"a", b"bc") never collide
+            h.update(len(data).to_bytes(8, "little"))
+            h.update(data)
+        return h.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _drop_stale_versions(self):
+        """Removes the store of every other model version (their keys can never be hit again)."""
+        current = os.path.basename(self.disk_dir)
+        try:
+            names = os.listdir(self._disk_root)
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(self._disk_root, name)
+            if name != current and _CACHE_DIR_RE.match(name) and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+                logger.info(f"🧹 Result cache: removed stale disk store {path}")
+
+    def _disk_files(self):
+        """(mtime, path, size) of every cached file of this version."""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, path, st.st_size))
+        return files
+
+    def _prune_disk(self):
+        """Deletes the least recently used files until the store is back under 90% of disk_max_bytes."""
+        try:
+            files = sorted(self._disk_files())
+            total = sum(size for _, _, size in files)
+            target = self.disk_max_bytes * 0.9
+            removed = 0
+            for _, path, size in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            with self._lock:
+                self._disk_bytes = total
+                self._disk_pruned += removed
+            logger.info(f"🧹 Result cache: pruned {removed} disk entries ({total / 1024 / 1024:.0f} MB left)")
+        finally:
+            with self._lock:
+                self._pruning = False
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, "r") as f:
+                    encoded = f.read()
+                os.utime(path)  # mtime = last use, for the disk LRU
+            except (FileNotFoundError, OSError):
+                encoded = None
+            if encoded is not None:
+                self._remember(key, encoded)
+                with self._lock:
+                    self.disk_hits += 1
+                return json.loads(encoded)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        encoded = json.dumps(value)
+        self._remember(key, encoded)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "w") as f:
+                    f.write(encoded)
+                try:
+                    replaced = os.path.getsize(path)
+                except OSError:
+                    replaced = 0
+                os.replace(tmp, path)
+            except OSError as e:
+                logger.warning(f"⚠️ Result cache disk write failed: {e}")
+                return
+            with self._lock:
+                self._disk_bytes += len(encoded) - replaced
+                prune = self._disk_bytes > self.disk_max_bytes and not self._pruning
+                if prune:
+                    self._pruning = True
+            if prune:
+                # The directory walk runs off the caller's thread (put() is also called from async routes).
+                threading.Thread(target=self._prune_disk, name="result-cache-prune", daemon=True).start()
+
+    def _remember(self, key, encoded):
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = encoded
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def get_or_compute(self, key, compute, should_cache=lambda value: True):
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = compute()
+        if value is not None and should_cache(value):
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk": bool(self.disk_dir),
+                "disk_bytes": self._disk_bytes if self.disk_dir else None,
+                "disk_max_bytes": self.disk_max_bytes if self.disk_dir else None,
+                "disk_pruned": self._disk_pruned,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+
+class CachedPredictor:
+    """
+    predict() front for HPAPredictor / PredictorPool / InferenceWorkerPool.
+    Repeat images return the cached LegResult (including the rendered overlay, when one was
+    requested) without decoding. Everything else (size, stats(), analyze_frontal, ...) is
+    forwarded to the wrapped predictor. Callers that cache their own results (v5 stores
+    {metrics, url}) go through uncached() so the overlay is not stored twice.
+    """
+
+    def __init__(self, predictor, cache):
+        self.predictor = predictor
+        self.cache = cache
+
+    def predict(self, img_bytes, remove_bg=True, orig_img_bytes=None, render=False, image_format=None, image_quality=None):
+        from apis.logic import LegResult
+
+        kwargs = dict(remove_bg=remove_bg, orig_img_bytes=orig_img_bytes, render=render,
+                      image_format=image_format, image_quality=image_quality)
+        if not img_bytes:
+            return self.predictor.predict(img_bytes, **kwargs)
+        key = self.cache.key("predict", remove_bg, render, image_format, image_quality, img_bytes, orig_img_bytes or b"")
+        return LegResult.from_dict(self.cache.get_or_compute(
+            key,
+            lambda: self.predictor.predict(img_bytes, **kwargs).to_dict(),
+        ))
+
+    def __getattr__(self, name):
+        return getattr(self.predictor, name)
+
+
+def uncached(predictor):
+    """The predictor behind a CachedPredictor (or predictor itself), for callers with their own cache."""
+    return predictor.predictor if isinstance(predictor, CachedPredictor) else predictor
+
+
+# Process-wide cache shared by the API routes (configured in main.py lifespan; None = disabled)
+_result_cache = None
+
+
+def configure_result_cache(max_mb, disk_dir=None, version="", disk_max_mb=1024):
+    global _result_cache
+    _result_cache = ResultCache(int(max_mb * 1024 * 1024), disk_dir=disk_dir, version=version,
+                                disk_max_bytes=int(disk_max_mb * 1024 * 1024)) if max_mb > 0 else None
+    if _result_cache:
+        disk = f"{disk_dir} (≤{disk_max_mb:.0f} MB)" if disk_dir else "off"
+        logger.info(f"🗃️ Result cache: {max_mb:.0f} MB in memory, disk={disk}, version={version}")
+    return _result_cache
+
+
+def get_result_cache():
+    return _result_cache
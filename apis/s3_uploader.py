@@ -0,0 +1,199 @@
+"""
+Application-lifetime S3 uploader for overlay / symmetry images.
+
+upload_image_to_s3 (v4 / v5 services/upload.py) used to re-read .env and build a new
+boto3 client for every image, paying client setup and a fresh TLS handshake per upload,
+and v4 ran it on the inference thread. One S3Uploader (created in the main.py lifespan)
+now serves every version:
+
+- one boto3 client, credentials read once; its connection pool is sized for the io
+  executor plus multipart part threads, so connections stay alive between uploads
+- uploads run on the io executor (executors.py, HPA_IO_THREADS), never on an inference thread
+- images from multipart_threshold up go through one long-lived s3transfer
+  TransferManager as multipart uploads (part_size parts, part_concurrency at a time);
+  smaller ones are a single put_object, so no per-upload transfer threads are created
+- endpoint_url points it at any S3-compatible store (MinIO, LocalStack, moto_server)
+  for local runs; path-style addressing is used there
+- per-upload timing and failure counters under "s3_uploader" in /api/status
+
+Without bucket / credentials, upload() returns a placeholder URL (as before), so local
+development works without S3.
+"""
+
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+
+import boto3
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from dotenv import load_dotenv
+
+from apis.executors import run_io
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class S3Uploader:
+    """
+    bucket / access_key / secret_key / region: S3 target (missing bucket or keys = placeholder URLs)
+    endpoint_url:        S3-compatible endpoint instead of AWS (local stand-ins)
+    max_connections:     pooled connections of the shared client
+    multipart_threshold: bytes from which an upload is split into parts
+    part_size:           multipart part size in bytes (S3 minimum: 5 MB)
+    part_concurrency:    parts of one upload sent at once
+    connect_timeout / read_timeout: per-request timeouts in seconds
+    retries:             attempts per request (botocore standard retry mode)
+    """
+
+    def __init__(self, bucket=None, access_key=None, secret_key=None, region="us-east-1", endpoint_url=None,
+                 max_connections=16, multipart_threshold=8 * MB, part_size=8 * MB, part_concurrency=4,
+                 connect_timeout=5.0, read_timeout=30.0, retries=3, client=None):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.configured = bool(client or (bucket and access_key and secret_key))
+        self.multipart_threshold = multipart_threshold
+        self.transfer = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=max(5 * MB, part_size),
+            max_concurrency=max(1, part_concurrency),
+            use_threads=part_concurrency > 1,
+        )
+        self.client = client
+        if self.client is None and self.configured:
+            self.client = boto3.client(
+                's3',
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                region_name=region or "us-east-1",
+                endpoint_url=endpoint_url or None,
+                config=Config(
+                    max_pool_connections=max_connections,
+                    connect_timeout=connect_timeout,
+                    read_timeout=read_timeout,
+                    retries={"max_attempts": retries, "mode": "standard"},
+                    s3={"addressing_style": "path"} if endpoint_url else None,
+                ),
+            )
+        self._transfer_manager = create_transfer_manager(self.client, self.transfer) if self.client else None
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.failed = 0
+        self.multipart = 0
+        self.bytes = 0
+        self._total_s = 0.0
+        self._max_s = 0.0
+        self.last_error = None
+
+    def _record(self, size, elapsed, error=None):
+        with self._lock:
+            if error:
+                self.failed += 1
+                self.last_error = error
+                return
+            self.uploads += 1
+            self.bytes += size
+            if size >= self.multipart_threshold:
+                self.multipart += 1
+            self._total_s += elapsed
+            self._max_s = max(self._max_s, elapsed)
+
+    def upload(self, image_bytes: bytes, file_extension: str = "png", folder: str = "symmetry_overlays") -> str:
+        """
+        Uploads an image and returns its S3 key (relative path, what the Node server stores),
+        "" on failure. Blocking: call through upload_async() from async code.
+        """
+        if not self.configured:
+            # Fallback if credentials are not configured
+            logger.warning("⚠️ S3 config missing. Returning dummy URL.")
+            return f"https://dummy-s3-url.com/placeholder_{uuid.uuid4().hex[:8]}.{file_extension}"
+
+        file_name = f"{folder}/{folder.split('_')[0]}_{uuid.uuid4().hex}.{file_extension}"
+        started = time.perf_counter()
+        content_type = f'image/{file_extension}'
+        try:
+            if len(image_bytes) < self.multipart_threshold:
+                self.client.put_object(Bucket=self.bucket, Key=file_name, Body=bytes(image_bytes),
+                                       ContentType=content_type)
+            else:
+                self._transfer_manager.upload(
+                    io.BytesIO(image_bytes), self.bucket, file_name, extra_args={'ContentType': content_type},
+                ).result()
+        except (BotoCoreError, ClientError) as e:
+            code = e.response.get("Error", {}).get("Code") if isinstance(e, ClientError) else None
+            self._record(len(image_bytes), time.perf_counter() - started, code or type(e).__name__)
+            logger.error(f"❌ S3 Upload Error for {file_name}: {e}")
+            return ""
+        elapsed = time.perf_counter() - started
+        self._record(len(image_bytes), elapsed)
+        logger.info(f"☁️ Uploaded {file_name} ({len(image_bytes) / 1024:.0f} KB) in {elapsed * 1000:.0f} ms")
+        return file_name
+
+    async def upload_async(self, image_bytes: bytes, file_extension: str = "png", folder: str = "symmetry_overlays") -> str:
+        """upload() on the io executor."""
+        return await run_io(self.upload, image_bytes, file_extension, folder)
+
+    def close(self):
+        if self._transfer_manager is not None:
+            self._transfer_manager.shutdown()
+            self._transfer_manager = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "configured": self.configured,
+                "endpoint": self.endpoint_url,
+                "uploads": self.uploads,
+                "failed": self.failed,
+                "multipart": self.multipart,
+                "bytes": self.bytes,
+                "avg_ms": round(self._total_s / self.uploads * 1000, 1) if self.uploads else None,
+                "max_ms": round(self._max_s * 1000, 1) if self.uploads else None,
+                "last_error": self.last_error,
+            }
+
+
+# Process-wide uploader shared by every API version (configured in main.py lifespan)
+_uploader = None
+
+
+def configure_s3_uploader(**kwargs):
+    """Builds the uploader from the S3_* settings in .env; kwargs tune the client and transfers."""
+    global _uploader
+    shutdown_s3_uploader()
+    load_dotenv()
+    _uploader = S3Uploader(
+        bucket=os.getenv("S3_BUCKET_NAME"),
+        access_key=os.getenv("S3_ACCESS_KEY"),
+        secret_key=os.getenv("S3_SECRET_KEY"),
+        region=os.getenv("S3_REGION") or "us-east-1",
+        endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+        **kwargs,
+    )
+    target = _uploader.endpoint_url or "AWS"
+    logger.info(f"☁️ S3 uploader: bucket={_uploader.bucket or '-'} via {target}, configured={_uploader.configured}")
+    return _uploader
+
+
+def get_s3_uploader():
+    """The shared uploader; created with defaults on first use outside the app lifespan (scripts)."""
+    if _uploader is None:
+        configure_s3_uploader()
+    return _uploader
+
+
+async def upload_image(image_bytes: bytes, file_extension: str = "png", folder: str = "symmetry_overlays") -> str:
+    return await get_s3_uploader().upload_async(image_bytes, file_extension, folder)
+
+
+def shutdown_s3_uploader():
+    global _uploader
+    if _uploader is not None:
+        _uploader.close()
+        _uploader = None
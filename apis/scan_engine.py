@@ -0,0 +1,73 @@
+"""
+Staged scan execution shared by the v2, v4 and v5 analyze endpoints.
+
+Scans used to run in phases: every image downloaded, then every leg inferred, then
+uploads. One slow download held back every leg, and the CPU sat idle while the network
+worked (and the other way round). Each slot (leg) is now its own pipeline:
+
+    fetch   network: shared HTTP client (per-host limit), inputs of a slot fetched together
+    infer   decode + inference + overlay render, on the inference executor
+    upload  S3 upload, on the io executor
+
+A slot moves on as soon as its own input is ready, so leg 1's upload overlaps leg 2's
+inference. Bounds come from the shared pools (executors.py, http_client.py), not from
+the scan. The infer / upload stages live in each version's process function, which hands
+them to run_inference / the S3 uploader (io executor).
+
+Decode and render are not stages of their own: predictor.predict() decodes, infers and
+renders in one inference-executor call, because the reduced decode, the replica lock and
+the overlay canvas all live inside HPAPredictor. Nor do stages hand off through queues:
+each slot is one coroutine, and cross-scan overlap (the next async job's downloads
+running while the previous job's legs compute) comes from the queue worker running
+several consumers (HPA_QUEUE_WORKERS), each with its own run_slots().
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class Slot:
+    """
+    key:      leg key (frontLeft, backRightFrontal, ...)
+    inputs:   image inputs (URL / base64 / upload placeholder); duplicates are fetched once
+    process:  async process(key, *image_bytes) -> result (the infer and upload stages)
+    """
+    key: str
+    inputs: tuple
+    process: Callable[..., Awaitable[Any]]
+
+
+async def _run_slot(slot, fetch, on_fetch_error, label):
+    t0 = time.perf_counter()
+    unique = list(dict.fromkeys(slot.inputs))
+    fetched = await asyncio.gather(*(fetch(i) for i in unique), return_exceptions=True)
+    errors = [r for r in fetched if isinstance(r, Exception)]
+    if errors:
+        logger.error(f"❌ [{label}] Download failed for {slot.key}: {errors[0]}")
+        if on_fetch_error:
+            on_fetch_error(slot.key, errors[0])
+        return None
+    by_input = dict(zip(unique, fetched))
+    t1 = time.perf_counter()
+    result = await slot.process(slot.key, *(by_input[i] for i in slot.inputs))
+    logger.info(f"⏱️ [{label}] {slot.key}: fetch {(t1 - t0) * 1000:.0f} ms, "
+                f"process {(time.perf_counter() - t1) * 1000:.0f} ms")
+    return result
+
+
+async def run_slots(slots, fetch, on_fetch_error=None, label="scan"):
+    """
+    Runs every slot's pipeline concurrently. fetch(input) -> bytes is awaited per input.
+    Returns the process() results in slot order; slots whose fetch failed are left out
+    (after on_fetch_error(key, exc), if given).
+    """
+    logger.info(f"🧩 [{label}] {len(slots)} slot(s), "
+                f"{sum(len(set(s.inputs)) for s in slots)} image(s) through fetch → infer → upload")
+    results = await asyncio.gather(*(_run_slot(s, fetch, on_fetch_error, label) for s in slots))
+    return [r for r in results if r is not None]
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, model_serializer
 from typing import List, Optional
 
 class ImageRequest(BaseModel):
@@ -11,13 +11,25 @@ class BatchAnalysisRequest(BaseModel):
 class AnalysisMetrics(BaseModel):
     success: bool
     best_zone: Optional[str] = None
+    strategy: Optional[str] = None
+    inference_pass: Optional[str] = None
+    inference_ms: Optional[float] = None
     pastern_angle: Optional[float] = None
     hoof_angle: Optional[float] = None
     hpa_dev: Optional[float] = None
     model_confidence: Optional[float] = None
     image_base64: Optional[str] = None
+    image_url: Optional[str] = None  # ?images=url / multipart instead of image_base64
     error: Optional[str] = None
 
+    @model_serializer(mode="wrap")
+    def _omit_unset_image_url(self, handler):
+        # image_url only exists in url / multipart responses; the default inline contract is unchanged.
+        data = handler(self)
+        if data.get("image_url") is None:
+            data.pop("image_url", None)
+        return data
+
 class ImageAnalysisResponse(BaseModel):
     image_id: str
     metrics: AnalysisMetrics
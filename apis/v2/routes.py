@@ -1,4 +1,7 @@
 from fastapi import APIRouter, Request, HTTPException
+from apis.admission import admit_sync_scan, scan_legs
+from apis.executors import run_inference
+from apis.scan_engine import Slot, run_slots
 from apis.v2.schemas import AdvancedScanRequest, AdvancedScanResponse
 from apis.v2.services.inference import get_image_bytes, run_leg_inference
 from apis.v2.services.scoring import calculate_leg_score
@@ -12,6 +15,11 @@ router = APIRouter()
 
 @router.post("/analyze", response_model=AdvancedScanResponse)
 async def analyze_v2(request: AdvancedScanRequest, req: Request):
+    async with admit_sync_scan(scan_legs(request)):
+        return await _analyze_v2(request, req)
+
+
+async def _analyze_v2(request: AdvancedScanRequest, req: Request):
     predictor = req.app.state.predictor
     if not predictor:
         raise HTTPException(status_code=503, detail="Model not initialized")
@@ -23,46 +31,9 @@ async def analyze_v2(request: AdvancedScanRequest, req: Request):
         "backRight": request.backRightLateral
     }
 
-    # 1. Fetch all images concurrently
-    import asyncio
-    
     results = {}
-    leg_keys = []
-    fetch_tasks = []
-    
-    for leg_key, image_input in legs.items():
-        if image_input:
-            leg_keys.append(leg_key)
-            fetch_tasks.append(get_image_bytes(image_input))
-        else:
-            results[f"{leg_key}ScanScore"] = None
-            results[f"{leg_key}Notes"] = None
-            results[f"{leg_key}Condition"] = None
-            results[f"{leg_key}Recommendation"] = None
-            results[f"{leg_key}Quality"] = None
+    slots = []
 
-    # Run downloads in parallel
-    print(f"📡 Downloading {len(fetch_tasks)} images concurrently...")
-    downloaded_images = await asyncio.gather(*fetch_tasks, return_exceptions=True)
-    
-    # Map downloaded bytes back to leg keys for inference
-    leg_data = {}
-    for i, leg_key in enumerate(leg_keys):
-        result = downloaded_images[i]
-        if isinstance(result, Exception):
-            print(f"❌ Download failed for {leg_key}: {result}")
-            results[f"{leg_key}ScanScore"] = None
-            results[f"{leg_key}Notes"] = f"Download failed: {str(result)}"
-            results[f"{leg_key}Condition"] = None
-            results[f"{leg_key}Recommendation"] = None
-            results[f"{leg_key}Quality"] = None
-        else:
-            leg_data[leg_key] = result
-
-    # 2. Parallel Inference (Using ThreadPool to utilize multiple cores if GIL is released)
-    print(f"🧠 Running inference on {len(leg_data)} legs in parallel...")
-    from concurrent.futures import ThreadPoolExecutor
-    
     def process_single_leg(leg_key, img_bytes):
         try:
             prediction = run_leg_inference(predictor, img_bytes)
@@ -70,15 +41,31 @@ async def analyze_v2(request: AdvancedScanRequest, req: Request):
         except Exception as e:
             return leg_key, {"success": False, "error": str(e)}
 
-    # We use a loop to create thread tasks
+    # App-wide inference executor: bounded across concurrent requests.
     # Note: Torch usually releases the GIL during heavy math, so this should scale!
-    loop = asyncio.get_event_loop()
-    with ThreadPoolExecutor(max_workers=4) as pool:
-        inference_tasks = [
-            loop.run_in_executor(pool, process_single_leg, k, b) 
-            for k, b in leg_data.items()
-        ]
-        inference_results = await asyncio.gather(*inference_tasks)
+    async def process_leg(leg_key, img_bytes):
+        return await run_inference(process_single_leg, leg_key, img_bytes)
+
+    def download_failed(leg_key, error):
+        results[f"{leg_key}ScanScore"] = None
+        results[f"{leg_key}Notes"] = f"Download failed: {str(error)}"
+        results[f"{leg_key}Condition"] = None
+        results[f"{leg_key}Recommendation"] = None
+        results[f"{leg_key}Quality"] = None
+
+    for leg_key, image_input in legs.items():
+        if image_input:
+            slots.append(Slot(leg_key, (image_input,), process_leg))
+        else:
+            results[f"{leg_key}ScanScore"] = None
+            results[f"{leg_key}Notes"] = None
+            results[f"{leg_key}Condition"] = None
+            results[f"{leg_key}Recommendation"] = None
+            results[f"{leg_key}Quality"] = None
+
+    # 1-2. Each leg is downloaded and inferred on its own, so one slow download does not hold back the others
+    print(f"🧠 Downloading and running inference on {len(slots)} legs in parallel...")
+    inference_results = await run_slots(slots, get_image_bytes, on_fetch_error=download_failed, label="v2")
 
     # 3. Process results
     leg_scores = []
@@ -1,5 +1,5 @@
 import base64
-import httpx
+from apis.http_client import fetch_image
 from apis.logic import HPAPredictor
 from apis.yolo_predictor import YOLOPredictor
 
@@ -8,10 +8,8 @@ async def get_image_bytes(image_input: str) -> bytes:
     Fetches image bytes from either a URL or a Base64 string.
     """
     if image_input.startswith("http"):
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(image_input, timeout=10.0)
-            resp.raise_for_status()
-            return resp.content
+        # Shared pooled client (apis/http_client.py): streamed, size-capped, header-checked
+        return await fetch_image(image_input)
     else:
         # Assume Base64
         # Strip data:image/jpeg;base64, prefix if present
@@ -23,8 +21,9 @@ def run_leg_inference(predictor: HPAPredictor, image_bytes: bytes, remove_bg: bo
     """
     Runs MMPose inference on a single leg and returns raw results.
     v3 uses remove_bg=True (server cutout); v4 calls with remove_bg=False.
+    Angles only: the overlay is not rendered.
     """
-    return predictor.predict(image_bytes, remove_bg=remove_bg)
+    return predictor.predict(image_bytes, remove_bg=remove_bg).to_metrics()
 
 
 def run_yolo_inference(yolo_predictor: YOLOPredictor, image_bytes: bytes) -> dict:
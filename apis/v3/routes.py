@@ -17,7 +17,7 @@ from apis.v2.services.aggregator import aggregate_scan
 from apis.v2.services.clinical import map_condition, map_clinical_notes, map_recommendation
 import asyncio
 import gc
-from concurrent.futures import ThreadPoolExecutor
+from apis.executors import run_inference
 
 router = APIRouter()
 
@@ -124,7 +124,7 @@ async def analyze_v3(request: AdvancedScanRequest, req: Request):
         else:
             leg_data[leg_key] = downloaded[i]
 
-    # ── 2. Dual-model inference inside ThreadPoolExecutor ────
+    # ── 2. Dual-model inference on the app-wide inference executor ────
     # Each thread handles one leg: runs MMPose then YOLO sequentially.
     # This keeps GPU resource contention low while freeing the async loop.
 
@@ -134,13 +134,8 @@ async def analyze_v3(request: AdvancedScanRequest, req: Request):
         return leg_key, mp, {}  # yl disabled
 
     print(f"🧠 [v3] MMPose-only inference on {len(leg_data)} legs...")
-    loop = asyncio.get_event_loop()
-    with ThreadPoolExecutor(max_workers=4) as pool:
-        tasks = [
-            loop.run_in_executor(pool, process_single_leg, k, b)
-            for k, b in leg_data.items()
-        ]
-        inference_results = await asyncio.gather(*tasks)
+    tasks = [run_inference(process_single_leg, k, b) for k, b in leg_data.items()]
+    inference_results = await asyncio.gather(*tasks)
 
     # ── 3. Build MMPose field dict ───────────────────────────
     mmpose_fields: dict = {}
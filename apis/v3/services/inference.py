@@ -1,5 +1,5 @@
 import base64
-import httpx
+from apis.http_client import fetch_image
 from apis.logic import HPAPredictor
 from apis.yolo_predictor import YOLOPredictor
 
@@ -8,10 +8,8 @@ async def get_image_bytes(image_input: str) -> bytes:
     Fetches image bytes from either a URL or a Base64 string.
     """
     if image_input.startswith("http"):
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(image_input, timeout=10.0)
-            resp.raise_for_status()
-            return resp.content
+        # Shared pooled client (apis/http_client.py): streamed, size-capped, header-checked
+        return await fetch_image(image_input)
     else:
         # Assume Base64
         # Strip data:image/jpeg;base64, prefix if present
@@ -21,9 +19,9 @@ async def get_image_bytes(image_input: str) -> bytes:
 
 def run_leg_inference(predictor: HPAPredictor, image_bytes: bytes) -> dict:
     """
-    Runs MMPose inference on a single leg and returns raw results.
+    Runs MMPose inference on a single leg and returns raw results (angles only, no overlay).
     """
-    return predictor.predict(image_bytes)
+    return predictor.predict(image_bytes).to_metrics()
 
 
 def run_yolo_inference(yolo_predictor: YOLOPredictor, image_bytes: bytes) -> dict:
@@ -6,15 +6,16 @@ API v4 — Same clinical flow as v3, for mobile pre-cutout images.
 """
 
 from fastapi import APIRouter, Request, HTTPException
+from apis.admission import admit_sync_scan, scan_legs
 from apis.v4.schemas import AdvancedScanRequest, AdvancedScanResponse, ModelResult
 from apis.v4.services.inference import get_image_bytes, run_leg_inference, process_frontal_leg_symmetry
 from apis.v2.services.scoring import calculate_leg_score
 from apis.v2.services.quality import map_quality
 from apis.v2.services.aggregator import aggregate_scan
 from apis.v2.services.clinical import map_condition, map_clinical_notes, map_recommendation
-import asyncio
 import gc
-from concurrent.futures import ThreadPoolExecutor
+from apis.executors import run_inference
+from apis.scan_engine import Slot, run_slots
 
 router = APIRouter()
 
@@ -65,6 +66,11 @@ def _build_leg_payload(prediction: dict, leg_key: str) -> tuple[dict, float | No
 
 @router.post("/analyze", response_model=AdvancedScanResponse)
 async def analyze_v4(request: AdvancedScanRequest, req: Request):
+    async with admit_sync_scan(scan_legs(request)):
+        return await _analyze_v4(request, req)
+
+
+async def _analyze_v4(request: AdvancedScanRequest, req: Request):
     predictor = req.app.state.predictor
 
     if not predictor:
@@ -81,30 +87,14 @@ async def analyze_v4(request: AdvancedScanRequest, req: Request):
         "backRightFrontal": request.backRightFrontal,
     }
 
-    leg_keys = []
-    fetch_tasks = []
-    for leg_key, image_input in legs.items():
-        if image_input:
-            leg_keys.append(leg_key)
-            fetch_tasks.append(get_image_bytes(image_input))
-
-    print(f"📡 [v4] Downloading {len(fetch_tasks)} images...")
-    downloaded = await asyncio.gather(*fetch_tasks, return_exceptions=True)
-
-    leg_data: dict[str, bytes] = {}
-    for i, leg_key in enumerate(leg_keys):
-        if isinstance(downloaded[i], Exception):
-            print(f"❌ [v4] Download failed for {leg_key}: {downloaded[i]}")
-        else:
-            leg_data[leg_key] = downloaded[i]
-
-    def process_single_leg(leg_key: str, img_bytes: bytes):
+    async def process_leg(leg_key: str, img_bytes: bytes):
+        # Inference on the inference executor; the frontal upload goes to the io executor.
         try:
             if "Frontal" in leg_key:
-                url = process_frontal_leg_symmetry(img_bytes)
+                url = await process_frontal_leg_symmetry(img_bytes)
                 return leg_key, None, url
             else:
-                mp = run_leg_inference(predictor, img_bytes)
+                mp = await run_inference(run_leg_inference, predictor, img_bytes)
                 return leg_key, mp, None
         except Exception as e:
             if "Frontal" in leg_key:
@@ -115,14 +105,10 @@ async def analyze_v4(request: AdvancedScanRequest, req: Request):
                 err_msg = "We couldn't analyze this image. Please ensure the photo is clear and taken from the correct angle."
                 return leg_key, {"success": False, "error": err_msg}, None
 
-    print(f"🧠 [v4] MMPose inference (no rembg) on {len(leg_data)} slot(s)...")
-    loop = asyncio.get_event_loop()
-    with ThreadPoolExecutor(max_workers=4) as pool:
-        tasks = [
-            loop.run_in_executor(pool, process_single_leg, k, b)
-            for k, b in leg_data.items()
-        ]
-        inference_results = await asyncio.gather(*tasks)
+    slots = [Slot(leg_key, (image_input,), process_leg) for leg_key, image_input in legs.items() if image_input]
+    # Download -> inference per slot (apis/scan_engine.py); failed downloads are left out, as before.
+    print(f"🧠 [v4] MMPose inference (no rembg) on {len(slots)} slot(s)...")
+    inference_results = await run_slots(slots, get_image_bytes, label="v4")
 
     mmpose_fields: dict = {}
     mmpose_scores: list = []
@@ -169,8 +155,7 @@ async def analyze_v4(request: AdvancedScanRequest, req: Request):
 
     aggregation = aggregate_scan(mmpose_scores)
 
-    del leg_data
-    del downloaded
+    del inference_results
     gc.collect()
 
     return AdvancedScanResponse(
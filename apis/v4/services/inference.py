@@ -1,15 +1,15 @@
 import base64
-import httpx
+from apis.http_client import fetch_image
 from apis.logic import HPAPredictor
+from apis.executors import run_inference
+from apis.s3_uploader import upload_image
 
 
 async def get_image_bytes(image_input: str) -> bytes:
     """Fetches image bytes from either a URL or a Base64 string."""
     if image_input.startswith("http"):
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(image_input, timeout=10.0)
-            resp.raise_for_status()
-            return resp.content
+        # Shared pooled client (apis/http_client.py): streamed, size-capped, header-checked
+        return await fetch_image(image_input)
     if "," in image_input:
         image_input = image_input.split(",")[1]
     return base64.b64decode(image_input)
@@ -18,19 +18,19 @@ async def get_image_bytes(image_input: str) -> bytes:
 def run_leg_inference(predictor: HPAPredictor, image_bytes: bytes) -> dict:
     """
     MMPose inference for V4. Images are pre-cutout on mobile; never use rembg.
+    Angles only: the overlay is not rendered.
     """
-    return predictor.predict(image_bytes, remove_bg=False)
+    return predictor.predict(image_bytes, remove_bg=False).to_metrics()
 
 
-def process_frontal_leg_symmetry(image_bytes: bytes) -> str:
+def analyze_frontal_symmetry(image_bytes: bytes) -> bytes | None:
     """
-    Runs leg_symmetry_v2 logic on frontal images and returns an uploaded S3 URL.
+    Runs leg_symmetry_v2 logic on a frontal image and returns the analyzed JPEG bytes (None on failure).
     """
     import tempfile
     import os
     from pathlib import Path
     from leg_symmetry_v2 import process_image
-    from apis.v4.services.upload import upload_image_to_s3
     
     with tempfile.TemporaryDirectory() as tmp_dir:
         tmp_img = Path(tmp_dir) / "input.jpg"
@@ -44,11 +44,21 @@ def process_frontal_leg_symmetry(image_bytes: bytes) -> str:
             
             if output_path.exists():
                 with open(output_path, "rb") as f:
-                    analyzed_bytes = f.read()
-                return upload_image_to_s3(analyzed_bytes, file_extension="jpg")
+                    return f.read()
             else:
                 print(f"❌ Frontal symmetry analysis failed to generate output.")
-                return ""
+                return None
         except Exception as e:
             print(f"❌ Error during frontal symmetry analysis: {e}")
-            return ""
+            return None
+
+
+async def process_frontal_leg_symmetry(image_bytes: bytes) -> str:
+    """
+    Runs leg_symmetry_v2 logic on frontal images and returns an uploaded S3 URL.
+    Analysis runs on the inference executor, the upload on the io executor.
+    """
+    analyzed_bytes = await run_inference(analyze_frontal_symmetry, image_bytes)
+    if not analyzed_bytes:
+        return ""
+    return await upload_image(analyzed_bytes, file_extension="jpg")
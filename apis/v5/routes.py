@@ -7,16 +7,20 @@ API v4 — Same clinical flow as v3, for mobile pre-cutout images.
 
 import logging
 from fastapi import APIRouter, Request, HTTPException
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from starlette.datastructures import UploadFile
+from apis.http_client import get_http_client
+from apis.admission import admit_sync_scan, get_admission, scan_legs
+from apis.scan_engine import Slot, run_slots
 from apis.v5.schemas import AdvancedScanRequest, AdvancedScanResponseV5, ModelResultV5
-from apis.v5.services.inference import get_image_bytes, run_leg_inference, process_frontal_leg_symmetry, process_lateral_leg_overlay
+from apis.v5.services.inference import get_image_bytes, process_frontal_leg_symmetry, process_lateral_leg_overlay, process_lateral_leg_single
 from apis.v2.services.scoring import calculate_leg_score
 from apis.v2.services.quality import map_quality
 from apis.v2.services.aggregator import aggregate_scan
 from apis.v2.services.clinical import map_condition, map_clinical_notes, map_recommendation
 import asyncio
 import gc
-import hashlib
-from concurrent.futures import ThreadPoolExecutor
 
 router = APIRouter()
 
@@ -65,10 +69,97 @@ def _build_leg_payload(prediction: dict, leg_key: str) -> tuple[dict, float | No
     return payload, score
 
 
-async def run_full_scan_logic(request: AdvancedScanRequest, predictor) -> AdvancedScanResponseV5:
+UPLOAD_CHUNK = 256 * 1024
+
+
+async def _read_upload(upload: UploadFile, key: str, max_bytes: int) -> bytearray:
+    """Reads a spooled file part chunk by chunk; 413 as soon as it passes max_bytes."""
+    too_large = HTTPException(status_code=413, detail=f"{key}: image larger than {max_bytes} bytes")
+    if upload.size is not None and upload.size > max_bytes:
+        raise too_large
+    data = bytearray()
+    while chunk := await upload.read(UPLOAD_CHUNK):
+        if len(data) + len(chunk) > max_bytes:
+            raise too_large
+        data += chunk
+    return data
+
+
+async def _parse_scan_form(req: Request, model):
+    """
+    multipart/form-data variant of a v5 scan body. Every slot may be a binary file part or a
+    text part holding a URL / base64 string, exactly as in the JSON body. File parts are spooled
+    by Starlette (memory, then temp file) and read once in chunks; a part over the image size
+    limit is rejected with 413 before more than the limit is held in memory. The request
+    carries an "upload://<slot>" placeholder and the bytes travel alongside.
+    Returns (model instance, {placeholder: bytes}).
+    """
+    max_bytes = get_http_client().max_image_bytes
+    form = await req.form(max_files=len(AdvancedScanRequest.model_fields), max_part_size=max_bytes * 4 // 3 + 1024)
+    fields, uploads = {}, {}
+    try:
+        for key, value in form.multi_items():
+            if isinstance(value, UploadFile):
+                placeholder = f"upload://{key}"
+                uploads[placeholder] = await _read_upload(value, key, max_bytes)
+                fields[key] = placeholder
+            elif value:
+                fields[key] = value
+    finally:
+        await form.close()
+    return _validate_body(model, fields), uploads
+
+
+def _validate_body(model, body):
+    """model.model_validate(body); errors become FastAPI's usual 422 body-validation response."""
+    try:
+        return model.model_validate(body)
+    except ValidationError as e:
+        raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)],
+                                     body=body)
+
+
+async def _parse_scan_body(req: Request, model):
+    """
+    Body of /analyze and /analyze-async, by Content-Type: multipart/form-data goes through
+    _parse_scan_form, anything else is the JSON body as before.
+    Returns (model instance, {placeholder: bytes} or None).
+    """
+    if req.headers.get("content-type", "").lower().startswith("multipart/form-data"):
+        return await _parse_scan_form(req, model)
+    try:
+        body = await req.json()
+    except ValueError:
+        raise RequestValidationError([{"type": "json_invalid", "loc": ("body",), "msg": "JSON decode error",
+                                       "input": {}}])
+    return _validate_body(model, body), None
+
+
+def _scan_body_openapi(model):
+    """OpenAPI request body for a route that parses its body itself (JSON or multipart, same fields)."""
+    schema = model.model_json_schema()
+    form = {**schema, "properties": {name: ({"type": "string"} if name == "scanId" else
+                                            {"type": "string", "format": "binary", "description": "image file or URL"})
+                                     for name in schema["properties"]}}
+    return {"requestBody": {"required": True, "content": {
+        "application/json": {"schema": schema},
+        "multipart/form-data": {"schema": form},
+    }}}
+
+
+async def run_full_scan_logic(request: AdvancedScanRequest, predictor, uploads: dict | None = None) -> AdvancedScanResponseV5:
+    """
+    uploads: raw bytes of multipart file parts, keyed by the "upload://<slot>" placeholder the
+    request carries in that slot (see _parse_scan_form); everything else is fetched / base64-decoded.
+    """
     if not predictor:
         raise ValueError("MMPose model not initialized")
 
+    async def load(image_input):
+        if uploads and image_input in uploads:
+            return get_http_client().check_image(uploads[image_input])
+        return await get_image_bytes(image_input)
+
     # --- Log all fields received in request ---
     req_fields = request.model_dump()
     logging.info(
@@ -92,110 +183,26 @@ async def run_full_scan_logic(request: AdvancedScanRequest, predictor) -> Advanc
         "backRightFrontal": (request.backRightFrontal, request.backRightFrontalProcessed),
     }
 
-    # Gather tasks for download
-    fetch_tasks = []
-
-    lateral_keys = []
-    # Track whether each lateral slot has an overlay pair or just a single processed image
-    lateral_has_overlay = {}
-    for leg_key, (img_orig, img_proc) in lateral_pairs.items():
-        if img_orig and img_proc:
-            # Both provided: original for drawing, processed for inference
-            lateral_keys.append(leg_key)
-            fetch_tasks.append(get_image_bytes(img_orig))
-            fetch_tasks.append(get_image_bytes(img_proc))
-            lateral_has_overlay[leg_key] = True
-        elif img_proc:
-            # Only processed: run inference on it, no overlay
-            lateral_keys.append(leg_key)
-            fetch_tasks.append(get_image_bytes(img_proc))
-            lateral_has_overlay[leg_key] = False
-        elif img_orig:
-            # Only original provided (backward-compat with old clients)
-            lateral_keys.append(leg_key)
-            fetch_tasks.append(get_image_bytes(img_orig))
-            lateral_has_overlay[leg_key] = False
-
-    frontal_keys = []
-    for leg_key, (img_orig, img_proc) in frontal_pairs.items():
-        if img_orig and img_proc:
-            # Both provided (ideal case)
-            frontal_keys.append(leg_key)
-            fetch_tasks.append(get_image_bytes(img_orig))
-            fetch_tasks.append(get_image_bytes(img_proc))
-        elif img_orig or img_proc:
-            # Only one provided — use the same image for both slots.
-            # process_frontal_leg_symmetry can still run geometry analysis.
-            single = img_orig or img_proc
-            frontal_keys.append(leg_key)
-            fetch_tasks.append(get_image_bytes(single))
-            fetch_tasks.append(get_image_bytes(single))
-
-    logging.info(f"📡 [v5] Downloading {len(fetch_tasks)} images...")
-    downloaded = await asyncio.gather(*fetch_tasks, return_exceptions=True)
-
-    # Reconstruct lateral_data mapping
-    lateral_data = {}  # leg_key -> bytes or (bytes_orig, bytes_proc)
-    idx = 0
-    for leg_key in lateral_keys:
-        has_overlay = lateral_has_overlay[leg_key]
-        if has_overlay:
-            res_orig = downloaded[idx]
-            res_proc = downloaded[idx + 1]
-            idx += 2
-            if isinstance(res_orig, Exception) or isinstance(res_proc, Exception):
-                logging.error(f"❌ [v5] Download failed for lateral {leg_key}")
-            else:
-                lateral_data[leg_key] = (res_orig, res_proc)
-        else:
-            res = downloaded[idx]
-            idx += 1
-            if isinstance(res, Exception):
-                logging.error(f"❌ [v5] Download failed for lateral {leg_key}: {res}")
-            else:
-                lateral_data[leg_key] = res  # single bytes
-
-    frontal_data = {}
-    for leg_key in frontal_keys:
-        res_orig = downloaded[idx]
-        res_proc = downloaded[idx + 1]
-        idx += 2
-        if isinstance(res_orig, Exception) or isinstance(res_proc, Exception):
-            logging.error(f"❌ [v5] Download failed for {leg_key}")
-        else:
-            frontal_data[leg_key] = (res_orig, res_proc)
-
-    def process_lateral_leg(leg_key: str, img_data):
+    async def process_lateral_leg(leg_key: str, *images: bytes):
         """Handles both single-image and overlay-pair lateral inference."""
         try:
-            if isinstance(img_data, tuple):
+            if len(images) == 2:
                 # Overlay mode: original + processed
-                img_orig_bytes, img_proc_bytes = img_data
-                mp, url = process_lateral_leg_overlay(predictor, img_orig_bytes, img_proc_bytes)
+                img_orig_bytes, img_proc_bytes = images
+                mp, url = await process_lateral_leg_overlay(predictor, img_orig_bytes, img_proc_bytes)
             else:
-                # Single-image mode: run inference, then upload the annotated image from image_base64.
-                # image_base64 is always populated by HPAPredictor.predict(), so we can always
-                # get an output image even without a separate original image.
-                from apis.v5.services.upload import upload_image_to_s3
-                import base64 as _b64
-                mp = run_leg_inference(predictor, img_data)
-                url = ""
-                output_b64 = mp.get("image_base64")
-                if output_b64:
-                    try:
-                        analyzed_bytes = _b64.b64decode(output_b64)
-                        url = upload_image_to_s3(analyzed_bytes, file_extension="jpg", folder="lateral_overlays") or ""
-                    except Exception as upload_err:
-                        logging.error(f"❌ [v5] {leg_key}: S3 upload failed in single-image mode: {upload_err}")
+                # Single-image mode: run inference, then upload the overlay rendered on the image itself,
+                # so we can always get an output image even without a separate original image.
+                mp, url = await process_lateral_leg_single(predictor, images[0])
         except Exception as e:
             logging.error(f"❌ [v5] Lateral inference failed for {leg_key}: {e}")
             mp = {"success": False, "error": "We couldn't analyze this image. Please ensure the photo is clear and taken from the correct angle."}
             url = None
         return leg_key, mp, url
 
-    def process_frontal_leg(leg_key: str, img_orig: bytes, img_proc: bytes):
+    async def process_frontal_leg(leg_key: str, img_orig: bytes, img_proc: bytes):
         try:
-            url = process_frontal_leg_symmetry(img_orig, img_proc)
+            url = await process_frontal_leg_symmetry(img_orig, img_proc, analyzer=getattr(predictor, "analyze_frontal", None))
             err_msg = None
         except Exception as e:
             url = None
@@ -203,16 +210,25 @@ async def run_full_scan_logic(request: AdvancedScanRequest, predictor) -> Advanc
             logging.error(f"❌ [v5] Frontal inference failed for {leg_key}: {e}")
         return leg_key, err_msg, url
 
-    logging.info(f"🧠 [v5] Processing {len(lateral_data)} lateral and {len(frontal_data)} frontal slot(s)...")
-    loop = asyncio.get_event_loop()
-    with ThreadPoolExecutor(max_workers=1) as pool:
-        tasks = []
-        for k, img_data in lateral_data.items():
-            tasks.append(loop.run_in_executor(pool, process_lateral_leg, k, img_data))
-        for k, (b_orig, b_proc) in frontal_data.items():
-            tasks.append(loop.run_in_executor(pool, process_frontal_leg, k, b_orig, b_proc))
-            
-        inference_results = await asyncio.gather(*tasks)
+    slots = []
+    for leg_key, (img_orig, img_proc) in lateral_pairs.items():
+        if img_orig and img_proc:
+            # Both provided: original for drawing, processed for inference
+            slots.append(Slot(leg_key, (img_orig, img_proc), process_lateral_leg))
+        elif img_proc or img_orig:
+            # Only processed: run inference on it, no overlay.
+            # Only original: backward-compat with old clients.
+            slots.append(Slot(leg_key, (img_proc or img_orig,), process_lateral_leg))
+
+    for leg_key, (img_orig, img_proc) in frontal_pairs.items():
+        if img_orig or img_proc:
+            # Only one provided — use the same image for both slots.
+            # process_frontal_leg_symmetry can still run geometry analysis.
+            slots.append(Slot(leg_key, (img_orig or img_proc, img_proc or img_orig), process_frontal_leg))
+
+    # Each slot is fetched, inferred (inference executor) and uploaded (io executor) on its own,
+    # so one slow download no longer holds back the other legs (see apis/scan_engine.py).
+    inference_results = await run_slots(slots, load, label="v5")
 
     mmpose_fields: dict = {}
     mmpose_scores: list = []
@@ -238,7 +254,7 @@ async def run_full_scan_logic(request: AdvancedScanRequest, predictor) -> Advanc
                 mmpose_fields[f"{leg_key}ImageUrl"] = url
             else:
                 # Log explicitly when inference succeeded but no overlay image was produced.
-                # This catches silent S3 upload failures or missing image_base64 from predict().
+                # This catches silent S3 upload failures or a missing overlay from predict().
                 if mp_pred.get("success"):
                     logging.warning(f"⚠️ [v5] {leg_key}: Inference succeeded (score computed) but ImageUrl is empty — S3 upload may have failed.")
 
@@ -270,9 +286,7 @@ async def run_full_scan_logic(request: AdvancedScanRequest, predictor) -> Advanc
 
     aggregation = aggregate_scan(mmpose_scores)
 
-    del lateral_data
-    del frontal_data
-    del downloaded
+    del inference_results
     gc.collect()
 
     return AdvancedScanResponseV5(
@@ -284,14 +298,25 @@ async def run_full_scan_logic(request: AdvancedScanRequest, predictor) -> Advanc
     )
 
 
-@router.post("/analyze", response_model=AdvancedScanResponseV5)
-async def analyze_v5(request: AdvancedScanRequest, req: Request):
-    """Synchronous endpoint (Legacy behavior)."""
+@router.post("/analyze", response_model=AdvancedScanResponseV5, openapi_extra=_scan_body_openapi(AdvancedScanRequest))
+async def analyze_v5(req: Request):
+    """
+    Synchronous endpoint (Legacy behavior). The body is JSON, or multipart/form-data with the
+    same slot names, each a raw image file part (no base64) or a URL text part.
+    """
+    request, uploads = await _parse_scan_body(req, AdvancedScanRequest)
+    return await _analyze_sync(request, req, uploads)
+
+
+async def _analyze_sync(request: AdvancedScanRequest, req: Request, uploads: dict | None = None):
     predictor = req.app.state.predictor
     if not predictor:
         raise HTTPException(status_code=503, detail="MMPose model not initialized")
     try:
-        return await run_full_scan_logic(request, predictor)
+        async with admit_sync_scan(scan_legs(request)):
+            return await run_full_scan_logic(request, predictor, uploads)
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
@@ -302,13 +327,20 @@ async def analyze_v5(request: AdvancedScanRequest, req: Request):
 from apis.v5.schemas import AsyncScanRequest, AsyncJobResponse
 import uuid
 
-@router.post("/analyze-async", response_model=AsyncJobResponse, status_code=202)
-async def analyze_async_v5(request: AsyncScanRequest, req: Request):
+@router.post("/analyze-async", response_model=AsyncJobResponse, status_code=202,
+             openapi_extra=_scan_body_openapi(AsyncScanRequest))
+async def analyze_async_v5(req: Request):
     """
     Asynchronous endpoint. Immediately returns a job_id (202 Accepted) 
     and processes the full scan in the background. 
     A webhook is fired with the final result.
+    JSON or multipart/form-data body (scanId as a text part, image slots as file or URL parts).
     """
+    request, uploads = await _parse_scan_body(req, AsyncScanRequest)
+    return await _enqueue_async(request, req, uploads)
+
+
+async def _enqueue_async(request: AsyncScanRequest, req: Request, uploads: dict | None = None):
     predictor = req.app.state.predictor
     if not predictor:
         raise HTTPException(status_code=503, detail="MMPose model not initialized")
@@ -322,9 +354,13 @@ async def analyze_async_v5(request: AsyncScanRequest, req: Request):
         "\n".join(f"  • {k}: {v}" for k, v in req_fields.items())
     )
 
-    # Push to queue (implemented in queue_worker.py)
-    from apis.v5.services.queue_worker import enqueue_scan_job
-    await enqueue_scan_job(request, predictor, job_id)
+    # Persist to the job queue (implemented in queue_worker.py / job_store.py)
+    from apis.v5.services.queue_worker import enqueue_scan_job, get_job_store, queue_stats
+    if get_job_store() is None:
+        raise HTTPException(status_code=503, detail="Job queue not running")
+    if get_admission():
+        get_admission().check_async(await asyncio.to_thread(queue_stats))
+    await enqueue_scan_job(request, job_id, uploads=uploads)
 
     return AsyncJobResponse(
         job_id=job_id,
@@ -333,3 +369,39 @@ async def analyze_async_v5(request: AsyncScanRequest, req: Request):
         message="Scan is queued. A webhook will be sent upon completion."
     )
 
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """
+    Status of an /analyze-async job: queued | running | done | failed, with the queue
+    position and an ETA from recent service times; the webhook payload once finished.
+    """
+    from apis.v5.services.queue_worker import get_job_store, get_webhook_outbox, consumer_count
+    store = get_job_store()
+    if store is None:
+        raise HTTPException(status_code=503, detail="Job queue not running")
+    job = await asyncio.to_thread(store.get, job_id, consumer_count())
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job["webhook"] = await asyncio.to_thread(get_webhook_outbox().job_status, job_id)
+    return job
+
+
+@router.get("/webhooks/dead-letters")
+async def list_dead_letters(limit: int = 100):
+    """Webhook payloads that exhausted their delivery attempts."""
+    from apis.v5.services.queue_worker import get_webhook_outbox
+    outbox = get_webhook_outbox()
+    if outbox is None:
+        raise HTTPException(status_code=503, detail="Job queue not running")
+    return {"dead_letters": await asyncio.to_thread(outbox.dead_letters, limit)}
+
+
+@router.post("/webhooks/dead-letters/replay")
+async def replay_dead_letters(id: int | None = None):
+    """Requeues one dead letter (?id=) or all of them for delivery."""
+    from apis.v5.services.queue_worker import get_webhook_outbox
+    outbox = get_webhook_outbox()
+    if outbox is None:
+        raise HTTPException(status_code=503, detail="Job queue not running")
+    return {"requeued": await asyncio.to_thread(outbox.replay, id)}
@@ -1,8 +1,11 @@
 import base64
-import httpx
+from apis.http_client import fetch_image
 import logging
 import threading
 from apis.logic import HPAPredictor
+from apis.result_cache import get_result_cache, uncached
+from apis.executors import run_inference
+from apis.s3_uploader import upload_image
 
 _frontal_mmpose = None
 _frontal_mmpose_lock = threading.Lock()
@@ -28,10 +31,8 @@ def get_frontal_mmpose():
 async def get_image_bytes(image_input: str) -> bytes:
     """Fetches image bytes from either a URL or a Base64 string."""
     if image_input.startswith("http"):
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(image_input, timeout=10.0)
-            resp.raise_for_status()
-            return resp.content
+        # Shared pooled client (apis/http_client.py): streamed, size-capped, header-checked
+        return await fetch_image(image_input)
     if "," in image_input:
         image_input = image_input.split(",")[1]
     return base64.b64decode(image_input)
@@ -40,19 +41,20 @@ async def get_image_bytes(image_input: str) -> bytes:
 def run_leg_inference(predictor: HPAPredictor, image_bytes: bytes) -> dict:
     """
     MMPose inference for V4. Images are pre-cutout on mobile; never use rembg.
+    Angles only: the overlay is not rendered.
     """
-    return predictor.predict(image_bytes, remove_bg=False)
+    return predictor.predict(image_bytes, remove_bg=False).to_metrics()
 
 
-def process_frontal_leg_symmetry(image_bytes_original: bytes, image_bytes_processed: bytes) -> str:
+def analyze_frontal(image_bytes_original: bytes, image_bytes_processed: bytes, inferencer=None, max_retries: int = 3) -> bytes | None:
     """
-    Runs leg_symmetry_v3 logic on paired frontal images and returns an uploaded S3 URL.
+    Runs leg_symmetry_v3 on a paired frontal image and returns the analyzed JPEG bytes (None if every attempt failed).
+    Also executed inside the inference worker processes (worker_pool.py).
     """
     import tempfile
     import os
     from pathlib import Path
     from leg_symmetry_v3 import process_image
-    from apis.v5.services.upload import upload_image_to_s3
 
     with tempfile.TemporaryDirectory() as tmp_dir:
         tmp_original = Path(tmp_dir) / "original.jpg"
@@ -65,8 +67,8 @@ def process_frontal_leg_symmetry(image_bytes_original: bytes, image_bytes_proces
 
         output_path = Path(tmp_dir) / "original_analyzed.jpg"
 
-        max_retries = 3
-        inferencer = get_frontal_mmpose()
+        if inferencer is None:
+            inferencer = get_frontal_mmpose()
 
         for attempt in range(max_retries):
             try:
@@ -74,15 +76,8 @@ def process_frontal_leg_symmetry(image_bytes_original: bytes, image_bytes_proces
 
                 if output_path.exists():
                     with open(output_path, "rb") as f:
-                        analyzed_bytes = f.read()
-
-                    url = upload_image_to_s3(analyzed_bytes, file_extension="jpg")
-                    if url:
-                        return url
-                    else:
-                        logging.warning(f"Attempt {attempt + 1}: S3 upload failed to return URL.")
-                else:
-                    logging.warning(f"Attempt {attempt + 1}: Frontal analysis failed to generate output image.")
+                        return f.read()
+                logging.warning(f"Attempt {attempt + 1}: Frontal analysis failed to generate output image.")
             except Exception as e:
                 logging.error(f"Attempt {attempt + 1}: Error during frontal symmetry analysis: {e}", exc_info=True)
 
@@ -90,13 +85,41 @@ def process_frontal_leg_symmetry(image_bytes_original: bytes, image_bytes_proces
             if output_path.exists():
                 os.remove(output_path)
 
-        logging.error("All 3 attempts to process the frontal image failed. Gracefully falling back to the original image.")
-        # Fallback: Upload the original unanalyzed image so the user doesn't see a broken gray box
-        fallback_url = upload_image_to_s3(image_bytes_original, file_extension="jpg")
-        return fallback_url if fallback_url else ""
+    logging.error(f"All {max_retries} attempts to process the frontal image failed.")
+    return None
 
 
-def process_lateral_leg_overlay(
+async def process_frontal_leg_symmetry(image_bytes_original: bytes, image_bytes_processed: bytes, analyzer=None) -> str:
+    """
+    Runs leg_symmetry_v3 logic on paired frontal images and returns an uploaded S3 URL.
+    analyzer: optional drop-in for analyze_frontal (e.g. InferenceWorkerPool.analyze_frontal,
+    which runs the analysis in a worker process).
+    Analysis runs on the inference executor, the upload on the io executor.
+    """
+    # Repeat frontal pairs reuse the already-uploaded analyzed image (fallback uploads are never cached).
+    cache = get_result_cache()
+    cache_key = cache.key("frontal", image_bytes_original, image_bytes_processed) if cache else None
+    if cache:
+        cached = cache.get(cache_key)
+        if cached:
+            return cached["url"]
+
+    analyzed_bytes = await run_inference(analyzer or analyze_frontal, image_bytes_original, image_bytes_processed)
+    if analyzed_bytes:
+        url = await upload_image(analyzed_bytes, file_extension="jpg")
+        if url:
+            if cache:
+                cache.put(cache_key, {"url": url})
+            return url
+        logging.warning("S3 upload of the analyzed frontal image failed to return URL.")
+
+    logging.error("Frontal analysis unavailable. Gracefully falling back to the original image.")
+    # Fallback: Upload the original unanalyzed image so the user doesn't see a broken gray box
+    fallback_url = await upload_image(image_bytes_original, file_extension="jpg")
+    return fallback_url if fallback_url else ""
+
+
+async def process_lateral_leg_overlay(
     predictor: HPAPredictor,
     image_bytes_original: bytes,
     image_bytes_processed: bytes,
@@ -104,33 +127,69 @@ def process_lateral_leg_overlay(
     """
     Runs HPA inference on the background-removed lateral image (processed),
     then draws the keypoints/angle lines on the original lateral image and
-    uploads it to S3.
+    uploads it to S3 (inference on the inference executor, upload on the io executor).
 
     Returns:
         (metrics_dict, s3_url)
-        metrics_dict — same structure as HPAPredictor.predict()
+        metrics_dict — LegResult.to_metrics() of the HPAPredictor.predict() result
         s3_url       — URL of the annotated original image (or "" on failure)
     """
-    from apis.v5.services.upload import upload_image_to_s3
-
-    # Run inference on the background-removed image; draw overlay on original
-    metrics = predictor.predict(
+    # Repeat pairs skip inference and upload.
+    cache = get_result_cache()
+    cache_key = cache.key("lateral_overlay", image_bytes_original, image_bytes_processed) if cache else None
+    if cache:
+        cached = cache.get(cache_key)
+        if cached:
+            return cached["metrics"], cached["url"]
+
+    # Run inference on the background-removed image; draw overlay on original.
+    # Not through CachedPredictor: the {metrics, url} entry above already covers this pair.
+    result = await run_inference(
+        uncached(predictor).predict,
         image_bytes_processed,
         remove_bg=False,
         orig_img_bytes=image_bytes_original,
+        render=True,
     )
 
+    metrics = result.to_metrics()
+    url = await _upload_overlay(result)
+    if cache and url:
+        cache.put(cache_key, {"metrics": metrics, "url": url})
+    return metrics, url
+
+
+async def process_lateral_leg_single(predictor: HPAPredictor, image_bytes: bytes) -> tuple[dict, str]:
+    """
+    Single-image lateral slot: inference on the (pre-cutout) image, then upload of the annotated image.
+    Same return shape and caching as process_lateral_leg_overlay.
+    """
+    cache = get_result_cache()
+    cache_key = cache.key("lateral_single", image_bytes) if cache else None
+    if cache:
+        cached = cache.get(cache_key)
+        if cached:
+            return cached["metrics"], cached["url"]
+
+    result = await run_inference(uncached(predictor).predict, image_bytes, remove_bg=False, render=True)
+    metrics = result.to_metrics()
+    url = await _upload_overlay(result)
+    if cache and url:
+        cache.put(cache_key, {"metrics": metrics, "url": url})
+    return metrics, url
+
+
+async def _upload_overlay(result) -> str:
+    """Uploads the rendered overlay (result.image, already encoded) on the io executor; returns its URL or ""."""
     url = ""
-    output_b64 = metrics.get("image_base64")
-    logging.info(f"🖼️ [lateral_overlay] image_base64 present: {bool(output_b64)}, success: {metrics.get('success')}")
-    if output_b64:
+    logging.info(f"🖼️ [lateral_overlay] overlay present: {result.image is not None}, success: {result.success}")
+    if result.image:
         try:
-            analyzed_bytes = base64.b64decode(output_b64)
-            url = upload_image_to_s3(analyzed_bytes, file_extension="jpg", folder="lateral_overlays") or ""
+            url = await upload_image(result.image, file_extension=result.image_format, folder="lateral_overlays") or ""
             logging.info(f"🖼️ [lateral_overlay] S3 upload result: {url!r}")
         except Exception as e:
             logging.error(f"Failed to upload lateral overlay image to S3: {e}", exc_info=True)
     else:
-        logging.warning("🖼️ [lateral_overlay] No image_base64 in metrics — skipping S3 upload.")
+        logging.warning("🖼️ [lateral_overlay] No overlay rendered — skipping S3 upload.")
 
-    return metrics, url
+    return url
@@ -0,0 +1,293 @@
+"""
+Durable store for /api/v5/analyze-async jobs.
+
+Jobs used to live in an in-process asyncio.Queue: a restart dropped every queued scan.
+JobStore is the interface the queue worker consumes; SQLiteJobStore (WAL mode, one file
+shared by every gunicorn worker on the host) is the default backend. A broker-backed
+store only has to implement the same methods.
+
+State machine: queued -> running -> done | failed
+- claim() atomically moves the oldest queued job to running under a lease
+- running consumers heartbeat() their lease; a job whose lease expired (crash, kill -9)
+  is claimable again, up to max_attempts; the claim after that returns it as "abandoned",
+  and the consumer finishes it as failed with a failure webhook like any other failed job
+- multipart uploads are stored with the job and deleted once it finishes
+- finish() also writes the job's webhook into the outbox table of the same database
+  (webhook_outbox.py) in the same transaction, so a finished job always gets delivered
+- the service times of recently finished jobs feed the queue position ETA
+- finished jobs (and their results) are deleted after `retention` seconds (prune())
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from apis.v5.services.webhook_outbox import OUTBOX_SCHEMA, insert_webhook
+
+logger = logging.getLogger(__name__)
+
+JOB_STATES = ("queued", "running", "done", "failed")
+
+
+class JobStore(ABC):
+    """Interface of a job queue backend (all methods are blocking; call them off the event loop)."""
+
+    @abstractmethod
+    def enqueue(self, job_id, scan_id, request, uploads=None):
+        ...
+
+    @abstractmethod
+    def claim(self, worker_id):
+        """
+        Next runnable job as {"job_id", "request", "uploads", "attempts", "abandoned"}, or None.
+        abandoned: the job exceeded max_attempts; the consumer must finish() it as failed.
+        """
+
+    @abstractmethod
+    def heartbeat(self, job_id, worker_id):
+        ...
+
+    @abstractmethod
+    def finish(self, job_id, status, result=None, error=None, webhook=None):
+        """
+        Marks the job done / failed. webhook: (url, payload) to queue for delivery; must be
+        persisted atomically with the status change (the outbox reads it from the same store).
+        """
+
+    @abstractmethod
+    def release(self, worker_id):
+        """Requeues the worker's running jobs (graceful shutdown) without counting the attempt."""
+
+    @abstractmethod
+    def get(self, job_id, consumers=1):
+        """Job status dict (see SQLiteJobStore.get) or None."""
+
+    @abstractmethod
+    def prune(self):
+        """Deletes finished jobs past the retention period; returns the number deleted."""
+
+    @abstractmethod
+    def stats(self):
+        ...
+
+    def close(self):
+        pass
+
+
+class SQLiteJobStore(JobStore):
+    """
+    path:          SQLite database file (WAL mode)
+    lease:         seconds a claimed job stays owned without a heartbeat
+    max_attempts:  claims before a job that keeps dying is marked failed
+    eta_window:    finished jobs averaged for the ETA
+    retention:     seconds finished jobs are kept before prune() deletes them
+    """
+
+    def __init__(self, path, lease=120.0, max_attempts=3, eta_window=50, retention=7 * 86400.0):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.eta_window = eta_window
+        self.retention = retention
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id      TEXT UNIQUE NOT NULL,
+                    scan_id     TEXT,
+                    status      TEXT NOT NULL,
+                    request     TEXT NOT NULL,
+                    result      TEXT,
+                    error       TEXT,
+                    attempts    INTEGER NOT NULL DEFAULT 0,
+                    worker      TEXT,
+                    lease_until REAL,
+                    created_at  REAL NOT NULL,
+                    started_at  REAL,
+                    finished_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_status_seq ON jobs (status, seq);
+                CREATE INDEX IF NOT EXISTS jobs_status_finished ON jobs (status, finished_at);
+                CREATE TABLE IF NOT EXISTS job_uploads (
+                    job_id      TEXT NOT NULL,
+                    placeholder TEXT NOT NULL,
+                    data        BLOB NOT NULL,
+                    PRIMARY KEY (job_id, placeholder)
+                );
+            """)
+            self._conn.executescript(OUTBOX_SCHEMA)
+        logger.info(f"🗄️ Job store: {path} (WAL, lease={lease}s, max_attempts={max_attempts})")
+
+    def enqueue(self, job_id, scan_id, request, uploads=None):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, scan_id, status, request, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                    (job_id, scan_id, json.dumps(request), time.time()),
+                )
+                self._conn.executemany(
+                    "INSERT INTO job_uploads (job_id, placeholder, data) VALUES (?, ?, ?)",
+                    [(job_id, k, bytes(v)) for k, v in (uploads or {}).items()],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def claim(self, worker_id):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # SELECT + UPDATE under the write lock (no UPDATE ... RETURNING: that needs SQLite 3.35)
+                row = self._conn.execute(
+                    "SELECT seq, job_id, request, attempts + 1 AS attempts FROM jobs WHERE status = 'queued' "
+                    "OR (status = 'running' AND lease_until < ?) ORDER BY seq LIMIT 1", (now,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, attempts = ?, lease_until = ?, "
+                        "started_at = ? WHERE seq = ?",
+                        (worker_id, row["attempts"], now + self.lease, now, row["seq"]),
+                    )
+                # A job whose consumer died too often is handed out once more, only to be failed.
+                abandoned = row is not None and row["attempts"] > self.max_attempts
+                uploads = {}
+                if row is not None and not abandoned:
+                    uploads = {r["placeholder"]: r["data"] for r in self._conn.execute(
+                        "SELECT placeholder, data FROM job_uploads WHERE job_id = ?", (row["job_id"],))}
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        if abandoned:
+            logger.error(f"❌ [JobStore] Job {row['job_id']} abandoned after {self.max_attempts} attempts")
+        elif row["attempts"] > 1:
+            logger.warning(f"♻️ [JobStore] Resuming job {row['job_id']} (attempt {row['attempts']})")
+        return {"job_id": row["job_id"], "request": json.loads(row["request"]),
+                "uploads": uploads or None, "attempts": row["attempts"], "abandoned": abandoned}
+
+    def heartbeat(self, job_id, worker_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                (time.time() + self.lease, job_id, worker_id),
+            )
+
+    def finish(self, job_id, status, result=None, error=None, webhook=None):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL "
+                    "WHERE job_id = ?",
+                    (status, json.dumps(result, default=str) if result is not None else None, error, time.time(), job_id),
+                )
+                self._conn.execute("DELETE FROM job_uploads WHERE job_id = ?", (job_id,))
+                if webhook is not None:
+                    insert_webhook(self._conn, job_id, *webhook)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def release(self, worker_id):
+        with self._lock:
+            released = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = attempts - 1, worker = NULL, lease_until = NULL, "
+                "started_at = NULL WHERE worker = ? AND status = 'running'", (worker_id,),
+            ).rowcount
+        if released:
+            logger.info(f"↩️ [JobStore] Requeued {released} interrupted job(s)")
+        return released
+
+    def prune(self):
+        with self._lock:
+            count = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - self.retention,),
+            ).rowcount
+        if count:
+            logger.info(f"🧹 [JobStore] Pruned {count} finished job(s)")
+        return count
+
+    def _avg_service_s(self):
+        row = self._conn.execute(
+            "SELECT AVG(finished_at - started_at) FROM (SELECT finished_at, started_at FROM jobs "
+            "WHERE status = 'done' ORDER BY finished_at DESC LIMIT ?)", (self.eta_window,),
+        ).fetchone()
+        return row[0]
+
+    def get(self, job_id, consumers=1):
+        """
+        Status dict: job_id, scanId, status, attempts, timestamps, error, result (when done),
+        position (jobs ahead while queued) and eta_seconds (from recent service times).
+        """
+        with self._lock:
+            job = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            avg = self._avg_service_s()
+            position = None
+            if job["status"] == "queued":
+                position = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND seq < ?", (job["seq"],)).fetchone()[0]
+
+        eta = None
+        if avg is not None:
+            if job["status"] == "queued":
+                # Whole rounds of `consumers` jobs ahead, then this job's own service time.
+                eta = (position // max(1, consumers) + 1) * avg
+            elif job["status"] == "running":
+                eta = max(0.0, avg - (time.time() - job["started_at"]))
+        return {
+            "job_id": job["job_id"],
+            "scanId": job["scan_id"],
+            "status": job["status"],
+            "attempts": job["attempts"],
+            "position": position,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "error": job["error"],
+            "result": json.loads(job["result"]) if job["result"] else None,
+        }
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            avg = self._avg_service_s()
+        return {"backend": "sqlite", "path": self.path,
+                **{state: counts.get(state, 0) for state in JOB_STATES},
+                "avg_service_s": round(avg, 2) if avg is not None else None}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def build_job_store(url, **kwargs):
+    """
+    Job store from a URL: "sqlite:///<relative path>", "sqlite:////<absolute path>" or a bare path.
+    Other schemes need a backend implementation.
+    """
+    if "://" not in url:
+        return SQLiteJobStore(url, **kwargs)
+    scheme, path = url.split("://", 1)
+    if scheme == "sqlite":
+        return SQLiteJobStore(path[1:] if path.startswith("/") else path, **kwargs)
+    raise ValueError(f"Unsupported job store backend {scheme!r} (available: sqlite)")
@@ -1,142 +1,195 @@
 import asyncio
 import logging
-import httpx
-import json
 import os
+import uuid
 from dotenv import load_dotenv
-from dataclasses import dataclass
-from typing import Any
 from apis.v5.schemas import AsyncScanRequest, WebhookPayload, AdvancedScanResponseV5
 from apis.v5.routes import run_full_scan_logic
+from apis.v5.services.job_store import build_job_store
+from apis.v5.services.webhook_outbox import WebhookOutbox
+from apis.executors import current_lane
 
-# The global in-memory queue
-_scan_queue: asyncio.Queue = asyncio.Queue()
-_worker_task: asyncio.Task = None
+# Durable job queue (SQLite WAL by default, see job_store.py) drained by N consumer tasks.
+# Results are handed to the webhook outbox (webhook_outbox.py, same database as the jobs), so consumers never wait on the Node server.
+_store = None
+_outbox = None
+_predictor = None
+_consumers: list = []
+_wakeup: asyncio.Event | None = None
+_worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
 
-@dataclass
-class ScanJob:
-    job_id: str
-    request: AsyncScanRequest
-    predictor: Any  # HPAPredictor instance
+POLL_INTERVAL = 1.0  # seconds; picks up jobs enqueued by other processes sharing the store
+PRUNE_INTERVAL = 3600.0  # seconds between deletions of finished jobs past their retention
+_pruner: asyncio.Task | None = None
 
 
-async def enqueue_scan_job(request: AsyncScanRequest, predictor: Any, job_id: str):
-    """Pushes a scan job to the queue."""
-    job = ScanJob(job_id=job_id, request=request, predictor=predictor)
-    await _scan_queue.put(job)
-    logging.info(f"📥 [Queue] Job {job_id} for scanId {request.scanId} added. Queue size: {_scan_queue.qsize()}")
+def get_job_store():
+    return _store
 
 
-async def _send_webhook(webhook_url: str, payload: dict, max_retries: int = 3, auth_token: str = None):
-    """Sends the webhook with exponential backoff retries."""
-    headers = {
-        "ngrok-skip-browser-warning": "true",
-        "Content-Type": "application/json"
-    }
-    if auth_token:
-        headers["Authorization"] = auth_token
+def get_webhook_outbox():
+    return _outbox
 
+
+def queue_stats():
+    if _store is None:
+        return None
+    return {**_store.stats(), "consumers": len(_consumers), "webhooks": _outbox.stats() if _outbox else None}
+
+
+def consumer_count():
+    return len(_consumers)
+
+
+async def enqueue_scan_job(request: AsyncScanRequest, job_id: str, uploads: dict | None = None):
+    """Persists a scan job (and its multipart uploads) and wakes a consumer."""
+    await asyncio.to_thread(_store.enqueue, job_id, request.scanId, request.model_dump(), uploads)
+    if _wakeup is not None:
+        _wakeup.set()
+    logging.info(f"📥 [Queue] Job {job_id} for scanId {request.scanId} persisted ({len(uploads or {})} upload(s)).")
+
+
+async def _heartbeat(job_id: str):
+    """Renews the job's lease while it runs, so other processes never take it over."""
+    while True:
+        await asyncio.sleep(_store.lease / 3)
+        await asyncio.to_thread(_store.heartbeat, job_id, _worker_id)
+
+
+async def _process_job(job: dict):
+    job_id = job["job_id"]
+    # Raw scanId for the failure webhook; the request is validated inside the try below, so a
+    # stored request that no longer validates fails the job instead of crashing every claim.
+    scan_id = str(job["request"].get("scanId") or "")
+    logging.info(
+        f"⚙️ [QueueWorker] Processing job {job_id} (scanId: '{scan_id}', attempt {job['attempts']}) with request fields:\n" +
+        "\n".join(f"  • {k}: {v}" for k, v in job["request"].items())
+    )
+
+    heartbeat = asyncio.create_task(_heartbeat(job_id))
     try:
-        body_str = json.dumps(payload, default=str)
+        if job["abandoned"]:
+            # Its consumer died on every attempt: report the failure instead of retrying again.
+            raise RuntimeError("Abandoned after repeated worker crashes")
+        request = AsyncScanRequest.model_validate(job["request"])
+        # Run the actual inference logic
+        result: AdvancedScanResponseV5 = await run_full_scan_logic(request, _predictor, job["uploads"])
+
+        # Build success payload
+        payload = WebhookPayload(
+            scanId=scan_id,
+            scanScore=result.scanScore,
+            notes=result.notes,
+            quality=result.quality,
+            mmpose=result.mmpose,
+            yolo=result.yolo
+        )
+        status, error = "done", None
+
     except Exception as e:
-        body_str = f"<JSON SERIALIZATION FAILED: {e}>"
-    logging.info(f"📋 [Webhook] Full JSON body being sent:\n{body_str[:2000]}")
-
-    async with httpx.AsyncClient() as client:
-        for attempt in range(1, max_retries + 1):
-            try:
-                logging.info(f"🚀 [Webhook] Attempt {attempt} sending to {webhook_url}")
-                response = await client.post(webhook_url, content=body_str.encode('utf-8'), headers=headers, timeout=120.0)
-                if response.is_error:
-                    logging.error(f"❌ [Webhook] Response Status {response.status_code} Body: {response.text}")
-                response.raise_for_status()
-                logging.info(f"✅ [Webhook] Successfully delivered to {webhook_url}")
-                return
-            except Exception as e:
-                logging.warning(f"⚠️ [Webhook] Attempt {attempt} failed: {e}")
-                if attempt < max_retries:
-                    await asyncio.sleep(2 ** attempt)  # 2s, 4s
-                else:
-                    logging.error(f"❌ [Webhook] All {max_retries} attempts failed for {webhook_url}.")
-
-
-async def _worker_loop():
-    """Background worker loop that consumes jobs from the queue."""
-    logging.info("🛠️ [QueueWorker] Started background worker loop.")
+        logging.error(f"❌ [QueueWorker] Job {job_id} failed: {e}", exc_info=True)
+        # Build failure payload
+        payload = WebhookPayload(
+            scanId=scan_id,
+            error=str(e)
+        )
+        status, error = "failed", str(e)
+    finally:
+        heartbeat.cancel()
+
+    payload_dict = payload.model_dump(exclude_none=True)
+
+    # Read static webhook base URL from .env
+    load_dotenv(override=True)
+    node_base_url = os.getenv("NODE_BASE_URL")
+    webhook = None
+    if node_base_url:
+        webhook = (f"{node_base_url.rstrip('/')}/v1/webhook/horse-scan", payload_dict)
+    else:
+        logging.error("❌ [QueueWorker] NODE_BASE_URL is not set in .env! Cannot send results.")
+
+    # Job status and webhook are committed together (one transaction in the job store's database).
+    await asyncio.to_thread(_store.finish, job_id, status, payload_dict, error, webhook)
+    if webhook:
+        _outbox.notify()
+        logging.info(f"📤 [QueueWorker] Queued webhook for scanId='{scan_id}' with keys: {list(payload_dict.keys())}")
+
+
+async def _worker_loop(index: int):
+    """Consumer loop: claims jobs from the store until cancelled."""
+    logging.info(f"🛠️ [QueueWorker] Started consumer {index}.")
+    # Bulk lane: async jobs may only hold part of the inference threads (see executors.py).
+    current_lane.set("async")
     while True:
         try:
-            job: ScanJob = await _scan_queue.get()
+            job = await asyncio.to_thread(_store.claim, _worker_id)
+            if job is None:
+                _wakeup.clear()
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await _process_job(job)
         except asyncio.CancelledError:
-            logging.info("🛑 [QueueWorker] Worker loop cancelled.")
+            logging.info(f"🛑 [QueueWorker] Consumer {index} cancelled.")
             break
-
-        try:
-            scan_id = job.request.scanId
-            req_fields = job.request.model_dump()
-            logging.info(
-                f"⚙️ [QueueWorker] Processing job {job.job_id} (scanId: '{scan_id}') with request fields:\n" +
-                "\n".join(f"  • {k}: {v}" for k, v in req_fields.items())
-            )
-
-            try:
-                # Run the actual inference logic
-                result: AdvancedScanResponseV5 = await run_full_scan_logic(job.request, job.predictor)
-
-                # Build success payload
-                payload = WebhookPayload(
-                    scanId=scan_id,
-                    scanScore=result.scanScore,
-                    notes=result.notes,
-                    quality=result.quality,
-                    mmpose=result.mmpose,
-                    yolo=result.yolo
-                )
-
-            except Exception as e:
-                logging.error(f"❌ [QueueWorker] Job {job.job_id} failed: {e}", exc_info=True)
-                # Build failure payload
-                payload = WebhookPayload(
-                    scanId=scan_id,
-                    error=str(e)
-                )
-
-            # Send Webhook — convert to dict for httpx
-            payload_dict = payload.model_dump(exclude_none=True)
-            logging.info(f"📤 [QueueWorker] Delivering payload for scanId='{scan_id}' with keys: {list(payload_dict.keys())}")
-
-            # Read static webhook base URL and Auth Token from .env
-            load_dotenv(override=True)
-            node_base_url = os.getenv("NODE_BASE_URL")
-            auth_token = os.getenv("WEBHOOK_AUTH_TOKEN")
-
-            if node_base_url:
-                webhook_url = f"{node_base_url.rstrip('/')}/v1/webhook/horse-scan"
-                await _send_webhook(webhook_url, payload_dict, auth_token=auth_token)
-            else:
-                logging.error("❌ [QueueWorker] NODE_BASE_URL is not set in .env! Cannot send results.")
-
         except Exception as e:
             logging.error(f"❌ [QueueWorker] Unexpected error in worker loop: {e}", exc_info=True)
-        finally:
-            _scan_queue.task_done()
+            await asyncio.sleep(POLL_INTERVAL)
 
 
-def start_queue_worker():
-    """Starts the background worker task."""
-    global _worker_task
-    if _worker_task is None:
-        _worker_task = asyncio.create_task(_worker_loop())
+async def _prune_loop():
+    while True:
+        try:
+            await asyncio.to_thread(_store.prune)
+        except Exception as e:
+            logging.error(f"❌ [QueueWorker] Job prune failed: {e}")
+        await asyncio.sleep(PRUNE_INTERVAL)
+
+
+def start_queue_worker(predictor, store_url: str, concurrency: int = 1, job_retention: float = 7 * 86400.0,
+                       **outbox_kwargs):
+    """
+    Opens the job store and starts `concurrency` consumer tasks plus the webhook outbox
+    senders. Jobs left running by a crashed process are picked up again once their lease expires.
+    Finished jobs are deleted after job_retention seconds.
+    """
+    global _store, _outbox, _predictor, _wakeup, _pruner
+    if _consumers:
+        return
+    _store = build_job_store(store_url, retention=job_retention)
+    _outbox = WebhookOutbox(_store.path, **outbox_kwargs)
+    _outbox.start()
+    _predictor = predictor
+    _wakeup = asyncio.Event()
+    for i in range(max(1, concurrency)):
+        _consumers.append(asyncio.create_task(_worker_loop(i)))
+    _pruner = asyncio.create_task(_prune_loop())
+    logging.info(f"🛠️ [QueueWorker] {len(_consumers)} consumer(s) on {store_url}: {_store.stats()}")
 
 
 async def stop_queue_worker():
-    """Stops the background worker task gracefully."""
-    global _worker_task
-    if _worker_task:
-        _worker_task.cancel()
+    """
+    Stops the consumers. Jobs interrupted mid-scan go back to the queue; after a crash
+    they are resumed (by this or another process) once their lease expires.
+    """
+    global _store, _outbox, _pruner
+    tasks = _consumers + ([_pruner] if _pruner else [])
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
         try:
-            await _worker_task
+            await task
         except asyncio.CancelledError:
             pass
-        _worker_task = None
-        logging.info("🛑 [QueueWorker] Stopped gracefully.")
-
+    _consumers.clear()
+    _pruner = None
+    if _store is not None:
+        _store.release(_worker_id)
+        _store.close()
+        _store = None
+    if _outbox is not None:
+        await _outbox.stop()
+        _outbox = None
+    logging.info("🛑 [QueueWorker] Stopped gracefully.")
@@ -0,0 +1,289 @@
+"""
+Webhook outbox for /api/v5/analyze-async results.
+
+Scan consumers used to await the webhook POST inline, so a slow or down Node server
+(3 tries x 120 s plus backoff) held a consumer for minutes. Now a finished job only
+writes its payload to the outbox; a separate pool of sender tasks delivers it.
+
+- the webhook_outbox table lives in the job store's database and the row is inserted
+  by JobStore.finish in the same transaction that marks the job done / failed, so a
+  crash can never leave a finished job without a webhook (insert_webhook)
+- one keep-alive httpx.AsyncClient shared by all senders
+- per-host concurrency limit, so one slow target cannot take every sender
+- retries with full-jitter exponential backoff (random delay in [0, min(cap, base * 2^n)])
+- after max_attempts a payload is parked as "dead" (dead-letter store); replay() puts
+  it back in the queue
+- delivered rows (with their payloads) are pruned after `retention` seconds; dead
+  letters are kept until replayed
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_STATES = ("pending", "sending", "delivered", "dead")
+
+OUTBOX_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS webhook_outbox (
+        id              INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id          TEXT,
+        url             TEXT NOT NULL,
+        payload         TEXT NOT NULL,
+        status          TEXT NOT NULL,
+        attempts        INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        lease_until     REAL,
+        last_error      TEXT,
+        created_at      REAL NOT NULL,
+        delivered_at    REAL
+    );
+    CREATE INDEX IF NOT EXISTS webhook_outbox_due ON webhook_outbox (status, next_attempt_at);
+    CREATE INDEX IF NOT EXISTS webhook_outbox_job ON webhook_outbox (job_id);
+"""
+
+
+def insert_webhook(conn, job_id, url, payload):
+    """Queues a delivery on `conn` inside the caller's transaction (see SQLiteJobStore.finish)."""
+    conn.execute(
+        "INSERT INTO webhook_outbox (job_id, url, payload, status, next_attempt_at, created_at) "
+        "VALUES (?, ?, ?, 'pending', ?, ?)",
+        (job_id, url, json.dumps(payload, default=str), time.time(), time.time()),
+    )
+
+
+class WebhookOutbox:
+    """
+    path:          SQLite database file (the job store's, which writes the rows)
+    senders:       concurrent sender tasks
+    per_host:      concurrent deliveries per target host
+    max_attempts:  deliveries tried before a payload goes to the dead-letter store
+    base_delay / max_delay: backoff bounds in seconds
+    timeout:       per-request timeout in seconds
+    retention:     seconds delivered rows are kept before prune() deletes them
+    """
+
+    POLL_INTERVAL = 1.0
+    PRUNE_INTERVAL = 3600.0
+
+    def __init__(self, path, senders=4, per_host=2, max_attempts=8, base_delay=2.0, max_delay=300.0,
+                 timeout=30.0, lease=180.0, retention=7 * 86400.0):
+        self.path = path
+        self.senders = max(1, int(senders))
+        self.per_host = max(1, int(per_host))
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.lease = lease
+        self.retention = retention
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(OUTBOX_SCHEMA)
+        self._client = None
+        self._tasks = []
+        self._pruner = None
+        self._host_slots = {}
+        self._wakeup = None
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+
+    # --- storage (blocking; called via asyncio.to_thread) ---
+
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            # SELECT + UPDATE under the write lock (no UPDATE ... RETURNING: that needs SQLite 3.35)
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, job_id, url, payload, attempts + 1 AS attempts FROM webhook_outbox "
+                    "WHERE (status = 'pending' AND next_attempt_at <= ?) OR (status = 'sending' AND lease_until < ?) "
+                    "ORDER BY next_attempt_at LIMIT 1", (now, now),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE webhook_outbox SET status = 'sending', attempts = ?, lease_until = ? WHERE id = ?",
+                        (row["attempts"], now + self.lease, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def _mark(self, row_id, status, error=None, next_attempt_at=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE webhook_outbox SET status = ?, last_error = ?, lease_until = NULL, "
+                "next_attempt_at = COALESCE(?, next_attempt_at), "
+                "delivered_at = CASE WHEN ? = 'delivered' THEN ? ELSE delivered_at END WHERE id = ?",
+                (status, error, next_attempt_at, status, time.time(), row_id),
+            )
+
+    def replay(self, row_id=None):
+        """Moves one dead letter (or all of them) back to pending. Returns the number requeued."""
+        query = "UPDATE webhook_outbox SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE status = 'dead'"
+        args = [time.time()]
+        if row_id is not None:
+            query += " AND id = ?"
+            args.append(row_id)
+        with self._lock:
+            count = self._conn.execute(query, args).rowcount
+        logger.info(f"🔁 [Webhook] Replaying {count} dead letter(s)")
+        return count
+
+    def prune(self):
+        """Deletes delivered rows older than the retention period. Returns the number deleted."""
+        with self._lock:
+            count = self._conn.execute(
+                "DELETE FROM webhook_outbox WHERE status = 'delivered' AND delivered_at < ?",
+                (time.time() - self.retention,),
+            ).rowcount
+        if count:
+            logger.info(f"🧹 [Webhook] Pruned {count} delivered webhook(s)")
+        return count
+
+    def dead_letters(self, limit=100):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, job_id, url, attempts, last_error, created_at FROM webhook_outbox "
+                "WHERE status = 'dead' ORDER BY id DESC LIMIT ?", (limit,),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def job_status(self, job_id):
+        """Delivery state of a job's webhook (latest entry), or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, attempts, last_error, delivered_at FROM webhook_outbox "
+                "WHERE job_id = ? ORDER BY id DESC LIMIT 1", (job_id,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM webhook_outbox GROUP BY status").fetchall())
+        return {**{state: counts.get(state, 0) for state in WEBHOOK_STATES}, "senders": len(self._tasks),
+                "delivered_total": self.delivered, "retried": self.retried, "dead_total": self.dead}
+
+    # --- delivery ---
+
+    def notify(self):
+        """Wakes an idle sender after a job queued a delivery (other processes are picked up by polling)."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _slot(self, url):
+        host = urlsplit(url).netloc
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.per_host)
+        return slot
+
+    def _backoff(self, attempts):
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempts)))
+
+    async def _deliver(self, row):
+        headers = {
+            "ngrok-skip-browser-warning": "true",
+            "Content-Type": "application/json"
+        }
+        # Read the auth token at send time, so a rotated token applies to queued deliveries too
+        load_dotenv(override=True)
+        auth_token = os.getenv("WEBHOOK_AUTH_TOKEN")
+        if auth_token:
+            headers["Authorization"] = auth_token
+
+        logger.info(f"🚀 [Webhook] Attempt {row['attempts']} for job {row['job_id']} to {row['url']}")
+        logger.info(f"📋 [Webhook] JSON body:\n{row['payload'][:2000]}")
+        error = None
+        try:
+            async with self._slot(row["url"]):
+                response = await self._client.post(row["url"], content=row["payload"].encode('utf-8'), headers=headers)
+            if response.is_error:
+                logger.error(f"❌ [Webhook] Response Status {response.status_code} Body: {response.text[:500]}")
+                error = f"HTTP {response.status_code}"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        if error:
+            if row["attempts"] >= self.max_attempts:
+                self.dead += 1
+                await asyncio.to_thread(self._mark, row["id"], "dead", error)
+                logger.error(f"☠️ [Webhook] Job {row['job_id']} parked as dead letter after {row['attempts']} attempts: {error}")
+            else:
+                self.retried += 1
+                delay = self._backoff(row["attempts"])
+                await asyncio.to_thread(self._mark, row["id"], "pending", error, time.time() + delay)
+                logger.warning(f"⚠️ [Webhook] Attempt {row['attempts']} failed for job {row['job_id']}: {error} — retry in {delay:.1f}s")
+            return
+        self.delivered += 1
+        await asyncio.to_thread(self._mark, row["id"], "delivered")
+        logger.info(f"✅ [Webhook] Delivered job {row['job_id']} to {row['url']}")
+
+    async def _sender_loop(self, index):
+        while True:
+            try:
+                row = await asyncio.to_thread(self._claim)
+                if row is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._deliver(row)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"❌ [Webhook] Sender {index} error: {e}", exc_info=True)
+                await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def _prune_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.prune)
+            except Exception as e:
+                logger.error(f"❌ [Webhook] Prune failed: {e}")
+            await asyncio.sleep(self.PRUNE_INTERVAL)
+
+    def start(self):
+        limits = httpx.Limits(max_connections=self.senders, max_keepalive_connections=self.senders)
+        self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._sender_loop(i)) for i in range(self.senders)]
+        self._pruner = asyncio.create_task(self._prune_loop())
+        logger.info(f"📮 Webhook outbox: {self.path}, {self.senders} sender(s), {self.per_host}/host: {self.stats()}")
+
+    async def stop(self):
+        """Stops the senders; an interrupted delivery is retried after its lease expires."""
+        tasks = self._tasks + ([self._pruner] if self._pruner else [])
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._pruner = None
+        if self._client is not None:
+            await self._client.aclose()
+        with self._lock:
+            self._conn.close()
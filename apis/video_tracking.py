@@ -0,0 +1,231 @@
+"""
+Lateral hoof video mode: keypoints tracked frame to frame.
+
+A full 9-zone scan per frame is far too slow for a walk-by or stand-still clip, so only
+the first analysed frame is scanned (HPAPredictor._locate, i.e. the configured strategy).
+Every later frame runs a single crop: the previous keypoints' extent plus context, fitted
+to the model aspect ratio (the same crop as coarse_to_fine's refinement pass).
+
+    - frame_step: only every Nth frame is decoded and analysed (the rest are grab()bed)
+    - rescan: when the tracked crop's mean score drops below rescan_score or the pose
+      fails the anatomy check, the same frame is rescanned from scratch
+    - smoothing: pastern / hoof angles are exponentially smoothed across tracked frames
+      (reset after every rescan)
+
+Frames are read and yielded one at a time, so memory stays flat for long clips.
+VideoAggregate turns the per-frame stream into a robust clip-level summary from a
+bounded reservoir sample of the per-frame angles (exact for clips up to max_samples
+successful frames).
+"""
+
+import logging
+import time
+
+import cv2
+import numpy as np
+
+from .logic import MIN_KEYPOINT_SCORE, hpa_angles, is_anatomically_valid
+from .image_utils import fit_aspect_ratio
+
+logger = logging.getLogger(__name__)
+
+
+def read_frames(path, frame_step=1, max_dim=None):
+    """
+    Yields (frame_index, timestamp_ms, frame_bgr) for every frame_step-th frame of a video file.
+    Skipped frames are grabbed without decoding; max_dim downsizes large frames (long side).
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {path}")
+    try:
+        index = -1
+        while True:
+            index += 1
+            if index % frame_step:
+                if not cap.grab():
+                    return
+                continue
+            ok, frame = cap.read()
+            if not ok:
+                return
+            if max_dim and max(frame.shape[:2]) > max_dim:
+                scale = max_dim / max(frame.shape[:2])
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            yield index, cap.get(cv2.CAP_PROP_POS_MSEC), frame
+    finally:
+        cap.release()
+
+
+class HoofTracker:
+    """
+    predictor:     one HPAPredictor (with a PredictorPool, hold one replica for the whole clip)
+    rescan_score:  mean keypoint score below which a tracked frame is rescanned
+    smoothing:     weight of the newest frame in the angle EMA (1.0 = no smoothing)
+    context:       crop padding around the previous keypoints, as a fraction of their extent
+    """
+
+    def __init__(self, predictor, rescan_score=0.5, smoothing=0.4, context=0.25):
+        self.predictor = predictor
+        self.rescan_score = rescan_score
+        self.smoothing = smoothing
+        self.context = context
+        self.reset()
+
+    def reset(self):
+        self._kpts = None
+        self._smoothed = None
+
+    def _track(self, img):
+        img_h, img_w = img.shape[:2]
+        x_min, y_min = np.min(self._kpts, axis=0)
+        x_max, y_max = np.max(self._kpts, axis=0)
+        cw, ch = (x_max - x_min), (y_max - y_min)
+        bbox = fit_aspect_ratio(x_min - cw * self.context, y_min - ch * self.context,
+                                x_max + cw * self.context, y_max + ch * self.context,
+                                img_w, img_h, self.predictor.MODEL_RATIO)
+        with self.predictor._lock:
+            kpts, scores = self.predictor.backend.infer(img, bbox[None, :])
+        return kpts[0], scores[0]
+
+    def _scan(self, img):
+        with self.predictor._lock:
+            (_, kpts, scores, _, _), _ = self.predictor._locate(img)
+        return kpts, scores
+
+    def update(self, img):
+        """Analyses one frame. Returns a per-frame dict (mode: "scan" | "track" | "rescan")."""
+        t0 = time.perf_counter()
+        if self._kpts is None:
+            mode = "scan"
+            kpts, scores = self._scan(img)
+            sane, reason = is_anatomically_valid(kpts)
+        else:
+            mode = "track"
+            kpts, scores = self._track(img)
+            sane, reason = is_anatomically_valid(kpts)
+            if not sane or np.mean(scores) < self.rescan_score:
+                logger.info(f"🔁 Tracking lost (score={np.mean(scores):.2f}, {reason}) — rescanning")
+                mode = "rescan"
+                self._smoothed = None
+                kpts, scores = self._scan(img)
+                sane, reason = is_anatomically_valid(kpts)
+
+        frame = {
+            "mode": mode,
+            "success": False,
+            "keypoints": kpts.tolist(),
+            "model_confidence": round(float(np.mean(scores)), 2),
+            "pastern_angle": None,
+            "hoof_angle": None,
+            "hpa_dev": None,
+            "pastern_angle_smoothed": None,
+            "hoof_angle_smoothed": None,
+            "hpa_dev_smoothed": None,
+            "inference_ms": None,
+        }
+        if sane and all(s > MIN_KEYPOINT_SCORE for s in scores):
+            p_angle, h_angle, diff = hpa_angles(kpts)
+            if self._smoothed is None:
+                self._smoothed = (p_angle, h_angle)
+            else:
+                a = self.smoothing
+                self._smoothed = (a * p_angle + (1 - a) * self._smoothed[0], a * h_angle + (1 - a) * self._smoothed[1])
+            self._kpts = kpts
+            frame.update({
+                "success": True,
+                "pastern_angle": round(p_angle, 2),
+                "hoof_angle": round(h_angle, 2),
+                "hpa_dev": round(diff, 2),
+                "pastern_angle_smoothed": round(self._smoothed[0], 2),
+                "hoof_angle_smoothed": round(self._smoothed[1], 2),
+                "hpa_dev_smoothed": round(abs(self._smoothed[0] - self._smoothed[1]), 2),
+            })
+        else:
+            # Nothing trustworthy to track from: the next analysed frame starts with a full scan.
+            frame["error"] = reason if not sane else "Low Confidence (<0.4)"
+            self.reset()
+        frame["inference_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        return frame
+
+
+def analyze_video(predictor, path, frame_step=2, max_dim=None, **tracker_kwargs):
+    """
+    Streaming video analysis: yields one dict per analysed frame (frame_index, timestamp_ms
+    plus HoofTracker.update() fields). Feed the frames to VideoAggregate for the clip result.
+    """
+    tracker = HoofTracker(predictor, **tracker_kwargs)
+    for index, timestamp_ms, img in read_frames(path, frame_step=frame_step, max_dim=max_dim):
+        frame = tracker.update(img)
+        frame["frame_index"] = index
+        frame["timestamp_ms"] = round(timestamp_ms, 1)
+        yield frame
+
+
+class VideoAggregate:
+    """
+    Clip-level summary of analyze_video() frames. Frames whose smoothed HPA deviation is more
+    than outlier_mads median absolute deviations from the median are dropped before averaging.
+
+    outlier_mads:  outlier cut-off in (scaled) median absolute deviations
+    max_samples:   successful frames kept for the medians; beyond that a uniform reservoir
+                   sample (seeded, so a clip always gives the same summary) stands in for
+                   the whole clip, so memory stays fixed however long the stream runs
+    """
+
+    def __init__(self, outlier_mads=3.0, max_samples=4096, seed=0):
+        self.outlier_mads = outlier_mads
+        self.frames = 0
+        self.frames_ok = 0
+        self.modes = {"scan": 0, "track": 0, "rescan": 0}
+        self._angles = np.empty((max(1, int(max_samples)), 3), dtype=np.float64)  # (pastern, hoof, dev), smoothed
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, frame):
+        self.frames += 1
+        self.modes[frame["mode"]] += 1
+        if not frame["success"]:
+            return
+        self.frames_ok += 1
+        slot = self.frames_ok - 1
+        if slot >= len(self._angles):
+            # Reservoir sampling: the n-th successful frame replaces a kept one with probability k/n.
+            slot = int(self._rng.integers(self.frames_ok))
+            if slot >= len(self._angles):
+                return
+        self._angles[slot] = (frame["pastern_angle_smoothed"], frame["hoof_angle_smoothed"],
+                              frame["hpa_dev_smoothed"])
+
+    def summary(self):
+        result = {
+            "success": False,
+            "frames_analyzed": self.frames,
+            "frames_ok": self.frames_ok,
+            "frames_outlier": 0,
+            "full_scans": self.modes["scan"] + self.modes["rescan"],
+            "pastern_angle": None,
+            "hoof_angle": None,
+            "hpa_dev": None,
+            "hpa_dev_iqr": None,
+        }
+        if not self.frames_ok:
+            result["error"] = "No frame produced a confident, anatomically valid pose."
+            return result
+
+        angles = self._angles[:min(self.frames_ok, len(self._angles))]
+        dev = angles[:, 2]
+        med = np.median(dev)
+        mad = np.median(np.abs(dev - med)) * 1.4826
+        keep = np.abs(dev - med) <= self.outlier_mads * mad if mad > 0 else np.ones(len(dev), dtype=bool)
+        inliers = angles[keep]
+        q1, q3 = np.percentile(inliers[:, 2], [25, 75])
+        result.update({
+            "success": True,
+            # scaled from the sample once the reservoir is full
+            "frames_outlier": int(round((~keep).sum() * self.frames_ok / len(angles))),
+            "pastern_angle": round(float(np.median(inliers[:, 0])), 2),
+            "hoof_angle": round(float(np.median(inliers[:, 1])), 2),
+            "hpa_dev": round(float(np.median(inliers[:, 2])), 2),
+            "hpa_dev_iqr": [round(float(q1), 2), round(float(q3), 2)],
+        })
+        return result
@@ -0,0 +1,187 @@
+"""
+Startup warm-up and latency self-test.
+
+A freshly loaded model pays for lazy allocations and kernel selection (oneDNN / ORT pick
+kernels per batch shape) on its first calls, and the frontal models load on first use.
+Warm-up runs synthetic inputs through every configured path right after startup, records
+the cold (first call) and warm (median of the following runs) latency of each path, and
+keeps /api/ready at 503 until it has finished.
+
+Paths
+    hoof_single_crop   1 crop: ROI proposal, coarse-to-fine and scheduled-scan batches
+    hoof_zone_batch    all zone crops in zone_batch_size batches (incl. flip test when enabled)
+    lateral_predict    HPAPredictor.predict() end to end: decode, locate, render, encode
+    frontal_depth      Depth Anything V2 (leg_symmetry_v3.estimate_depth)
+    frontal_pose       MMPose animal inferencer used by the frontal pipeline
+    yolo               YOLOPredictor.predict(), only when YOLO is enabled
+
+Every replica (PredictorPool) is warmed, since each owns its own model instance; inference
+worker processes (worker_pool.py) warm themselves before taking tasks and report back.
+Warm-up runs while the server already accepts requests, so the raw model paths hold the
+replica's lock like predict() does; a request routed to that replica simply waits.
+"""
+
+import logging
+import statistics
+import threading
+import time
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_lateral_image(width=768, height=1024, seed=0):
+    """Textured BGR test frame: a dark 'leg' stripe on noise, so every decode/warp path does real work."""
+    rng = np.random.default_rng(seed)
+    img = rng.integers(40, 200, size=(height, width, 3), dtype=np.uint8)
+    cv2.rectangle(img, (width // 2 - width // 10, height // 4), (width // 2 + width // 10, height), (30, 30, 30), -1)
+    return img
+
+
+def time_path(fn, runs=2):
+    """Calls fn() 1 + runs times. Returns {"cold_ms", "warm_ms"} (warm = median of the later calls)."""
+    t0 = time.perf_counter()
+    fn()
+    cold_ms = (time.perf_counter() - t0) * 1000
+    warm = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        warm.append((time.perf_counter() - t0) * 1000)
+    return {"cold_ms": round(cold_ms, 1), "warm_ms": round(statistics.median(warm), 1) if warm else None}
+
+
+def warm_lateral(predictor, runs=2):
+    """Warms one HPAPredictor. Returns {path: timing}; a failing path maps to {"error": ...}."""
+    from apis.logic import build_zone_bboxes
+
+    img = synthetic_lateral_image()
+    img_bytes = cv2.imencode('.jpg', img)[1].tobytes()
+    bboxes = np.stack([b for _, b in build_zone_bboxes(img.shape[1], img.shape[0], predictor.MODEL_RATIO)])
+    backend = predictor.backend
+
+    def locked(fn):
+        # Same per-replica lock as predict() (which takes it itself)
+        def run():
+            with predictor._lock:
+                return fn()
+        return run
+
+    paths = {
+        "hoof_single_crop": locked(lambda: backend.infer(img, bboxes[:1])),
+        "hoof_zone_batch": locked(lambda: predictor._infer_crops(img, bboxes)),
+        "lateral_predict": lambda: predictor.predict(img_bytes, remove_bg=False, render=True),
+    }
+    timings = {}
+    for name, fn in paths.items():
+        try:
+            timings[name] = time_path(fn, runs)
+        except Exception as e:
+            logger.error(f"❌ Warm-up path {name} failed: {e}")
+            timings[name] = {"error": str(e)}
+    # The flip test runs inside the backend's forward pass; report whether it was part of the timings.
+    flip = getattr(getattr(backend, "backend", backend), "flip_test", None)
+    if flip is not None and "cold_ms" in timings["hoof_zone_batch"]:
+        timings["hoof_zone_batch"]["flip_test"] = flip
+    return timings
+
+
+def warm_frontal(inferencer=None, runs=1):
+    """Loads and warms the frontal pipeline's depth model and animal pose inferencer."""
+    from apis.v5.services.inference import get_frontal_mmpose
+
+    img = synthetic_lateral_image(width=640, height=480, seed=1)
+    timings = {}
+    try:
+        from leg_symmetry_v3 import estimate_depth
+        timings["frontal_depth"] = time_path(lambda: estimate_depth(img), runs)
+    except Exception as e:
+        logger.error(f"❌ Warm-up path frontal_depth failed: {e}")
+        timings["frontal_depth"] = {"error": str(e)}
+
+    inferencer = inferencer or get_frontal_mmpose()
+    if inferencer is None:
+        timings["frontal_pose"] = {"error": "Frontal MMPose not available"}
+    else:
+        try:
+            timings["frontal_pose"] = time_path(lambda: next(iter(inferencer(img))), runs)
+        except Exception as e:
+            logger.error(f"❌ Warm-up path frontal_pose failed: {e}")
+            timings["frontal_pose"] = {"error": str(e)}
+    return timings
+
+
+def warm_yolo(yolo_predictor, runs=2):
+    img_bytes = cv2.imencode('.jpg', synthetic_lateral_image(seed=2))[1].tobytes()
+    try:
+        return {"yolo": time_path(lambda: yolo_predictor.predict(img_bytes), runs)}
+    except Exception as e:
+        logger.error(f"❌ Warm-up path yolo failed: {e}")
+        return {"yolo": {"error": str(e)}}
+
+
+class WarmupState:
+    """Readiness gate + per-path latency report (app.state.warmup)."""
+
+    def __init__(self):
+        self.status = "pending"  # pending | running | ready
+        self.error = None
+        self.duration_ms = None
+        self._paths = {}  # path -> list of timings (one per replica / worker)
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.status == "ready"
+
+    def record(self, timings):
+        with self._lock:
+            for name, timing in timings.items():
+                self._paths.setdefault(name, []).append(timing)
+
+    def report(self):
+        with self._lock:
+            paths = {}
+            for name, timings in self._paths.items():
+                ok = [t for t in timings if "cold_ms" in t]
+                entry = {"instances": len(timings), "errors": [t["error"] for t in timings if "error" in t]}
+                if ok:
+                    # Worst instance: the latency a first request could still see
+                    entry["cold_ms"] = max(t["cold_ms"] for t in ok)
+                    warm = [t["warm_ms"] for t in ok if t["warm_ms"] is not None]
+                    entry["warm_ms"] = max(warm) if warm else None
+                    if "flip_test" in ok[0]:
+                        entry["flip_test"] = ok[0]["flip_test"]
+                paths[name] = entry
+            return {"status": self.status, "duration_ms": self.duration_ms, "error": self.error, "paths": paths}
+
+    def run(self, predictor=None, worker_pool=None, yolo_predictor=None, frontal=True, runs=2, timeout=600.0):
+        """
+        Warms every configured path (blocking). Failures are reported per path, not raised.
+        timeout bounds the wait for worker-process reports (a worker that dies while warming).
+        """
+        self.status = "running"
+        t0 = time.perf_counter()
+        try:
+            if worker_pool is not None:
+                # Workers warm themselves on startup (lateral + frontal); wait for every report.
+                for timings in worker_pool.wait_warm(timeout=timeout):
+                    self.record(timings)
+            else:
+                # CachedPredictor would store the synthetic image; warm the replicas behind it.
+                inner = getattr(predictor, "predictor", predictor)
+                for replica in getattr(inner, "replicas", [inner]):
+                    self.record(warm_lateral(replica, runs))
+                if frontal:
+                    self.record(warm_frontal(runs=max(1, runs - 1)))
+            if yolo_predictor is not None:
+                self.record(warm_yolo(yolo_predictor, runs))
+        except Exception as e:
+            # Serving cold beats not serving: the gate still opens, the error is reported.
+            logger.error(f"❌ Warm-up failed: {e}", exc_info=True)
+            self.error = str(e)
+        self.duration_ms = round((time.perf_counter() - t0) * 1000, 1)
+        self.status = "ready"
+        logger.info(f"🔥 Warm-up finished in {self.duration_ms:.0f} ms: {self.report()['paths']}")
@@ -0,0 +1,342 @@
+"""
+InferenceWorkerPool — lateral and frontal inference in separate worker processes.
+
+Torch, OpenCV and rembg work inside one uvicorn process contends for the GIL. With this
+pool each worker process loads its models once (HPAPredictor, and the frontal MMPose
+inferencer on first use) and runs one job at a time, so lateral and frontal scans use
+separate cores while the event loop only waits on futures.
+
+Images never travel through pickle:
+    - the API process decodes the upload and copies the pixels into a
+      multiprocessing.shared_memory block; only (name, shape, dtype) is queued
+    - the worker maps the block, runs HPAPredictor.analyze() on it and, when the caller
+      asked for an overlay, writes the encoded image into a new block; the LegResult
+      (keypoints, angles) travels on the queue
+    - the API process copies the image out and unlinks every block
+
+The pool exposes the same predict() call as HPAPredictor / PredictorPool, so it can
+be used as app.state.predictor, plus analyze_frontal() for the v5 frontal slots.
+
+A worker announces each task it takes (task_id, None, pid) before running it. The
+result router checks worker liveness on every pass, respawns dead workers and fails
+the tasks they held right away instead of leaving their callers to the task timeout.
+"""
+
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from apis.hoof_backends import set_torch_threads
+
+logger = logging.getLogger(__name__)
+
+_STOP = None
+
+
+# ─────────────────────────────────────────────
+# Shared-memory hand-off
+# ─────────────────────────────────────────────
+
+def put_array(arr):
+    """Copies arr into a new shared-memory block. Returns (block, descriptor)."""
+    arr = np.ascontiguousarray(arr)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, {"name": shm.name, "shape": arr.shape, "dtype": arr.dtype.str}
+
+
+def put_bytes(data):
+    return put_array(np.frombuffer(data, dtype=np.uint8))
+
+
+def attach_array(desc):
+    """Maps a descriptor from put_array(). Returns (block, view); drop the view before block.close()."""
+    shm = shared_memory.SharedMemory(name=desc["name"])
+    return shm, np.ndarray(desc["shape"], dtype=np.dtype(desc["dtype"]), buffer=shm.buf)
+
+
+def take_bytes(desc):
+    """Copies a bytes block out and unlinks it."""
+    shm, view = attach_array(desc)
+    try:
+        return view.tobytes()
+    finally:
+        del view
+        shm.close()
+        shm.unlink()
+
+
+# ─────────────────────────────────────────────
+# Worker process
+# ─────────────────────────────────────────────
+
+def _worker_main(predictor_kwargs, threads, tasks, results, warmup_runs=0, warmup_frontal=False, report_warmup=True):
+    set_torch_threads(threads)  # process-wide: this worker's share
+    cv2.setNumThreads(threads)
+
+    from apis.logic import HPAPredictor
+    predictor = HPAPredictor(**predictor_kwargs, intra_op_threads=threads)
+    frontal_inferencer = None
+    if warmup_runs:
+        # Warm before taking tasks; the report (task_id None) releases InferenceWorkerPool.wait_warm().
+        # Respawned workers warm up too, but nobody waits for their report.
+        from apis.warmup import warm_frontal, warm_lateral
+        timings = warm_lateral(predictor, warmup_runs)
+        if warmup_frontal:
+            from apis.v5.services.inference import get_frontal_mmpose
+            frontal_inferencer = get_frontal_mmpose()
+            timings.update(warm_frontal(frontal_inferencer, runs=max(1, warmup_runs - 1)))
+        if report_warmup:
+            results.put((None, True, timings))
+    logger.info(f"🧵 Inference worker {os.getpid()} ready ({threads} thread(s))")
+
+    while True:
+        task = tasks.get()
+        if task is _STOP:
+            return
+        task_id, kind, payload = task
+        results.put((task_id, None, os.getpid()))  # taken: lets the pool fail it if this process dies
+        blocks, views = [], {}
+        try:
+            for key, desc in payload.pop("arrays").items():
+                shm, view = attach_array(desc)
+                blocks.append(shm)
+                views[key] = view
+
+            if kind == "lateral":
+                result = predictor.analyze(
+                    views["img"], remove_bg=payload["remove_bg"],
+                    orig_img=views.get("orig_img"), alpha=views.get("alpha"),
+                    img_full_size=payload["img_full_size"], orig_full_size=payload["orig_full_size"],
+                    render=payload["render"], image_format=payload["image_format"],
+                    image_quality=payload["image_quality"],
+                )
+                out_desc = None
+                if result.image is not None:
+                    out_shm, out_desc = put_bytes(result.image)
+                    out_shm.close()
+                    result.image = None
+                results.put((task_id, True, (result, out_desc)))
+
+            elif kind == "frontal":
+                from apis.v5.services.inference import analyze_frontal, get_frontal_mmpose
+                if frontal_inferencer is None:
+                    frontal_inferencer = get_frontal_mmpose()
+                analyzed = analyze_frontal(views["original"].tobytes(), views["processed"].tobytes(),
+                                           inferencer=frontal_inferencer)
+                out_desc = None
+                if analyzed:
+                    out_shm, out_desc = put_bytes(analyzed)
+                    out_shm.close()
+                results.put((task_id, True, out_desc))
+
+            else:
+                raise ValueError(f"Unknown task kind: {kind}")
+        except Exception as e:
+            logger.error(f"❌ Inference worker {os.getpid()} failed on {kind} task: {e}", exc_info=True)
+            results.put((task_id, False, str(e)))
+        finally:
+            views.clear()
+            for shm in blocks:
+                shm.close()
+
+
+# ─────────────────────────────────────────────
+# API-side pool
+# ─────────────────────────────────────────────
+
+class InferenceWorkerPool:
+    """
+    predictor_kwargs: HPAPredictor(**predictor_kwargs) arguments (picklable; intra_op_threads is set per worker)
+    num_workers:      worker processes (default: cores // threads_per_worker)
+    task_timeout:     seconds a caller waits for its result before giving up
+    warmup_runs:      warm-up runs per path in every worker before it takes tasks (0 = off; warmup.py)
+    warmup_frontal:   also load and warm the frontal models during warm-up
+    """
+
+    def __init__(self, predictor_kwargs, num_workers=None, threads_per_worker=2, task_timeout=300.0,
+                 warmup_runs=0, warmup_frontal=False):
+        self.threads_per_worker = max(1, int(threads_per_worker))
+        self.size = num_workers or max(1, (os.cpu_count() or 1) // self.threads_per_worker)
+        self.task_timeout = task_timeout
+        self.roi_proposal = bool(predictor_kwargs.get("roi_proposal"))
+        self._predictor_kwargs = predictor_kwargs
+        self._warmup = (warmup_runs, warmup_frontal)
+        self._warm_reports = queue.Queue()
+
+        # spawn: torch/OpenMP state must not be forked from the API process
+        self._ctx = mp.get_context("spawn")
+        self._tasks = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._owners = {}        # task_id -> pid of the worker running it (router thread only)
+        self._dead_pids = set()
+        self._ids = itertools.count()
+        self._closed = False
+
+        self._procs = [self._spawn() for _ in range(self.size)]
+        self._router = threading.Thread(target=self._route_results, name="inference-results", daemon=True)
+        self._router.start()
+        logger.info(f"🧵 InferenceWorkerPool: {self.size} process(es) x {self.threads_per_worker} thread(s)")
+
+    def _spawn(self, initial=True):
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(self._predictor_kwargs, self.threads_per_worker, self._tasks, self._results, *self._warmup, initial),
+            daemon=True,
+        )
+        proc.start()
+        return proc
+
+    def _fail_task(self, task_id, reason):
+        with self._pending_lock:
+            future = self._pending.pop(task_id, None)
+        if future is not None:
+            future.set_exception(RuntimeError(reason))
+
+    def _replace_dead_workers(self):
+        # Workers that died (OOM kill, segfault) are respawned; the tasks they held fail now.
+        for i, proc in enumerate(self._procs):
+            if proc.is_alive() or self._closed:
+                continue
+            logger.error(f"❌ Inference worker {proc.pid} exited ({proc.exitcode}); respawning")
+            self._dead_pids.add(proc.pid)
+            for task_id in [t for t, pid in self._owners.items() if pid == proc.pid]:
+                del self._owners[task_id]
+                self._fail_task(task_id, f"Inference worker {proc.pid} died (exit code {proc.exitcode})")
+            self._procs[i] = self._spawn(initial=False)
+
+    def _route_results(self):
+        while not self._closed:
+            self._replace_dead_workers()
+            try:
+                task_id, ok, value = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            if task_id is None:
+                self._warm_reports.put(value)
+                continue
+            if ok is None:
+                # Task taken by worker `value`; if that worker is already gone, its result never comes.
+                if value in self._dead_pids:
+                    self._fail_task(task_id, f"Inference worker {value} died")
+                else:
+                    self._owners[task_id] = value
+                continue
+            self._owners.pop(task_id, None)
+            with self._pending_lock:
+                future = self._pending.pop(task_id, None)
+            if future is None:
+                # Caller timed out; free the output block nobody will read.
+                desc = value[1] if ok and isinstance(value, tuple) else value if ok else None
+                if desc:
+                    take_bytes(desc)
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(value))
+
+    def _submit(self, kind, arrays, **payload):
+        """Places arrays in shared memory, queues the task and waits for its result."""
+        blocks, descs = [], {}
+        try:
+            for key, arr in arrays.items():
+                shm, descs[key] = put_array(arr)
+                blocks.append(shm)
+
+            task_id = next(self._ids)
+            future = Future()
+            with self._pending_lock:
+                self._pending[task_id] = future
+            self._tasks.put((task_id, kind, {"arrays": descs, **payload}))
+            try:
+                return future.result(timeout=self.task_timeout)
+            finally:
+                with self._pending_lock:
+                    self._pending.pop(task_id, None)
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+    def predict(self, img_bytes, remove_bg=True, orig_img_bytes=None, render=False, image_format=None, image_quality=None):
+        """Same contract as HPAPredictor.predict(), executed in a worker process."""
+        from apis.logic import LegResult, decode_request
+
+        if not img_bytes:
+            return LegResult.failed("Empty image buffer provided. Please try uploading the image again.")
+        img, img_full, orig_img, orig_full, alpha = decode_request(
+            img_bytes, orig_img_bytes, remove_bg=remove_bg,
+            decode_max_dim=self._predictor_kwargs.get("decode_max_dim"),
+            render_max_dim=self._predictor_kwargs.get("render_max_dim"),
+            want_alpha=self.roi_proposal, render=render,
+        )
+        if img is None:
+            return LegResult.failed("Could not decode image. Please ensure the file is a valid image.")
+
+        arrays = {"img": img}
+        if alpha is not None:
+            arrays["alpha"] = alpha
+        if orig_img is not None:
+            arrays["orig_img"] = orig_img
+
+        result, image_desc = self._submit("lateral", arrays, remove_bg=remove_bg,
+                                          img_full_size=img_full, orig_full_size=orig_full, render=render,
+                                          image_format=image_format, image_quality=image_quality)
+        if image_desc:
+            result.image = take_bytes(image_desc)
+        return result
+
+    def analyze_frontal(self, image_bytes_original, image_bytes_processed):
+        """Drop-in for v5 analyze_frontal(): analyzed JPEG bytes or None, computed in a worker process."""
+        out_desc = self._submit(
+            "frontal",
+            {
+                "original": np.frombuffer(image_bytes_original, np.uint8),
+                "processed": np.frombuffer(image_bytes_processed, np.uint8),
+            },
+        )
+        return take_bytes(out_desc) if out_desc else None
+
+    def wait_warm(self, timeout=None):
+        """Blocks until every initial worker has reported its warm-up timings; returns them (one dict per worker)."""
+        if not self._warmup[0]:
+            return []
+        reports = []
+        try:
+            for _ in range(self.size):
+                reports.append(self._warm_reports.get(timeout=timeout))
+        except queue.Empty:
+            raise TimeoutError(f"Only {len(reports)}/{self.size} inference workers finished warm-up within {timeout}s")
+        return reports
+
+    def stats(self):
+        with self._pending_lock:
+            in_flight = len(self._pending)
+        return {
+            "workers": self.size,
+            "alive": sum(p.is_alive() for p in self._procs),
+            "threads_per_worker": self.threads_per_worker,
+            "in_flight": in_flight,
+        }
+
+    def close(self):
+        self._closed = True
+        for _ in self._procs:
+            self._tasks.put(_STOP)
+        for proc in self._procs:
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.terminate()
@@ -26,6 +26,7 @@ import threading
 import os
 
 from ultralytics import YOLO
+from apis.image_utils import decode_reduced
 from sklearn.linear_model import RANSACRegressor
 
 
@@ -49,18 +50,19 @@ def _clinical_angle(image_angle):
     return 90 - angle
 
 
-def _fit_clinical_axis(points_xy):
+def _fit_clinical_axis(points_xy, residual_threshold=5.0):
     """
     Unified RANSAC slope fitting (identical to bisect_axis_calculation).
     Fits x = m*y + b. Returns (axis_vector, anchor_center).
     Uses random_state=42 for deterministic results.
+    residual_threshold is in pixels of the image the points come from.
     """
     pts = np.array(points_xy, dtype=np.float64)
     if len(pts) < 10:
         raise ValueError("Not enough ROI points for RANSAC fit")
 
     xs, ys = pts[:, 0], pts[:, 1]
-    ransac = RANSACRegressor(residual_threshold=5.0, random_state=42)
+    ransac = RANSACRegressor(residual_threshold=residual_threshold, random_state=42)
     ransac.fit(ys.reshape(-1, 1), xs)
 
     m = ransac.estimator_.coef_[0]
@@ -89,7 +91,7 @@ class YOLOPredictor:
     # Class-level lock to avoid parallel YOLO model init races
     _load_lock = threading.Lock()
 
-    def __init__(self, weights_path: str):
+    def __init__(self, weights_path: str, decode_max_dim: int = None):
         if not os.path.exists(weights_path):
             raise FileNotFoundError(f"YOLO weights not found: {weights_path}")
 
@@ -101,6 +103,9 @@ class YOLOPredictor:
         self.model(dummy, verbose=False)
 
         self.weights_path = weights_path
+        # Long side to decode uploads at (reduced JPEG decode). The model runs at 640 px, so
+        # ~1280 loses nothing; pixel thresholds below are scaled back to full-resolution units.
+        self.decode_max_dim = decode_max_dim
         print(f"✅ YOLOPredictor loaded: {weights_path}")
 
     def predict(self, img_bytes: bytes) -> dict:
@@ -125,13 +130,13 @@ class YOLOPredictor:
             metrics["error"] = "Empty image buffer"
             return metrics
 
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        img, full_size = decode_reduced(img_bytes, self.decode_max_dim)
         if img is None:
             metrics["error"] = "Could not decode image"
             return metrics
 
         h, w = img.shape[:2]
+        px = w / full_size[0]  # decoded pixels per full-resolution pixel
 
         try:
             results = self.model(img, verbose=False, deterministic=True)
@@ -151,7 +156,7 @@ class YOLOPredictor:
 
             for mask, cls, conf in zip(masks_data, classes, confs):
                 mask_bin = cv2.resize((mask > 0.5).astype(np.uint8), (w, h))
-                if np.sum(mask_bin) < 500:
+                if np.sum(mask_bin) < 500 * px * px:
                     continue
                 if int(cls) == 0:
                     pastern_candidates.append((mask_bin, float(conf)))
@@ -198,7 +203,7 @@ class YOLOPredictor:
                 pastern_front_pts.append([x_min if orientation == "left" else x_max, y_v])
                 pastern_mid_pts.append([(x_min + x_max) / 2, y_v])
 
-            p_slope_axis, _ = _fit_clinical_axis(pastern_front_pts)
+            p_slope_axis, _ = _fit_clinical_axis(pastern_front_pts, residual_threshold=5.0 * px)
             p_center = np.mean(pastern_mid_pts, axis=0)
 
             # ── Hoof ROI (20-75%) ──
@@ -212,7 +217,7 @@ class YOLOPredictor:
                 row_xs = h_xs[h_ys == y_v]
                 hoof_pts.append([np.min(row_xs) if orientation == "left" else np.max(row_xs), y_v])
 
-            h_axis, h_center = _fit_clinical_axis(hoof_pts)
+            h_axis, h_center = _fit_clinical_axis(hoof_pts, residual_threshold=5.0 * px)
 
         except ValueError as e:
             metrics["error"] = f"ROI fitting error: {e}"
@@ -0,0 +1,169 @@
+#class to learn an ordered zone schedule (with early-exit threshold) for HPAPredictor from a validation set
+
+import json
+import os
+import sys
+import argparse
+import cv2
+import numpy as np
+
+sys.path.append('mmpose')
+from apis.logic import HPAPredictor, build_zone_bboxes, is_anatomically_valid, candidate_score
+from evaluate_hpa_accuracy import calculate_hpa_metrics
+
+CONFIG = 'mmpose/custom_configs/rtmpose_hoof_4kp_copy.py'
+CHECKPOINT = 'mmpose/work_dirs/rtmpose_hoof_manual_30_april/epoch_130.pth'
+VAL_JSON = 'data/annotations/val_590_fixed.json'
+IMG_DIR = 'data/images/hq_consolidation_550'
+OUT_PATH = 'configs/zone_schedule.json'
+
+# Early-exit thresholds (mean keypoint score) tried during simulation
+EXIT_CANDIDATES = [0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 1.0, 1.1, 1.2]
+TOLERANCE = 3.0
+
+
+def scan_image(predictor, img):
+    """Runs every zone crop once. Returns [(label, mean_score, is_sane, agg, kpts), ...] in default scan order."""
+    crops = build_zone_bboxes(img.shape[1], img.shape[0], predictor.MODEL_RATIO)
+    all_kpts, all_scores = predictor._infer_crops(img, np.stack([b for _, b in crops]))
+    rows = []
+    for (label, _), kpts, scores in zip(crops, all_kpts, all_scores):
+        sane, _ = is_anatomically_valid(kpts)
+        rows.append((label, float(np.mean(scores)), sane, float(candidate_score(scores, sane)), kpts))
+    return rows
+
+
+def full_scan_pick(rows):
+    best = None
+    for row in rows:
+        if best is None or row[3] > best[3]:
+            best = row
+    return best
+
+
+def scheduled_pick(rows, order, exit_score):
+    """Mirrors HPAPredictor._scheduled_scan with batch size 1. Returns (row, forward_passes)."""
+    by_label = {r[0]: (i, r) for i, r in enumerate(rows)}
+    best = None
+    passes = 0
+    for label in order:
+        if label not in by_label:
+            continue
+        idx, row = by_label[label]
+        passes += 1
+        if best is None or row[3] > best[1][3] or (row[3] == best[1][3] and idx < best[0]):
+            best = (idx, row)
+        if best[1][2] and best[1][1] >= exit_score:
+            break
+    return best[1], passes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the HPAPredictor zone schedule on a COCO validation set.")
+    parser.add_argument('--config', default=CONFIG)
+    parser.add_argument('--checkpoint', default=CHECKPOINT)
+    parser.add_argument('--val-json', default=VAL_JSON)
+    parser.add_argument('--img-dir', default=IMG_DIR)
+    parser.add_argument('--out', default=OUT_PATH)
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.5,
+                        help="Max allowed drop (percentage points) in the error-under-3° rate vs the full scan")
+    args = parser.parse_args()
+
+    print("🚀 Initializing HPAPredictor for zone calibration...")
+    predictor = HPAPredictor(args.config, args.checkpoint, device='cpu')
+
+    with open(args.val_json, 'r') as f:
+        data = json.load(f)
+    anns_by_image = {}
+    for a in data['annotations']:
+        anns_by_image.setdefault(a['image_id'], a)
+
+    samples = []  # (rows, gt_dev)
+    print(f"📊 Scanning {len(data['images'])} validation images...")
+    for idx, img_info in enumerate(data['images']):
+        ann = anns_by_image.get(img_info['id'])
+        if ann is None:
+            continue
+        img = cv2.imread(os.path.join(args.img_dir, img_info['file_name']))
+        if img is None:
+            print(f"Warning: Could not read {img_info['file_name']}")
+            continue
+        gt_kpts = np.array(ann['keypoints']).reshape(-1, 3)[:, :2]
+        _, _, gt_dev = calculate_hpa_metrics(gt_kpts)
+        samples.append((scan_image(predictor, img), gt_dev))
+        if (idx + 1) % 50 == 0:
+            print(f"✅ Scanned {idx + 1}/{len(data['images'])} images...")
+
+    if not samples:
+        print("❌ No usable validation samples.")
+        sys.exit(1)
+
+    # --- Zone statistics: which crop wins the full scan, and how confidently ---
+    default_order = [r[0] for r in samples[0][0]]
+    wins = {label: [] for label in default_order}
+    for rows, _ in samples:
+        best = full_scan_pick(rows)
+        wins[best[0]].append(best[1])
+
+    order = sorted(default_order, key=lambda l: (-len(wins[l]), -np.mean(wins[l]) if wins[l] else 0.0, default_order.index(l)))
+
+    def accuracy(pick):
+        ok = 0
+        for rows, gt_dev in samples:
+            _, _, pred_dev = calculate_hpa_metrics(pick(rows)[4])
+            ok += abs(pred_dev - gt_dev) <= TOLERANCE
+        return ok / len(samples) * 100
+
+    baseline_acc = accuracy(full_scan_pick)
+    print(f"📈 Full scan: {len(default_order)} passes/image, Success Rate (Error < 3°): {baseline_acc:.1f}%")
+
+    chosen = None
+    for t in EXIT_CANDIDATES:
+        picks = [scheduled_pick(rows, order, t) for rows, _ in samples]
+        avg_passes = sum(p for _, p in picks) / len(picks)
+        acc = sum(
+            abs(calculate_hpa_metrics(row[4])[2] - gt_dev) <= TOLERANCE
+            for (row, _), (_, gt_dev) in zip(picks, samples)
+        ) / len(samples) * 100
+        print(f"   exit_score={t:.2f}: {avg_passes:.2f} passes/image, Success Rate: {acc:.1f}%")
+        if chosen is None and baseline_acc - acc <= args.max_accuracy_drop:
+            chosen = (t, avg_passes, acc)
+
+    if chosen is None:
+        # Nothing met the accuracy budget — never exit early, only reorder
+        chosen = (float('inf'), float(len(default_order)), baseline_acc)
+
+    schedule = {
+        "generated_from": args.val_json,
+        "checkpoint": args.checkpoint,
+        "num_images": len(samples),
+        "early_exit_score": chosen[0] if np.isfinite(chosen[0]) else None,
+        "expected_passes_per_image": round(chosen[1], 2),
+        "full_scan_accuracy": round(baseline_acc, 2),
+        "schedule_accuracy": round(chosen[2], 2),
+        "zones": [
+            {
+                "label": label,
+                "wins": len(wins[label]),
+                "mean_win_score": round(float(np.mean(wins[label])), 4) if wins[label] else None,
+            }
+            for label in order
+        ],
+    }
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(schedule, f, indent=2)
+
+    print("\n" + "="*40)
+    print("🗺️  ZONE SCHEDULE")
+    print("="*40)
+    for z in schedule["zones"]:
+        print(f"{z['label']:<28} wins={z['wins']:<4} mean_score={z['mean_win_score']}")
+    print(f"Early-exit score:         {schedule['early_exit_score']}")
+    print(f"Expected passes/image:    {schedule['expected_passes_per_image']}")
+    print(f"Saved to:                 {args.out}")
+    print("="*40 + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#class to check the numpy fast preprocessing path of MMPoseBackend against inference_topdown on the validation set
+
+import json
+import os
+import sys
+import argparse
+import time
+import cv2
+import numpy as np
+
+sys.path.append('mmpose')
+from apis.hoof_backends import MMPoseBackend
+from apis.logic import build_zone_bboxes
+from evaluate_hpa_accuracy import calculate_hpa_metrics
+
+CONFIG = 'mmpose/custom_configs/rtmpose_hoof_4kp_copy.py'
+CHECKPOINT = 'mmpose/work_dirs/rtmpose_hoof_manual_30_april/epoch_130.pth'
+VAL_JSON = 'data/annotations/val_590_fixed.json'
+IMG_DIR = 'data/images/hq_consolidation_550'
+MODEL_RATIO = 0.50  # HPAPredictor.MODEL_RATIO
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity check: MMPoseBackend fast path vs inference_topdown.")
+    parser.add_argument('--config', default=CONFIG)
+    parser.add_argument('--checkpoint', default=CHECKPOINT)
+    parser.add_argument('--val-json', default=VAL_JSON)
+    parser.add_argument('--img-dir', default=IMG_DIR)
+    parser.add_argument('--kpt-tol', type=float, default=1.0, help="Max allowed keypoint difference in pixels")
+    parser.add_argument('--score-tol', type=float, default=0.02, help="Max allowed keypoint score difference")
+    parser.add_argument('--angle-tol', type=float, default=0.5, help="Max allowed HPA deviation difference in degrees")
+    args = parser.parse_args()
+
+    print("🚀 Loading stock and fast-path backends...")
+    stock = MMPoseBackend(args.config, args.checkpoint, device='cpu')
+    fast = MMPoseBackend(args.config, args.checkpoint, device='cpu', fast_path=True)
+
+    with open(args.val_json, 'r') as f:
+        data = json.load(f)
+
+    # Every zone crop of every image: the exact boxes HPAPredictor sends through the model
+    kpt_err, score_err, dev_err, pick_mismatch = [], [], [], 0
+    t_stock = t_fast = 0.0
+    n_images = 0
+    for img_info in data['images']:
+        img = cv2.imread(os.path.join(args.img_dir, img_info['file_name']))
+        if img is None:
+            continue
+        n_images += 1
+        bboxes = np.stack([b for _, b in build_zone_bboxes(img.shape[1], img.shape[0], MODEL_RATIO)])
+
+        t0 = time.perf_counter()
+        k_s, s_s = stock.infer(img, bboxes)
+        t1 = time.perf_counter()
+        k_f, s_f = fast.infer(img, bboxes)
+        t2 = time.perf_counter()
+        t_stock += t1 - t0
+        t_fast += t2 - t1
+
+        kpt_err.append(float(np.max(np.abs(k_s - k_f))))
+        score_err.append(float(np.max(np.abs(s_s - s_f))))
+        pick_mismatch += int(np.argmax(s_s.mean(axis=1)) != np.argmax(s_f.mean(axis=1)))
+        dev_err.extend(
+            abs(calculate_hpa_metrics(a)[2] - calculate_hpa_metrics(b)[2]) for a, b in zip(k_s, k_f)
+        )
+
+    if not kpt_err:
+        print("❌ No usable validation images.")
+        sys.exit(1)
+
+    passed = max(kpt_err) <= args.kpt_tol and max(score_err) <= args.score_tol and max(dev_err) <= args.angle_tol
+    print("\n" + "="*40)
+    print("🔬 FAST PATH PARITY REPORT")
+    print("="*40)
+    print(f"Images / crops:           {n_images} / {len(dev_err)}")
+    print(f"Max keypoint diff (px):   {max(kpt_err):.3f}  (mean {np.mean(kpt_err):.3f})")
+    print(f"Max score diff:           {max(score_err):.4f}")
+    print(f"Max HPA dev diff (°):     {max(dev_err):.3f}")
+    print(f"Best-zone changes:        {pick_mismatch}")
+    print(f"Avg latency stock / fast: {t_stock / n_images * 1000:.1f} ms / {t_fast / n_images * 1000:.1f} ms per image")
+    print(f"Result:                   {'✅ PASS' if passed else '❌ FAIL'}")
+    print("="*40 + "\n")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
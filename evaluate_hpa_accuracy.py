@@ -41,6 +41,35 @@ def calculate_hpa_metrics(keypoints):
     h_angle = clinical_angle(angle_from_vertical(v_hoof))
     return p_angle, h_angle, abs(p_angle - h_angle)
 
+def build_result_row(file_name, gt_kpts, pred_kpts, pred_scores):
+    """One accuracy-report row: GT vs predicted pastern/hoof/deviation angles and their errors."""
+    gt_p, gt_h, gt_dev = calculate_hpa_metrics(gt_kpts)
+    pred_p, pred_h, pred_dev = calculate_hpa_metrics(pred_kpts)
+    return {
+        'Image': file_name,
+        'AI_Confidence': round(float(np.mean(pred_scores)), 4),
+        'GT_Pastern_Angle': round(gt_p, 2),
+        'Pred_Pastern_Angle': round(pred_p, 2),
+        'Pastern_Error': round(abs(gt_p - pred_p), 2),
+        'GT_Hoof_Angle': round(gt_h, 2),
+        'Pred_Hoof_Angle': round(pred_h, 2),
+        'Hoof_Error': round(abs(gt_h - pred_h), 2),
+        'GT_Deviation': round(gt_dev, 2),
+        'Pred_Deviation': round(pred_dev, 2),
+        'Deviation_Error': round(abs(gt_dev - pred_dev), 2)
+    }
+
+def summarize_accuracy(results, tolerance=3.0):
+    """Average angle errors and the percent of samples whose deviation error is within `tolerance` degrees."""
+    total = len(results)
+    return {
+        'total': total,
+        'avg_pastern_error': sum(r['Pastern_Error'] for r in results) / total,
+        'avg_hoof_error': sum(r['Hoof_Error'] for r in results) / total,
+        'avg_deviation_error': sum(r['Deviation_Error'] for r in results) / total,
+        'accuracy_percent': sum(1 for r in results if r['Deviation_Error'] <= tolerance) / total * 100,
+    }
+
 def main():
     register_all_modules()
     config = 'mmpose/custom_configs/rtmpose_hoof_4kp_copy.py'
@@ -91,13 +120,9 @@ def main():
         res = inference_topdown(model, img, bboxes=bbox_xyxy[None, :])[0]
         pred_kpts = res.pred_instances.keypoints[0]
         pred_scores = res.pred_instances.keypoint_scores[0]
-        avg_score = np.mean(pred_scores)
         
         pred_p, pred_h, pred_dev = calculate_hpa_metrics(pred_kpts)
         
-        err_p = abs(gt_p - pred_p)
-        err_h = abs(gt_h - pred_h)
-        err_dev = abs(gt_dev - pred_dev)
 
         # Draw Debug Images for ALL validation samples
         if True:
@@ -125,19 +150,7 @@ def main():
                         cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
             cv2.imwrite(os.path.join(debug_dir, f"idx_{file_name}"), vis)
 
-        results.append({
-            'Image': file_name,
-            'AI_Confidence': round(float(avg_score), 4),
-            'GT_Pastern_Angle': round(gt_p, 2),
-            'Pred_Pastern_Angle': round(pred_p, 2),
-            'Pastern_Error': round(err_p, 2),
-            'GT_Hoof_Angle': round(gt_h, 2),
-            'Pred_Hoof_Angle': round(pred_h, 2),
-            'Hoof_Error': round(err_h, 2),
-            'GT_Deviation': round(gt_dev, 2),
-            'Pred_Deviation': round(pred_dev, 2),
-            'Deviation_Error': round(err_dev, 2)
-        })
+        results.append(build_result_row(file_name, gt_kpts, pred_kpts, pred_scores))
     
     # Save CSV
     out_csv = 'hpa_accuracy_report.csv'
@@ -147,23 +160,15 @@ def main():
         dict_writer.writeheader()
         dict_writer.writerows(results)
     
-    # Summary Calculations
-    total = len(results)
-    avg_err_p = sum(r['Pastern_Error'] for r in results) / total
-    avg_err_h = sum(r['Hoof_Error'] for r in results) / total
-    
-    # Percent of samples where deviation error is < 3.0 degrees
-    tolerance = 3.0
-    accurate_samples = sum(1 for r in results if r['Deviation_Error'] <= tolerance)
-    accuracy_percent = (accurate_samples / total) * 100
+    summary = summarize_accuracy(results)
     
     print("\n" + "="*40)
     print("📈 ACCURACY REPORT SUMMARY")
     print("="*40)
-    print(f"Total Samples Tested:     {total}")
-    print(f"Avg Pastern Angle Error:  {avg_err_p:.2f}°")
-    print(f"Avg Hoof Angle Error:     {avg_err_h:.2f}°")
-    print(f"Success Rate (Error < 3°): {accuracy_percent:.1f}%")
+    print(f"Total Samples Tested:     {summary['total']}")
+    print(f"Avg Pastern Angle Error:  {summary['avg_pastern_error']:.2f}°")
+    print(f"Avg Hoof Angle Error:     {summary['avg_hoof_error']:.2f}°")
+    print(f"Success Rate (Error < 3°): {summary['accuracy_percent']:.1f}%")
     print(f"Full Report Saved to:     {out_csv}")
     print("="*40 + "\n")
 
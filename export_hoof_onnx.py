@@ -0,0 +1,138 @@
+#class to export the hoof RTMPose model to ONNX (dynamic batch) and check ORT vs PyTorch parity on the validation set
+
+import json
+import os
+import sys
+import argparse
+import time
+import cv2
+import numpy as np
+import torch
+
+sys.path.append('mmpose')
+from mmpose.apis import init_model
+from mmpose.utils import register_all_modules
+from mmengine.config import Config
+from apis.hoof_backends import MMPoseBackend, ORTBackend, pipeline_meta
+from evaluate_hpa_accuracy import calculate_hpa_metrics
+
+CONFIG = 'mmpose/custom_configs/rtmpose_hoof_4kp_copy.py'
+CHECKPOINT = 'mmpose/work_dirs/rtmpose_hoof_manual_30_april/epoch_130.pth'
+OUT_PATH = 'mmpose/work_dirs/rtmpose_hoof_manual_30_april/hoof_rtmpose.onnx'
+VAL_JSON = 'data/annotations/val_590_fixed.json'
+IMG_DIR = 'data/images/hq_consolidation_550'
+
+
+class SimCCExportWrapper(torch.nn.Module):
+    """Backbone + neck + RTMCC head only; normalisation, flip test and decoding run in numpy (ORTBackend)."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model.head(self.model.extract_feat(x))
+
+
+def export(config, checkpoint, out_path, opset):
+    register_all_modules()
+    cfg = Config.fromfile(config)
+    cfg.model.test_cfg.flip_test = False
+    model = init_model(cfg, checkpoint, device='cpu')
+    model.eval()
+
+    # Pre/post-processing parameters the ORT backend needs, taken from the same
+    # test pipeline inference_topdown uses.
+    meta = pipeline_meta(cfg, model.dataset_meta['flip_indices'])
+    meta.update({"config": config, "checkpoint": checkpoint})
+    w, h = meta["input_size"]
+
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    dummy = torch.zeros(1, 3, h, w)
+    torch.onnx.export(
+        SimCCExportWrapper(model), dummy, out_path,
+        input_names=['input'], output_names=['simcc_x', 'simcc_y'],
+        dynamic_axes={'input': {0: 'batch'}, 'simcc_x': {0: 'batch'}, 'simcc_y': {0: 'batch'}},
+        opset_version=opset,
+    )
+    with open(os.path.splitext(out_path)[0] + '.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+    print(f"💾 Exported ONNX model to: {out_path}")
+
+
+def check_parity(config, checkpoint, onnx_path, val_json, img_dir, kpt_tol, angle_tol):
+    """Runs both backends on every validation bbox and reports keypoint / score / HPA differences."""
+    torch_backend = MMPoseBackend(config, checkpoint, device='cpu')
+    ort_backend = ORTBackend(onnx_path)
+
+    with open(val_json, 'r') as f:
+        data = json.load(f)
+    images = {img['id']: img for img in data['images']}
+
+    kpt_err, score_err, dev_err = [], [], []
+    t_torch = t_ort = 0.0
+    for ann in data['annotations']:
+        img_info = images.get(ann['image_id'])
+        if img_info is None:
+            continue
+        img = cv2.imread(os.path.join(img_dir, img_info['file_name']))
+        if img is None:
+            continue
+        bbox = np.array(ann['bbox'], dtype=np.float32)
+        bbox[2:] += bbox[:2]
+
+        t0 = time.perf_counter()
+        k_t, s_t = torch_backend.infer(img, bbox[None, :])
+        t1 = time.perf_counter()
+        k_o, s_o = ort_backend.infer(img, bbox[None, :])
+        t2 = time.perf_counter()
+        t_torch += t1 - t0
+        t_ort += t2 - t1
+
+        kpt_err.append(float(np.max(np.abs(k_t - k_o))))
+        score_err.append(float(np.max(np.abs(s_t - s_o))))
+        dev_err.append(abs(calculate_hpa_metrics(k_t[0])[2] - calculate_hpa_metrics(k_o[0])[2]))
+
+    if not kpt_err:
+        print("❌ No usable validation samples.")
+        return False
+
+    n = len(kpt_err)
+    passed = max(kpt_err) <= kpt_tol and max(dev_err) <= angle_tol
+    print("\n" + "="*40)
+    print("🔬 ONNX PARITY REPORT")
+    print("="*40)
+    print(f"Samples:                  {n}")
+    print(f"Max keypoint diff (px):   {max(kpt_err):.3f}  (mean {np.mean(kpt_err):.3f})")
+    print(f"Max score diff:           {max(score_err):.4f}")
+    print(f"Max HPA dev diff (°):     {max(dev_err):.3f}")
+    print(f"Avg latency torch / ORT:  {t_torch / n * 1000:.1f} ms / {t_ort / n * 1000:.1f} ms")
+    print(f"Result:                   {'✅ PASS' if passed else '❌ FAIL'}")
+    print("="*40 + "\n")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the hoof RTMPose model to ONNX and verify parity.")
+    parser.add_argument('--config', default=CONFIG)
+    parser.add_argument('--checkpoint', default=CHECKPOINT)
+    parser.add_argument('--out', default=OUT_PATH)
+    parser.add_argument('--opset', type=int, default=17)
+    parser.add_argument('--skip-export', action='store_true', help="Only run the parity check on an existing export")
+    parser.add_argument('--val-json', default=VAL_JSON)
+    parser.add_argument('--img-dir', default=IMG_DIR)
+    parser.add_argument('--kpt-tol', type=float, default=1.0, help="Max allowed keypoint difference in pixels")
+    parser.add_argument('--angle-tol', type=float, default=0.5, help="Max allowed HPA deviation difference in degrees")
+    args = parser.parse_args()
+
+    if not args.skip_export:
+        export(args.config, args.checkpoint, args.out, args.opset)
+
+    if os.path.exists(args.val_json):
+        ok = check_parity(args.config, args.checkpoint, args.out, args.val_json, args.img_dir, args.kpt_tol, args.angle_tol)
+        sys.exit(0 if ok else 1)
+    print(f"⚠️ Validation set not found ({args.val_json}) — skipping parity check.")
+
+
+if __name__ == '__main__':
+    main()
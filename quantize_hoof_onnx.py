@@ -0,0 +1,180 @@
+#class to build a static INT8 hoof model and promote it only if it passes the HPA accuracy gate
+
+import json
+import os
+import sys
+import argparse
+import cv2
+import numpy as np
+
+sys.path.append('mmpose')
+from onnxruntime.quantization import (
+    CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static,
+)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+from mmengine.config import Config
+from apis.hoof_backends import ORTBackend
+from evaluate_hpa_accuracy import build_result_row, summarize_accuracy
+
+CONFIG = 'mmpose/custom_configs/rtmpose_hoof_4kp_copy.py'
+FP32_ONNX = 'mmpose/work_dirs/rtmpose_hoof_manual_30_april/hoof_rtmpose.onnx'
+VAL_JSON = 'data/annotations/val_590_fixed.json'
+IMG_DIR = 'data/images/hq_consolidation_550'
+
+
+def int8_path(fp32_path):
+    return os.path.splitext(fp32_path)[0] + '_int8.onnx'
+
+
+def training_samples(config):
+    """(image_path, bbox_xyxy) pairs from the config's train_dataloader (paths are relative to mmpose/, like training)."""
+    cfg = Config.fromfile(config)
+    ds = cfg.train_dataloader.dataset
+    root = os.path.normpath(os.path.join('mmpose', ds.data_root))
+    with open(os.path.join(root, ds.ann_file), 'r') as f:
+        coco = json.load(f)
+    images = {img['id']: img for img in coco['images']}
+    samples = []
+    for ann in coco['annotations']:
+        img = images.get(ann['image_id'])
+        if img is None or not ann.get('num_keypoints'):
+            continue
+        bbox = np.array(ann['bbox'], dtype=np.float32)
+        bbox[2:] += bbox[:2]
+        samples.append((os.path.join(root, ds.data_prefix['img'], img['file_name']), bbox))
+    return samples
+
+
+class HoofCalibrationReader(CalibrationDataReader):
+    """Feeds training crops through the exact ORT preprocessing (affine + normalisation) used at serve time."""
+
+    def __init__(self, preprocessor, samples, batch_size=8):
+        self.preprocessor = preprocessor
+        self.samples = samples
+        self.batch_size = batch_size
+        self._iter = self._batches()
+
+    def _batches(self):
+        for start in range(0, len(self.samples), self.batch_size):
+            crops = []
+            for path, bbox in self.samples[start:start + self.batch_size]:
+                img = cv2.imread(path)
+                if img is None:
+                    continue
+                batch, _, _ = self.preprocessor.preprocess(img, bbox[None, :])
+                crops.append(batch)
+            if crops:
+                yield {self.preprocessor.input_name: np.concatenate(crops)}
+
+    def get_next(self):
+        return next(self._iter, None)
+
+    def rewind(self):
+        self._iter = self._batches()
+
+
+def evaluate(backend, val_json, img_dir):
+    """evaluate_hpa_accuracy metrics for one backend on the validation set."""
+    with open(val_json, 'r') as f:
+        data = json.load(f)
+    anns = {}
+    for a in data['annotations']:
+        anns.setdefault(a['image_id'], a)
+    results = []
+    for img_info in data['images']:
+        ann = anns.get(img_info['id'])
+        img = cv2.imread(os.path.join(img_dir, img_info['file_name']))
+        if ann is None or img is None:
+            continue
+        bbox = np.array(ann['bbox'], dtype=np.float32)
+        bbox[2:] += bbox[:2]
+        kpts, scores = backend.infer(img, bbox[None, :])
+        gt_kpts = np.array(ann['keypoints']).reshape(-1, 3)[:, :2]
+        results.append(build_result_row(img_info['file_name'], gt_kpts, kpts[0], scores[0]))
+    return summarize_accuracy(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static INT8 quantization of the hoof ONNX model with an accuracy gate.")
+    parser.add_argument('--config', default=CONFIG)
+    parser.add_argument('--fp32', default=FP32_ONNX, help="FP32 model exported by export_hoof_onnx.py")
+    parser.add_argument('--val-json', default=VAL_JSON)
+    parser.add_argument('--img-dir', default=IMG_DIR)
+    parser.add_argument('--max-calib', type=int, default=300, help="Max training crops used for calibration")
+    parser.add_argument('--calib-method', choices=['minmax', 'percentile', 'entropy'], default='percentile')
+    parser.add_argument('--max-accuracy-drop', type=float, default=1.0,
+                        help="Refuse the INT8 model if the error-under-3° rate drops by more than this many points")
+    args = parser.parse_args()
+
+    fp32 = ORTBackend(args.fp32)
+
+    samples = training_samples(args.config)
+    rng = np.random.default_rng(42)
+    if len(samples) > args.max_calib:
+        samples = [samples[i] for i in sorted(rng.choice(len(samples), args.max_calib, replace=False))]
+    print(f"📊 Calibrating on {len(samples)} training crops ({args.calib_method})...")
+
+    out_path = int8_path(args.fp32)
+    candidate = os.path.splitext(out_path)[0] + '.candidate.onnx'
+    prepped = os.path.splitext(args.fp32)[0] + '.prep.onnx'
+    quant_pre_process(args.fp32, prepped)
+    quantize_static(
+        prepped, candidate, HoofCalibrationReader(fp32, samples),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        calibrate_method={
+            'minmax': CalibrationMethod.MinMax,
+            'percentile': CalibrationMethod.Percentile,
+            'entropy': CalibrationMethod.Entropy,
+        }[args.calib_method],
+    )
+    os.remove(prepped)
+
+    # The candidate shares the FP32 preprocessing sidecar
+    with open(os.path.splitext(args.fp32)[0] + '.json', 'r') as f:
+        meta = json.load(f)
+    with open(os.path.splitext(candidate)[0] + '.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    print("🔬 Evaluating FP32 vs INT8 on the validation set...")
+    base = evaluate(fp32, args.val_json, args.img_dir)
+    quant = evaluate(ORTBackend(candidate), args.val_json, args.img_dir)
+    drop = base['accuracy_percent'] - quant['accuracy_percent']
+    promoted = drop <= args.max_accuracy_drop
+
+    print("\n" + "="*40)
+    print("📈 INT8 ACCURACY GATE")
+    print("="*40)
+    for key, label in (('avg_pastern_error', 'Avg Pastern Angle Error'),
+                       ('avg_hoof_error', 'Avg Hoof Angle Error'),
+                       ('avg_deviation_error', 'Avg Deviation Error')):
+        print(f"{label + ':':<26}{base[key]:.2f}° -> {quant[key]:.2f}°")
+    print(f"{'Success Rate (Error < 3°):':<26}{base['accuracy_percent']:.1f}% -> {quant['accuracy_percent']:.1f}% (drop {drop:.1f}, max {args.max_accuracy_drop})")
+    print(f"Result:                   {'✅ PROMOTED' if promoted else '❌ REFUSED'}")
+    print("="*40 + "\n")
+
+    if not promoted:
+        os.remove(candidate)
+        os.remove(os.path.splitext(candidate)[0] + '.json')
+        sys.exit(1)
+
+    # Promotion: the INT8 backend only loads models whose sidecar carries this record
+    meta["quantization"] = {
+        "promoted": True,
+        "calibration_samples": len(samples),
+        "calibration_method": args.calib_method,
+        "max_accuracy_drop": args.max_accuracy_drop,
+        "fp32": base,
+        "int8": quant,
+    }
+    os.replace(candidate, out_path)
+    os.remove(os.path.splitext(candidate)[0] + '.json')
+    with open(os.path.splitext(out_path)[0] + '.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+    print(f"💾 Promoted INT8 model to: {out_path}")
+
+
+if __name__ == '__main__':
+    main()
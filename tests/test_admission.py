@@ -0,0 +1,82 @@
+"""AdmissionController limits for sync scans and async jobs."""
+
+import asyncio
+import time
+
+import pytest
+
+from apis import admission
+from apis.admission import AdmissionController, Overloaded, admit_sync_scan, scan_legs
+from apis.executors import configure_executors, run_inference, shutdown_executors
+
+
+@pytest.fixture(autouse=True)
+def executors():
+    configure_executors(2)
+    yield
+    shutdown_executors()
+
+
+def admit(controller, legs):
+    async def main():
+        async with controller.sync_scan(legs):
+            return controller.inflight_legs
+
+    return asyncio.run(main())
+
+
+def predict():
+    time.sleep(0.02)
+
+
+def test_inflight_legs_limit_gives_429():
+    controller = AdmissionController(max_inflight_legs=4)
+    assert admit(controller, 6) == 6  # an idle server admits even an oversized scan
+
+    controller.inflight_legs = 3
+    with pytest.raises(Overloaded) as err:
+        admit(controller, 2)
+
+    assert err.value.status_code == 429 and err.value.headers == {"Retry-After": "1"}
+    assert controller.rejected["inflight"] == 1 and controller.inflight_legs == 3
+
+
+def test_inference_backlog_gives_503():
+    controller = AdmissionController(max_inflight_legs=1000, max_backlog_s=1.0)
+    assert admit(controller, 2) == 2  # no service time measured yet: no backlog estimate
+    asyncio.run(run_inference(predict))
+
+    controller.inflight_legs = 500  # ~500 x 20 ms / 2 threads of admitted work
+    with pytest.raises(Overloaded) as err:
+        admit(controller, 2)
+
+    assert err.value.status_code == 503 and int(err.value.headers["Retry-After"]) >= 2
+    assert controller.rejected["backlog"] == 1 and controller.admitted == 1
+
+
+def test_async_queue_budget():
+    controller = AdmissionController(max_async_backlog_s=60.0)
+    controller.check_async(None)
+    controller.check_async({"queued": 1000, "running": 2, "consumers": 2, "avg_service_s": None})
+    controller.check_async({"queued": 10, "running": 2, "consumers": 2, "avg_service_s": 10.0})
+
+    with pytest.raises(Overloaded) as err:
+        controller.check_async({"queued": 12, "running": 2, "consumers": 2, "avg_service_s": 10.0})
+
+    assert err.value.status_code == 429 and err.value.headers == {"Retry-After": "10"}
+
+
+def test_scan_legs_counts_processed_twins_once():
+    request = [("scanId", "s1"), ("frontLeft", "a.jpg"), ("frontLeftProcessed", "b.jpg"),
+               ("frontRight", "c.jpg"), ("hindLeft", None), ("hindRightProcessed", "d.jpg")]
+    assert scan_legs(request) == 3
+
+
+def test_admit_sync_scan_is_a_no_op_without_a_controller(monkeypatch):
+    monkeypatch.setattr(admission, "_controller", None)
+
+    async def main():
+        async with admit_sync_scan(10_000):
+            return True
+
+    assert asyncio.run(main())
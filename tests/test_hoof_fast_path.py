@@ -0,0 +1,65 @@
+"""
+MMPoseBackend fast path vs the stock inference_topdown pipeline on a synthetic image
+(the automated counterpart of check_hoof_fast_path.py). Needs torch / mmpose and the
+hoof checkpoint; skipped otherwise.
+"""
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from apis.logic import build_zone_bboxes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG = os.path.join(ROOT, 'mmpose/custom_configs/rtmpose_hoof_4kp_copy.py')
+CHECKPOINT = os.path.join(ROOT, 'mmpose/work_dirs/rtmpose_hoof_manual_30_april/epoch_130.pth')
+MODEL_RATIO = 0.50  # HPAPredictor.MODEL_RATIO
+
+pytest.importorskip("torch")
+pytest.importorskip("mmpose")
+if not (os.path.exists(CONFIG) and os.path.exists(CHECKPOINT)):
+    pytest.skip("hoof model weights not available", allow_module_level=True)
+
+
+@pytest.fixture(scope="module")
+def backends():
+    from apis.hoof_backends import MMPoseBackend
+    return (MMPoseBackend(CONFIG, CHECKPOINT, device='cpu'),
+            MMPoseBackend(CONFIG, CHECKPOINT, device='cpu', fast_path=True))
+
+
+@pytest.fixture(scope="module")
+def image():
+    # Smooth background plus a hoof-like dark wedge: enough structure for non-trivial heatmaps.
+    h, w = 480, 360
+    yy, xx = np.mgrid[0:h, 0:w]
+    img = np.dstack([(xx * 255 // w), (yy * 255 // h), np.full((h, w), 128)]).astype(np.uint8)
+    cv2.fillConvexPoly(img, np.array([[150, 250], [210, 250], [250, 430], [120, 430]]), (30, 30, 40))
+    cv2.line(img, (170, 120), (185, 250), (60, 50, 40), 18)
+    return img
+
+
+def test_fast_path_matches_inference_topdown(backends, image):
+    stock, fast = backends
+    bboxes = np.stack([b for _, b in build_zone_bboxes(image.shape[1], image.shape[0], MODEL_RATIO)])
+
+    k_s, s_s = stock.infer(image, bboxes)
+    k_f, s_f = fast.infer(image, bboxes)
+
+    assert k_f.shape == k_s.shape and s_f.shape == s_s.shape
+    np.testing.assert_allclose(k_f, k_s, atol=1.0)
+    np.testing.assert_allclose(s_f, s_s, atol=0.02)
+
+
+def test_fast_path_infer_many_matches_infer(backends, image):
+    _, fast = backends
+    bboxes = np.stack([b for _, b in build_zone_bboxes(image.shape[1], image.shape[0], MODEL_RATIO)])
+    flipped = np.ascontiguousarray(image[:, ::-1])
+
+    many = fast.infer_many([(image, bboxes[:4]), (flipped, bboxes[4:])])
+    for (img, boxes), (k, s) in zip([(image, bboxes[:4]), (flipped, bboxes[4:])], many):
+        k_ref, s_ref = fast.infer(img, boxes)
+        np.testing.assert_allclose(k, k_ref, atol=1e-3)
+        np.testing.assert_allclose(s, s_ref, atol=1e-4)
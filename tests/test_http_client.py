@@ -0,0 +1,61 @@
+"""SharedHTTPClient host slots and retries against an httpx mock transport."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from apis.http_client import SharedHTTPClient
+
+
+def client_for(handler, **kwargs):
+    client = SharedHTTPClient(http2=False, **kwargs)
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_idle_hosts_are_dropped_beyond_max_hosts():
+    async def main():
+        client = client_for(lambda req: httpx.Response(200, content=b"ok"), max_hosts=3)
+        for i in range(10):
+            assert await client.fetch_bytes(f"http://host{i}/img") == b"ok"
+        await client.fetch_bytes("http://host8/img")
+        await client.fetch_bytes("http://host10/img")
+        return list(client._host_slots)
+
+    assert asyncio.run(main()) == ["host9", "host8", "host10"]
+
+
+def test_busy_hosts_keep_their_slot():
+    async def main():
+        release = asyncio.Event()
+
+        async def handler(req):
+            if req.url.host == "slow":
+                await release.wait()
+            return httpx.Response(200, content=b"ok")
+
+        client = client_for(handler, max_hosts=1)
+        slow = asyncio.create_task(client.fetch_bytes("http://slow/img"))
+        await asyncio.sleep(0.01)
+        await client.fetch_bytes("http://fast/img")
+        hosts = list(client._host_slots)
+        release.set()
+        await slow
+        return hosts
+
+    assert asyncio.run(main()) == ["slow", "fast"]
+
+
+def test_backoff_does_not_hold_the_host_slot():
+    async def main():
+        client = client_for(lambda req: httpx.Response(503 if req.url.path == "/bad" else 200, content=b"ok"),
+                            per_host=1, retries=1, backoff=0.5)
+        bad = asyncio.create_task(client.fetch_bytes("http://h/bad"))
+        await asyncio.sleep(0.05)
+        good = await asyncio.wait_for(client.fetch_bytes("http://h/good"), timeout=0.25)
+        with pytest.raises(httpx.HTTPStatusError):
+            await bad
+        return good, client.retried
+
+    assert asyncio.run(main()) == (b"ok", 1)
@@ -0,0 +1,66 @@
+"""Header parsing and ROI proposals in apis/image_utils.py."""
+
+import cv2
+import numpy as np
+import pytest
+
+from apis.image_utils import propose_leg_bboxes, read_image_size, sniff_image_format
+
+
+def encode(ext, w, h, params=()):
+    img = np.random.default_rng(0).integers(0, 255, (h, w, 3), dtype=np.uint8)
+    ok, buf = cv2.imencode(ext, img, list(params))
+    assert ok
+    return buf.tobytes()
+
+
+@pytest.mark.parametrize("ext, fmt", [(".jpg", "jpeg"), (".png", "png"), (".webp", "webp")])
+def test_read_image_size_from_header(ext, fmt):
+    data = encode(ext, 321, 123)
+    assert sniff_image_format(data[:16]) == fmt
+    assert read_image_size(data) == (321, 123)
+
+
+def test_read_image_size_lossless_webp():
+    assert read_image_size(encode(".webp", 77, 55, (cv2.IMWRITE_WEBP_QUALITY, 101))) == (77, 55)
+
+
+def test_read_image_size_skips_jpeg_segments_before_the_frame_header():
+    data = encode(".jpg", 64, 48)
+    app1 = b"\xff\xe1" + (2 + 5000).to_bytes(2, "big") + b"\x00" * 5000  # large EXIF-like segment
+    assert read_image_size(data[:2] + app1 + data[2:]) == (64, 48)
+
+
+@pytest.mark.parametrize("data", [b"", b"not an image", b"\xff\xd8\xff\xe0\x00", b"\x89PNG\r\n\x1a\n"])
+def test_read_image_size_unknown_or_truncated(data):
+    assert read_image_size(data) is None
+
+
+def test_two_legs_give_one_box_each():
+    mask = np.zeros((400, 600), dtype=np.uint8)
+    mask[50:380, 100:200] = 1
+    mask[80:390, 380:470] = 1
+
+    boxes = propose_leg_bboxes(mask, model_ratio=0.5)
+
+    assert [label for label, _ in boxes] == ["ROI-Proposal (leg=0)", "ROI-Proposal (leg=1)"]
+    for _, (x1, y1, x2, y2) in boxes:
+        assert 0 <= x1 < x2 <= 600 and 0 <= y1 < y2 <= 400
+    centers = sorted((b[0] + b[2]) / 2 for _, b in boxes)
+    assert centers == pytest.approx([150, 425], abs=1)
+
+
+def test_one_leg_gives_full_and_lower_box():
+    mask = np.zeros((400, 600), dtype=np.uint8)
+    mask[40:360, 250:330] = 1
+
+    boxes = propose_leg_bboxes(mask, model_ratio=0.5)
+
+    assert [label for label, _ in boxes] == ["ROI-Proposal (full)", "ROI-Proposal (lower)"]
+    full, lower = (b for _, b in boxes)
+    assert lower[1] > full[1] and lower[3] == pytest.approx(full[3], abs=1)
+
+
+@pytest.mark.parametrize("fill", [0, 1])
+def test_no_proposal_without_a_cutout(fill):
+    assert propose_leg_bboxes(np.full((200, 300), fill, dtype=np.uint8)) == []
@@ -0,0 +1,101 @@
+"""SQLiteJobStore claim / lease / abandon and the webhook written by finish()."""
+
+import sqlite3
+import time
+
+import pytest
+
+from apis.v5.services.job_store import JobStore, SQLiteJobStore, build_job_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"), lease=0.2, max_attempts=2, retention=0.2)
+    yield store
+    store.close()
+
+
+def outbox_rows(store):
+    return store._conn.execute("SELECT job_id, url, status FROM webhook_outbox").fetchall()
+
+
+def test_job_store_is_an_interface(tmp_path):
+    with pytest.raises(TypeError):
+        JobStore()
+    assert isinstance(build_job_store(f"sqlite:///{tmp_path}/jobs.db"), SQLiteJobStore)
+    with pytest.raises(ValueError):
+        build_job_store("redis://localhost")
+
+
+def test_claims_are_fifo_and_exclusive(store):
+    for i in range(3):
+        store.enqueue(f"job{i}", f"scan{i}", {"scanId": f"scan{i}"}, uploads={"a": b"x"} if i == 1 else None)
+    store.heartbeat("job0", "w")  # not running yet: no-op
+
+    first, second = store.claim("w1"), store.claim("w2")
+
+    assert (first["job_id"], first["attempts"], first["abandoned"], first["uploads"]) == ("job0", 1, False, None)
+    assert (second["job_id"], second["uploads"]) == ("job1", {"a": b"x"})
+    assert store.get("job2")["position"] == 0
+    assert store.stats()["running"] == 2
+
+
+def test_expired_lease_is_reclaimed_then_abandoned(store):
+    store.enqueue("job", "scan", {"scanId": "scan"}, uploads={"a": b"x"})
+
+    assert store.claim("w1")["attempts"] == 1
+    assert store.claim("w2") is None  # lease still held
+    time.sleep(0.25)
+    retry = store.claim("w2")
+    time.sleep(0.25)
+    abandoned = store.claim("w3")
+
+    assert (retry["attempts"], retry["abandoned"], retry["uploads"]) == (2, False, {"a": b"x"})
+    assert (abandoned["attempts"], abandoned["abandoned"], abandoned["uploads"]) == (3, True, None)
+
+
+def test_heartbeat_keeps_the_lease(store):
+    store.enqueue("job", "scan", {})
+    store.claim("w1")
+    for _ in range(3):
+        time.sleep(0.1)
+        store.heartbeat("job", "w1")
+        assert store.claim("w2") is None
+
+
+def test_release_does_not_count_the_attempt(store):
+    store.enqueue("job", "scan", {})
+    store.claim("w1")
+
+    assert store.release("w1") == 1
+    assert store.get("job")["status"] == "queued"
+    assert store.claim("w2")["attempts"] == 1
+
+
+def test_finish_writes_the_webhook_atomically(store, monkeypatch):
+    store.enqueue("ok", "scan", {}, uploads={"a": b"x"})
+    store.enqueue("bad", "scan", {})
+    store.claim("w")
+    store.claim("w")
+
+    store.finish("ok", "done", result={"hpa": 1}, webhook=("http://hook/a", {"jobId": "ok"}))
+    monkeypatch.setattr("apis.v5.services.job_store.insert_webhook",
+                        lambda *a: (_ for _ in ()).throw(sqlite3.OperationalError("disk I/O error")))
+    with pytest.raises(sqlite3.OperationalError):
+        store.finish("bad", "failed", error="boom", webhook=("http://hook/a", {"jobId": "bad"}))
+
+    assert [tuple(r) for r in outbox_rows(store)] == [("ok", "http://hook/a", "pending")]
+    assert store.get("ok")["status"] == "done" and store.get("ok")["result"] == {"hpa": 1}
+    assert store.get("bad")["status"] == "running"
+    assert store._conn.execute("SELECT COUNT(*) FROM job_uploads").fetchone()[0] == 0
+
+
+def test_prune_drops_finished_jobs_only(store):
+    store.enqueue("done", "scan", {})
+    store.enqueue("queued", "scan", {})
+    store.claim("w")
+    store.finish("done", "done")
+    time.sleep(0.25)
+
+    assert store.prune() == 1
+    assert store.get("done") is None and store.get("queued")["status"] == "queued"
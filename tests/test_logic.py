@@ -0,0 +1,119 @@
+"""HPAPredictor scan logic with a synthetic hoof backend (no model weights needed)."""
+
+import cv2
+import numpy as np
+import pytest
+
+from apis.logic import HPAPredictor, is_anatomically_valid
+
+# Keypoints as fractions of the analysed image: ~25 px segments on a 1600x1200 photo,
+# which a 1/8 decode shrinks below the anatomy check's 10 px thresholds.
+POSE = np.array([[0.500, 0.500], [0.505, 0.520], [0.510, 0.530], [0.520, 0.545]], dtype=np.float32)
+
+
+class PoseBackend:
+    """Predicts POSE on every crop; keypoints outside the crop score low, as a real model would."""
+    name = "synthetic"
+
+    def __init__(self):
+        self.calls = []
+
+    def infer(self, img, bboxes):
+        self.calls.append(len(bboxes))
+        h, w = img.shape[:2]
+        kpts = np.repeat((POSE * [w, h])[None], len(bboxes), axis=0).astype(np.float32)
+        inside = ((kpts[..., 0] >= bboxes[:, None, 0]) & (kpts[..., 0] <= bboxes[:, None, 2])
+                  & (kpts[..., 1] >= bboxes[:, None, 1]) & (kpts[..., 1] <= bboxes[:, None, 3]))
+        offset = np.linspace(0.0, 0.01, len(bboxes), dtype=np.float32)[:, None]
+        return kpts, np.where(inside, 0.9, 0.3).astype(np.float32) - offset
+
+
+@pytest.fixture(scope="module")
+def photo():
+    img = np.full((1200, 1600, 3), 90, dtype=np.uint8)
+    cv2.rectangle(img, (700, 500), (900, 700), (40, 60, 200), -1)
+    ok, buf = cv2.imencode(".jpg", img)
+    return buf.tobytes()
+
+
+def predictor(**kwargs):
+    return HPAPredictor(None, None, backend=PoseBackend(), **kwargs)
+
+
+def test_anatomy_check_uses_full_resolution_pixels():
+    kpts = POSE * [200, 150]  # the 1/8 decode of 1600x1200
+    assert is_anatomically_valid(kpts)[0] is False
+    assert is_anatomically_valid(kpts, scale=(8.0, 8.0)) == is_anatomically_valid(POSE * [1600, 1200])
+
+
+@pytest.mark.parametrize("strategy", ["zone_scan", "coarse_to_fine"])
+def test_reduced_decode_matches_full_decode(photo, strategy):
+    full = predictor(strategy=strategy).predict(photo, remove_bg=False)
+    reduced = predictor(strategy=strategy, decode_max_dim=200).predict(photo, remove_bg=False)
+
+    assert full.success and full.reason == "OK"
+    assert reduced.image_size == full.image_size == (1600, 1200)
+    assert (reduced.success, reduced.reason, reduced.best_zone, reduced.inference_pass) == \
+           (full.success, full.reason, full.best_zone, full.inference_pass)
+    np.testing.assert_allclose(reduced.keypoints, full.keypoints, atol=1e-3)
+    assert reduced.hpa_dev == full.hpa_dev
+
+
+class BoxBackend:
+    """Keypoints and scores are a fixed function of each bbox, whatever batch it arrives in."""
+    name = "synthetic"
+
+    def __init__(self):
+        self.calls = []
+
+    def infer(self, img, bboxes):
+        bboxes = np.asarray(bboxes, dtype=np.float32)
+        self.calls.append(len(bboxes))
+        x1, y1, x2, y2 = (bboxes[:, i:i + 1] for i in range(4))
+        w, h = x2 - x1, y2 - y1
+        kpts = np.stack([np.hstack([x1 + w * fx, y1 + h * fy])
+                         for fx, fy in ((0.40, 0.20), (0.45, 0.45), (0.50, 0.55), (0.60, 0.85))], axis=1)
+        scores = 0.5 + 0.4 * np.abs(np.sin(np.stack([x1[:, 0] * 0.013 + y1[:, 0] * 0.007 + k for k in range(4)], 1)))
+        return kpts.astype(np.float32), scores.astype(np.float32)
+
+
+def sequential_zone_scan(backend, img, crops):
+    """The pre-batching scan: one forward pass per crop, strict > keeps the earlier crop on ties."""
+    from apis.logic import candidate_score
+    best = None
+    for label, bbox in crops:
+        kpts, scores = backend.infer(img, bbox[None])
+        is_sane, reason = is_anatomically_valid(kpts[0])
+        agg = candidate_score(scores[0], is_sane)
+        if best is None or agg > best[0]:
+            best = (agg, kpts[0], scores[0], label, reason)
+    return best
+
+
+@pytest.mark.parametrize("zone_batch_size", [None, 4])
+def test_batched_zone_scan_matches_sequential_loop(zone_batch_size):
+    from apis.logic import build_zone_bboxes
+    img = np.zeros((900, 700, 3), dtype=np.uint8)
+    pred = HPAPredictor(None, None, backend=BoxBackend(), zone_batch_size=zone_batch_size)
+    crops = build_zone_bboxes(img.shape[1], img.shape[0], pred.MODEL_RATIO)
+
+    batched = pred._zone_scan(img, crops)
+    reference = sequential_zone_scan(BoxBackend(), img, crops)
+
+    n = len(crops)
+    assert pred.backend.calls == ([n] if zone_batch_size is None else [4] * (n // 4) + [n % 4] * bool(n % 4))
+    assert batched[3] == reference[3] and batched[4] == reference[4]
+    assert batched[0] == pytest.approx(reference[0])
+    np.testing.assert_allclose(batched[1], reference[1])
+    np.testing.assert_allclose(batched[2], reference[2])
+
+
+def test_zone_scan_ties_go_to_the_earlier_crop():
+    from apis.logic import build_zone_bboxes
+    img = np.zeros((1200, 1600, 3), dtype=np.uint8)
+    pred = predictor()
+    crops = build_zone_bboxes(img.shape[1], img.shape[0], pred.MODEL_RATIO)
+    pred.backend.infer = lambda img, bboxes: (np.repeat((POSE * [1600, 1200])[None], len(bboxes), 0),
+                                              np.full((len(bboxes), 4), 0.8, dtype=np.float32))
+
+    assert pred._zone_scan(img, crops)[3] == crops[0][0]
@@ -0,0 +1,123 @@
+"""MicroBatchScheduler batching, splitting and shutdown with a recording backend."""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from apis.micro_batch import MicroBatchScheduler
+
+
+class RecordingBackend:
+    """Keypoint x = image id, y = bbox x1, so every caller can check it got its own crops back."""
+    name = "recording"
+
+    def __init__(self, delay=0.0, fail=False):
+        self.batches = []
+        self.delay = delay
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    def infer(self, img, bboxes):
+        return self.infer_many([(img, bboxes)])[0]
+
+    def infer_many(self, items):
+        with self._lock:
+            self.batches.append(sum(len(b) for _, b in items))
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("backend down")
+        out = []
+        for img, bboxes in items:
+            n = len(bboxes)
+            kpts = np.zeros((n, 4, 2), dtype=np.float32)
+            kpts[..., 0] = img[0, 0, 0]
+            kpts[..., 1] = np.asarray(bboxes)[:, None, 0]
+            out.append((kpts, np.full((n, 4), 0.9, dtype=np.float32)))
+        return out
+
+
+def image(i):
+    return np.full((4, 4, 3), i, dtype=np.uint8)
+
+
+def boxes(n, start=0):
+    return np.array([[start + k, 0, start + k + 10, 10] for k in range(n)], dtype=np.float32)
+
+
+def run_concurrently(scheduler, calls):
+    results = [None] * len(calls)
+
+    def call(i, img, bboxes):
+        results[i] = scheduler.infer(img, bboxes)
+
+    threads = [threading.Thread(target=call, args=(i, *c)) for i, c in enumerate(calls)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+    return results
+
+
+def test_concurrent_calls_share_batches_and_get_their_own_results():
+    backend = RecordingBackend(delay=0.01)
+    scheduler = MicroBatchScheduler(backend, max_batch=8, max_delay_ms=20)
+    calls = [(image(i), boxes(3, start=10 * i)) for i in range(6)]
+
+    results = run_concurrently(scheduler, calls)
+    scheduler.close()
+
+    for (img, bboxes), (kpts, scores) in zip(calls, results):
+        assert kpts.shape == (3, 4, 2) and scores.shape == (3, 4)
+        assert (kpts[..., 0] == img[0, 0, 0]).all()
+        np.testing.assert_array_equal(kpts[:, 0, 1], bboxes[:, 0])
+    assert sum(backend.batches) == 18
+    assert max(backend.batches) <= 8
+    assert len(backend.batches) < 6  # at least some calls were batched together
+    stats = scheduler.stats()
+    assert stats["crops"] == 18 and stats["max_batch_crops"] <= 8
+
+
+def test_calls_larger_than_max_batch_are_split():
+    backend = RecordingBackend()
+    scheduler = MicroBatchScheduler(backend, max_batch=4, max_delay_ms=1)
+
+    kpts, scores = scheduler.infer(image(7), boxes(10))
+    scheduler.close()
+
+    assert backend.batches == [4, 4, 2]
+    np.testing.assert_array_equal(kpts[:, 0, 1], np.arange(10))
+    assert scores.shape == (10, 4)
+
+
+def test_backend_errors_reach_every_caller_in_the_batch():
+    scheduler = MicroBatchScheduler(RecordingBackend(fail=True), max_batch=8, max_delay_ms=1)
+    with pytest.raises(RuntimeError, match="backend down"):
+        scheduler.infer(image(1), boxes(2))
+    scheduler.close()
+
+
+def test_close_fails_waiting_calls_and_later_calls():
+    backend = RecordingBackend(delay=0.2)
+    scheduler = MicroBatchScheduler(backend, max_batch=1, max_delay_ms=0)
+    errors = []
+
+    def call(i):
+        try:
+            scheduler.infer(image(i), boxes(1))
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)  # the first call is in the backend, the rest are queued
+    scheduler.close()
+    for t in threads:
+        t.join(timeout=5)
+
+    assert errors and all(e == "MicroBatchScheduler is closed" for e in errors)
+    assert len(backend.batches) + len(errors) == 4
+    with pytest.raises(RuntimeError, match="closed"):
+        scheduler.infer(image(9), boxes(1))
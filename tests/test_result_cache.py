@@ -0,0 +1,97 @@
+"""ResultCache disk tier and CachedPredictor."""
+
+import os
+import threading
+import time
+
+from apis.result_cache import CachedPredictor, ResultCache, uncached
+
+
+def _join_pruner():
+    for t in threading.enumerate():
+        if t.name == "result-cache-prune":
+            t.join(timeout=5)
+
+
+def test_disk_store_is_per_version_and_drops_stale_versions(tmp_path):
+    old = ResultCache(disk_dir=str(tmp_path), version="0123456789abcdef")
+    old.put(old.key("predict", b"img"), {"a": 1})
+    (tmp_path / "ab").mkdir()  # flat layout of older releases
+    (tmp_path / "notes").mkdir()  # not the cache's
+
+    new = ResultCache(disk_dir=str(tmp_path), version="fedcba9876543210")
+
+    assert sorted(os.listdir(tmp_path)) == ["fedcba9876543210", "notes"]
+    assert new.get(new.key("predict", b"img")) is None
+    assert new.stats()["disk_bytes"] == 0
+
+
+def test_disk_store_is_pruned_least_recently_used_first(tmp_path):
+    cache = ResultCache(max_bytes=0, disk_dir=str(tmp_path), version="0123456789abcdef", disk_max_bytes=2000)
+    keys = [cache.key("predict", i) for i in range(12)]
+    for i, key in enumerate(keys[:10]):
+        cache.put(key, {"pad": "x" * 180})
+        os.utime(cache._disk_path(key), (time.time() - 100 + i,) * 2)
+    assert cache.get(keys[0]) is not None  # a hit refreshes the entry's mtime
+
+    for key in keys[10:]:
+        cache.put(key, {"pad": "x" * 180})
+        _join_pruner()
+
+    stats = cache.stats()
+    assert stats["disk_bytes"] <= 2000
+    assert stats["disk_pruned"] == 2
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[11]) is not None
+    assert cache.get(keys[1]) is None
+
+
+def test_uncached_unwraps_cached_predictor():
+    inner = object()
+    assert uncached(CachedPredictor(inner, ResultCache())) is inner
+    assert uncached(inner) is inner
+
+
+def test_keys_cover_version_namespace_and_part_boundaries():
+    cache = ResultCache(version="v1")
+
+    assert cache.key("predict", b"ab", b"c") != cache.key("predict", b"a", b"bc")
+    assert cache.key("predict", b"img") != cache.key("frontal", b"img")
+    assert cache.key("predict", b"img") != ResultCache(version="v2").key("predict", b"img")
+    assert cache.key("predict", True, None, b"img") == cache.key("predict", True, None, bytearray(b"img"))
+
+
+def test_memory_tier_evicts_least_recently_used_by_size():
+    entry = {"pad": "x" * 40}  # 51 bytes encoded
+    cache = ResultCache(max_bytes=160)
+    for name in "abc":
+        cache.put(name, entry)
+    assert cache.get("a") == entry  # a is now the most recently used
+
+    cache.put("d", entry)
+
+    assert cache.get("b") is None
+    assert all(cache.get(k) == entry for k in "acd")
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"]) == (3, 153)
+    assert (stats["hits"], stats["misses"]) == (4, 1)
+
+
+def test_oversized_entries_are_not_kept_in_memory():
+    cache = ResultCache(max_bytes=10)
+    cache.put("big", {"pad": "x" * 100})
+    assert cache.get("big") is None and cache.stats()["bytes"] == 0
+
+
+def test_get_or_compute_caches_only_accepted_values():
+    cache = ResultCache()
+    calls = []
+
+    def compute(value):
+        calls.append(value)
+        return value
+
+    assert cache.get_or_compute("k", lambda: compute({"success": False}), lambda v: v["success"]) == {"success": False}
+    assert cache.get_or_compute("k", lambda: compute({"success": True}), lambda v: v["success"]) == {"success": True}
+    assert cache.get_or_compute("k", lambda: compute({"success": None}), lambda v: v["success"]) == {"success": True}
+    assert len(calls) == 2
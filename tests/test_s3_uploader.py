@@ -0,0 +1,63 @@
+"""S3Uploader against moto's in-memory S3 (the client= injection point)."""
+
+import boto3
+import pytest
+
+moto = pytest.importorskip("moto")
+
+from apis.s3_uploader import MB, S3Uploader
+
+BUCKET = "hpa-test"
+
+
+@pytest.fixture
+def s3():
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def uploader(s3):
+    up = S3Uploader(bucket=BUCKET, client=s3, multipart_threshold=5 * MB, part_size=5 * MB, part_concurrency=2)
+    yield up
+    up.close()
+
+
+def test_single_put(s3, uploader):
+    key = uploader.upload(b"\xff\xd8small-jpeg", file_extension="jpg", folder="lateral_overlays")
+
+    assert key.startswith("lateral_overlays/lateral_") and key.endswith(".jpg")
+    obj = s3.get_object(Bucket=BUCKET, Key=key)
+    assert obj["Body"].read() == b"\xff\xd8small-jpeg"
+    assert obj["ContentType"] == "image/jpg"
+    assert "-" not in obj["ETag"]  # single PUT, not a multipart ETag
+    stats = uploader.stats()
+    assert (stats["uploads"], stats["multipart"], stats["failed"]) == (1, 0, 0)
+
+
+def test_multipart_upload(s3, uploader):
+    data = bytes(range(256)) * (11 * MB // 256)
+
+    key = uploader.upload(data, file_extension="png")
+
+    obj = s3.get_object(Bucket=BUCKET, Key=key)
+    assert obj["Body"].read() == data
+    assert obj["ETag"].strip('"').endswith("-3")  # 5 MB + 5 MB + 1 MB parts
+    stats = uploader.stats()
+    assert (stats["uploads"], stats["multipart"], stats["bytes"]) == (1, 1, len(data))
+    assert stats["avg_ms"] is not None
+
+
+@pytest.mark.parametrize("size", [10, 6 * MB])
+def test_failure_is_counted(s3, size):
+    up = S3Uploader(bucket="missing-bucket", client=s3, multipart_threshold=5 * MB, part_size=5 * MB)
+    try:
+        assert up.upload(b"x" * size, file_extension="jpg") == ""
+    finally:
+        up.close()
+
+    stats = up.stats()
+    assert (stats["uploads"], stats["failed"]) == (0, 1)
+    assert stats["last_error"] == "NoSuchBucket"
@@ -0,0 +1,81 @@
+"""WebhookOutbox backoff, retries and dead letters against an httpx mock transport."""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from apis.v5.services.job_store import SQLiteJobStore
+from apis.v5.services.webhook_outbox import WebhookOutbox
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.delenv("WEBHOOK_AUTH_TOKEN", raising=False)
+    monkeypatch.setattr("apis.v5.services.webhook_outbox.load_dotenv", lambda **kwargs: None)
+    path = str(tmp_path / "jobs.db")
+    store = SQLiteJobStore(path)
+    store.enqueue("job", "scan", {})
+    store.claim("w")
+    store.finish("job", "done", webhook=("http://hook/scan", {"jobId": "job"}))
+    store.close()
+    return path
+
+
+def deliver_once(outbox, status):
+    """Claims the due row and delivers it to a mock endpoint answering `status`."""
+    async def main():
+        outbox._client = httpx.AsyncClient(transport=httpx.MockTransport(lambda req: httpx.Response(status)))
+        row = await asyncio.to_thread(outbox._claim)
+        await outbox._deliver(row)
+        await outbox._client.aclose()
+        return row
+
+    return asyncio.run(main())
+
+
+def make_due(outbox):
+    with outbox._lock:
+        outbox._conn.execute("UPDATE webhook_outbox SET next_attempt_at = 0")
+
+
+def test_backoff_is_full_jitter_under_the_cap():
+    outbox = WebhookOutbox.__new__(WebhookOutbox)
+    outbox.base_delay, outbox.max_delay = 2.0, 30.0
+    for attempts, cap in ((0, 2.0), (1, 4.0), (3, 16.0), (10, 30.0)):
+        delays = [outbox._backoff(attempts) for _ in range(200)]
+        assert 0 <= min(delays) and max(delays) <= cap
+        assert max(delays) > cap / 2
+
+
+def test_failures_back_off_then_park_as_dead_letter(db):
+    outbox = WebhookOutbox(db, max_attempts=2, base_delay=60.0, max_delay=60.0)
+
+    row = deliver_once(outbox, 503)
+    status = outbox.job_status("job")
+    assert (row["attempts"], status["status"], status["last_error"]) == (1, "pending", "HTTP 503")
+    assert outbox._claim() is None  # not due yet (backoff)
+
+    make_due(outbox)
+    deliver_once(outbox, 500)
+
+    assert outbox.job_status("job")["status"] == "dead"
+    assert [(d["job_id"], d["attempts"]) for d in outbox.dead_letters()] == [("job", 2)]
+    assert (outbox.retried, outbox.dead) == (1, 1)
+    assert outbox._claim() is None
+
+
+def test_replayed_dead_letter_is_delivered_and_pruned(db):
+    outbox = WebhookOutbox(db, max_attempts=1, retention=0.0)
+    deliver_once(outbox, 404)
+    assert outbox.stats()["dead"] == 1
+
+    assert outbox.replay() == 1
+    row = deliver_once(outbox, 200)
+
+    assert row["attempts"] == 1
+    assert outbox.job_status("job")["status"] == "delivered" and outbox.dead_letters() == []
+    time.sleep(0.01)
+    assert outbox.prune() == 1
+    assert outbox.job_status("job") is None